@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'userauth.apps.UserauthConfig',
     'profile_management.apps.ProfileManagementConfig',
     'content_management.apps.ContentManagementConfig',
@@ -181,4 +182,70 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #Authentication Settings
 LOGIN_URL = '/' #Points to sign_in view
 LOGIN_REDIRECT_URL = '/complete_profile/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+#Social Media Sync Settings
+SOCIAL_SYNC_INTERVAL = 30 * 60 #Seconds before a linked account's platform data is refreshed
+SOCIAL_SYNC_WORKERS = 2 #Background threads used by profile_management.sync
+SOCIAL_PLATFORM_TIMEOUTS = {'instagram': 10, 'facebook': 15} #Per-platform API timeouts in seconds
+SOCIAL_SYNC_MAX_PAGES = 10 #Maximum paging.next cursors followed per account and sync
+SOCIAL_SYNC_MAX_ITEMS = 500 #Maximum items cached in SocialMediaAccount.data
+
+
+#Cache Settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'slid-default',
+    }
+}
+PROFILE_CACHE_ALIAS = 'default' #Point at a shared backend (e.g. Redis) when running several processes
+PROFILE_CACHE_TIMEOUT = 300 #Seconds a cached profile section or fragment is kept
+POSTS_PAGE_SIZE = 20 #Posts per page of the cursor paginated profile feed
+GRAPH_CACHE_TIMEOUT = 60 * 60 #Seconds a user's cached connection adjacency is kept, it is updated in place on connect and disconnect
+GRAPH_MAX_FANOUT = 500 #Most connections whose own connections are read for people you may know suggestions
+PROFILE_RESCORE_BATCH_SIZE = 1000 #Profiles recomputed per bulk_update by manage.py rescore_profiles
+CONNECTION_BULK_BATCH_SIZE = 1000 #Users connected or disconnected per upsert statement by the bulk connection endpoint
+FEED_MAX_LENGTH = 500 #Newest posts kept in each user's materialized home feed, older pages are read from the database
+FEED_FANOUT_LIMIT = 1000 #Authors with more followers are not pushed into feeds, their posts are merged in when feeds are read
+FEED_CACHE_TIMEOUT = 24 * 60 * 60 #Seconds a materialized feed is kept before it is rebuilt from the database
+
+
+#Upload Settings
+UPLOAD_TEMP_DIR = None #Directory for partial chunked uploads shared by all web servers, defaults to the system temp dir
+UPLOAD_MAX_SIZE = 2 * 1024 ** 3 #Largest image or video accepted by the chunked upload API, in bytes
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 ** 2 #Largest single chunk, in bytes
+UPLOAD_SESSION_EXPIRY = 24 * 60 * 60 #Seconds an idle upload can still be resumed before it is purged
+
+#Soft Deletion Settings
+SOFT_DELETE_RETENTION = 30 * 24 * 60 * 60 #Seconds deleted posts, connections and profiles are kept before purge_deleted removes them
+SOFT_DELETE_PURGE_BATCH_SIZE = 1000 #Rows hard-deleted per transaction by purge_deleted
+
+#Bulk Import Settings
+BULK_IMPORT_BATCH_SIZE = 500 #Posts inserted per bulk_create when importing NDJSON
+BULK_IMPORT_MAX_ERRORS = 100 #Rejected records reported with their errors per import, the rest are only counted
+BULK_EXPORT_CHUNK_SIZE = 2000 #Posts fetched per server-side cursor round trip when exporting NDJSON
+
+#Media Storage Settings
+MEDIA_BLOB_GRACE_PERIOD = 24 * 60 * 60 #Seconds a stored media file nothing refers to is kept before it is purged
+
+#Media Processing Settings
+MEDIA_PROCESSING_WORKERS = 1 #Background threads generating post media variants
+MEDIA_VARIANT_WIDTHS = [160, 480, 1080] #Widths of the resized variants generated for post images and video posters
+MEDIA_VARIANT_QUALITY = 80 #WebP and JPEG quality of the variants
+
+
+#AI Assistant Settings
+AI_MODEL = 'gpt-3.5-turbo' #Chat model used by the SQL agent
+AI_REQUEST_TIMEOUT = 30 #Seconds before an OpenAI request is abandoned
+AI_DATABASE_POOL_SIZE = 5 #Connections kept open by the agent's SQLAlchemy engine, point AI_DATABASE_URL at a read-only role in production
+AI_SAMPLE_ROWS = 0 #Sample rows included in the table descriptions sent to the model
+AI_SQL_STATEMENT_TIMEOUT = 5000 #Milliseconds a query generated by the agent may run
+AI_SQL_MAX_ROWS = 100 #Rows returned to the agent per query
+AI_SQL_MAX_COST = 10000 #Highest PostgreSQL planner cost accepted for an agent query
+AI_CACHE_TIMEOUT = 600 #Seconds a cached AI answer is kept, answers are also dropped when the user's data changes
+AI_CACHE_SIMILARITY_THRESHOLD = None #Cosine similarity (e.g. 0.92) for reusing answers to rephrased questions, None disables embeddings
+AI_CACHE_MAX_ENTRIES = 1000 #Question embeddings kept in the in-process similarity index
+AI_EMBEDDING_MODEL = 'text-embedding-3-small' #Embedding model used by the similarity index
+AI_CONTEXT_TIMEOUT = 60 * 60 #Seconds a section of a user's precomputed AI context is kept
+AI_CONTEXT_TOKEN_BUDGET = 300 #Approximate prompt tokens spent on the user's context
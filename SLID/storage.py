@@ -0,0 +1,67 @@
+"""
+Content-addressed media storage.
+Uploads are stored once under the SHA-256 digest of their content, so a file
+uploaded again (a repost, a re-submitted form) resolves to the blob already on
+disk instead of another copy. A blob's content never changes under its name,
+which lets its URL be cached forever by browsers and CDNs.
+
+Blobs are shared between rows, so they must never be deleted through a model's
+file field. Their reference counts are kept by content_management.blobs, which
+also purges blobs nothing refers to anymore.
+"""
+
+from pathlib import PurePosixPath
+import hashlib
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.views.static import serve
+
+BLOB_PREFIX = 'blobs/'
+
+# Blob URLs change whenever their content does, so they never need revalidating
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def file_digest(content):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage saving every file as blobs/<ab>/<cd>/<sha256><extension>"""
+
+    def blob_name(self, digest, name):
+        # Keep the extension so the file is served with the right content type
+        extension = PurePosixPath(name or '').suffix.lower()
+        if not extension[1:].isalnum() or len(extension) > 10:
+            extension = ''
+        return f"{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.blob_name(file_digest(content), name)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def serve_blob(request, path):
+    """Development server view for blobs, sending the headers the web server sends in production"""
+    response = serve(request, BLOB_PREFIX + path, document_root=content_storage.location)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -15,9 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from SLID.storage import BLOB_PREFIX, serve_blob
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,4 +28,7 @@ urlpatterns = [
     path('oauth/', include('oauth_integration.urls')),
 ]
 
+if settings.DEBUG:
+    # Blobs are served with immutable cache headers, before the plain media files
+    urlpatterns.append(re_path(rf"^{settings.MEDIA_URL.lstrip('/')}{BLOB_PREFIX}(?P<path>.*)$", serve_blob))
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
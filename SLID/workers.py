@@ -0,0 +1,73 @@
+"""
+Lightweight in-process background queues for the SLID project.
+Work items are keys (usually primary keys) handed to a handler function
+on daemon threads, so request handlers can defer slow work without
+blocking the response.
+"""
+
+import logging
+import queue
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue:
+    """
+    Deduplicating work queue drained by a pool of daemon threads.
+    A key that is already waiting in the queue is not queued twice.
+    """
+
+    def __init__(self, handler, name, workers=1, maxsize=1000):
+        self.handler = handler
+        self.name = name
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def put(self, key):
+        """Queue a key for processing. Returns False if it was already queued or the queue is full."""
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                logger.warning(f"Queue {self.name} is full, dropping {key}.")
+                return False
+            self._pending.add(key)
+            self._start_workers()
+        return True
+
+    def join(self):
+        """Block until every queued key has been processed."""
+        self._queue.join()
+
+    def _start_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._run,
+                name=f"{self.name}-{len(self._threads)}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            with self._lock:
+                self._pending.discard(key)
+            close_old_connections()
+            try:
+                self.handler(key)
+            except Exception as e:
+                logger.error(f"Queue {self.name} failed to process {key}: {e}")
+            finally:
+                close_old_connections()
+                self._queue.task_done()
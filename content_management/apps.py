@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ContentManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'content_management'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,111 @@
+"""
+Reference counting of content-addressed media blobs.
+Every post and profile picture referring to a blob holds one reference, taken
+and released by signal handlers in the same transaction as the row's change.
+Blobs without references are kept for MEDIA_BLOB_GRACE_PERIOD, so an upload
+still on its way to being saved is not lost, and then removed by
+``manage.py purge_media_blobs``.
+"""
+
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DEFERRED, F
+from django.utils import timezone
+
+from SLID.storage import BLOB_PREFIX, content_storage, is_blob
+from userauth.models import Post, StoredBlob, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# File fields of each model whose files are stored as blobs
+BLOB_FIELDS = {
+    Post: ('media_file',),
+    UserProfile: ('profilePicture',),
+}
+
+
+def get_grace_period():
+    return timedelta(seconds=getattr(settings, 'MEDIA_BLOB_GRACE_PERIOD', 24 * 60 * 60))
+
+
+def stored_name(instance, field):
+    """Name of the file a loaded field refers to, None when empty or DEFERRED when not loaded"""
+    value = instance.__dict__.get(field, DEFERRED)
+    return getattr(value, 'name', value) or None
+
+
+def retain(name):
+    if not is_blob(name):
+        return
+    blob, created = StoredBlob.objects.get_or_create(
+        name=name, defaults={'ref_count': 1, 'size': lambda: content_storage.size(name)}
+    )
+    if not created:
+        StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release(name):
+    if not is_blob(name):
+        return
+    StoredBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def discard(name):
+    """Delete a blob saved for a row that was never created, unless another row refers to it"""
+    if is_blob(name) and not StoredBlob.objects.filter(name=name).exists():
+        content_storage.delete(name)
+
+
+def rebuild_blob_refs():
+    """Recount every blob's references from the rows using it. Returns the number of blobs counted."""
+    counts = {}
+    for model, fields in BLOB_FIELDS.items():
+        for field in fields:
+            # Soft deleted rows keep their references until they are purged
+            for name in model.all_objects.filter(**{f"{field}__startswith": BLOB_PREFIX}).values_list(field, flat=True).iterator():
+                counts[name] = counts.get(name, 0) + 1
+
+    with transaction.atomic():
+        StoredBlob.objects.exclude(name__in=counts).update(ref_count=0, updated_at=timezone.now())
+        for name, count in counts.items():
+            if not content_storage.exists(name):
+                logger.warning(f"Blob {name} is referenced {count} time(s) but missing from storage.")
+                continue
+            StoredBlob.objects.update_or_create(
+                name=name, defaults={'ref_count': count, 'size': content_storage.size(name)}
+            )
+    return len(counts)
+
+
+def blob_files(directory=BLOB_PREFIX.rstrip('/')):
+    """Names of all files below the blob prefix"""
+    directories, files = content_storage.listdir(directory)
+    for file in files:
+        yield f"{directory}/{file}"
+    for subdirectory in directories:
+        yield from blob_files(f"{directory}/{subdirectory}")
+
+
+def purge_blobs(now=None):
+    """Delete blobs that have been unreferenced for the grace period. Returns the number deleted."""
+    cutoff = (now or timezone.now()) - get_grace_period()
+    deleted = 0
+    unreferenced = StoredBlob.objects.filter(ref_count=0, updated_at__lt=cutoff)
+    for name in unreferenced.values_list('name', flat=True).iterator():
+        # Only delete the file if no reference was taken since it was selected
+        removed, _ = StoredBlob.objects.filter(name=name, ref_count=0, updated_at__lt=cutoff).delete()
+        if removed:
+            content_storage.delete(name)
+            deleted += 1
+
+    # Files saved by uploads whose rows were never created
+    if content_storage.exists(BLOB_PREFIX):
+        known = set(StoredBlob.objects.values_list('name', flat=True))
+        for name in blob_files():
+            if name not in known and content_storage.get_modified_time(name) < cutoff:
+                content_storage.delete(name)
+                deleted += 1
+    return deleted
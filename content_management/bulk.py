@@ -0,0 +1,221 @@
+"""
+Bulk import and export of posts as NDJSON, one JSON object per line.
+Imports validate every record on its own and insert the valid ones with
+bulk_create in batches, so thousands of historical posts take a handful of
+queries and a bad record is reported instead of failing the whole file. Only
+a count and the first BULK_IMPORT_MAX_ERRORS errors are kept, so memory stays
+flat however many lines are bad.
+Exports iterate a server-side cursor, so memory stays flat however many posts
+a user has.
+"""
+
+from itertools import islice
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from SLID.storage import content_storage, is_blob
+from userauth.models import Post, StoredBlob, UserProfile
+from . import blobs, media
+from .signals import posts_imported
+from .stats import rebuild_post_stats
+
+logger = logging.getLogger(__name__)
+
+# Fields a record may set, and exported fields that are ignored when imported again
+IMPORT_FIELDS = {'content_type', 'content', 'media_file', 'metadata', 'created_at'}
+EXPORT_ONLY_FIELDS = {'id', 'updated_at', 'media_url'}
+
+
+def get_import_batch_size():
+    return getattr(settings, 'BULK_IMPORT_BATCH_SIZE', 500)
+
+
+def get_import_max_errors():
+    """Rejected records reported with their errors, the rest are only counted"""
+    return getattr(settings, 'BULK_IMPORT_MAX_ERRORS', 100)
+
+
+def get_export_chunk_size():
+    """Rows fetched from the server-side cursor at a time"""
+    return getattr(settings, 'BULK_EXPORT_CHUNK_SIZE', 2000)
+
+
+def build_post(user, record):
+    """Validate an import record and build its unsaved Post. Raises ValidationError."""
+    if not isinstance(record, dict):
+        raise ValidationError("Each line must be a JSON object.")
+    unknown = set(record) - IMPORT_FIELDS - EXPORT_ONLY_FIELDS
+    if unknown:
+        raise ValidationError(f"Unknown field(s): {', '.join(sorted(unknown))}.")
+    if not isinstance(record.get('media_file') or '', str):
+        raise ValidationError({'media_file': ["Enter the stored name of a media file."]})
+
+    post = Post(
+        user=user,
+        content_type=record.get('content_type'),
+        content=record.get('content') or '',
+        media_file=record.get('media_file') or None,
+        metadata=record.get('metadata'),
+    )
+    errors = {}
+    try:
+        post.full_clean(exclude=['user', 'content'])
+    except ValidationError as e:
+        errors.update(e.message_dict)
+
+    if post.content_type == 'text' and not post.content.strip():
+        errors['content'] = ["Text posts need content."]
+    if post.media_file:
+        if post.content_type == 'text':
+            errors['media_file'] = ["Text posts cannot have a media file."]
+        elif not is_blob(post.media_file.name):
+            errors['media_file'] = ["Media files must already be stored, e.g. exported from this site."]
+    if record.get('metadata') is not None and not isinstance(record['metadata'], dict):
+        errors['metadata'] = ["Metadata must be a JSON object."]
+
+    created_at = record.get('created_at')
+    if created_at is not None:
+        parsed = parse_datetime(created_at) if isinstance(created_at, str) else None
+        if parsed is None:
+            errors['created_at'] = ["Enter an ISO 8601 date and time."]
+        else:
+            post.created_at = parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+    if errors:
+        raise ValidationError(errors)
+    return post
+
+
+def referable_blobs(user, names):
+    """The names among names that are stored blobs the user's own posts or profile refer to"""
+    stored = set(StoredBlob.objects.filter(name__in=set(names)).values_list('name', flat=True))
+    if not stored:
+        return stored
+    # Soft deleted posts still hold their references
+    referable = set(Post.all_objects.filter(user=user, media_file__in=stored).values_list('media_file', flat=True))
+    referable.update(
+        UserProfile.all_objects.filter(user=user, profilePicture__in=stored - referable).values_list('profilePicture', flat=True)
+    )
+    return referable
+
+
+def save_batch(posts):
+    """Insert a batch of validated posts, keeping their original creation dates"""
+    created_at = [post.created_at for post in posts]
+    with transaction.atomic():
+        # bulk_create applies auto_now_add, so the imported dates are written back afterwards
+        Post.objects.bulk_create(posts)
+        dated = []
+        for post, original in zip(posts, created_at):
+            if original is not None:
+                post.created_at = original
+                dated.append(post)
+        if dated:
+            Post.objects.bulk_update(dated, ['created_at'])
+        # bulk_create sends no post_save, so blob references and media processing are handled here
+        for post in posts:
+            if post.media_file:
+                blobs.retain(post.media_file.name)
+                transaction.on_commit(lambda post=post: media.enqueue(post))
+
+
+class ImportReport:
+    """Number of posts created and rejected, with the errors of the first rejected records"""
+
+    def __init__(self, max_errors):
+        self.created = 0
+        self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def reject(self, line, errors):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+
+def flush_batch(user, batch, report):
+    """Save a batch of (line, post), rejecting posts referring to media the user may not use"""
+    allowed = referable_blobs(user, [post.media_file.name for _, post in batch if post.media_file])
+    posts = []
+    for number, post in batch:
+        if post.media_file and post.media_file.name not in allowed:
+            report.reject(number, {'media_file': ["Media files must be stored on this site and used by your own posts or profile."]})
+        else:
+            posts.append(post)
+    if posts:
+        save_batch(posts)
+        report.created += len(posts)
+
+
+def import_posts(user, lines, batch_size=None, max_errors=None):
+    """
+    Import NDJSON lines (str or bytes) as posts of user.
+    Returns the number of posts created, the number rejected, and {line, errors}
+    of the first max_errors (BULK_IMPORT_MAX_ERRORS) rejected records.
+    """
+    batch_size = batch_size or get_import_batch_size()
+    report = ImportReport(get_import_max_errors() if max_errors is None else max_errors)
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        try:
+            batch.append((number, build_post(user, json.loads(line))))
+        except ValidationError as e:
+            report.reject(number, e.message_dict if hasattr(e, 'error_dict') else {'__all__': e.messages})
+        except ValueError as e:
+            report.reject(number, {'__all__': [f"Invalid JSON: {e}"]})
+        if len(batch) >= batch_size:
+            flush_batch(user, batch, report)
+            batch = []
+    if batch:
+        flush_batch(user, batch, report)
+
+    if report.created:
+        rebuild_post_stats(user.pk)
+        posts_imported.send(sender=Post, user_id=user.pk, count=report.created)
+    logger.info(f"Imported {report.created} posts for user {user.username}, rejected {report.rejected}.")
+    return report.created, report.rejected, report.errors
+
+
+def export_posts(user_id):
+    """NDJSON lines of a user's posts, oldest first"""
+    posts = (
+        Post.objects.filter(user_id=user_id).order_by('created_at', 'id')
+        .values('id', 'content_type', 'content', 'media_file', 'metadata', 'created_at', 'updated_at')
+    )
+    for post in posts.iterator(chunk_size=get_export_chunk_size()):
+        post['media_file'] = post['media_file'] or None
+        post['media_url'] = content_storage.url(post['media_file']) if post['media_file'] else None
+        yield json.dumps(post, cls=DjangoJSONEncoder) + '\n'
+
+
+def chunked(lines, size=100):
+    """Join lines into larger chunks to cut per-write overhead when streaming"""
+    while True:
+        chunk = ''.join(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def achunked(lines, size=100):
+    """Async version of chunked for ASGI servers, which would otherwise buffer a sync iterator whole"""
+    chunks = chunked(lines, size)
+    while True:
+        # Thread sensitive, so the server-side cursor stays on the connection that opened it
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,28 @@
+"""
+Export a user's posts as NDJSON, one post per line, in a format import_posts accepts.
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from content_management.bulk import export_posts
+
+
+class Command(BaseCommand):
+    help = "Export a user's posts as NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('file', nargs='?', default='-', help="Output file, or - for stdout")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"User {options['username']} does not exist.")
+
+        if options['file'] == '-':
+            for line in export_posts(user.pk):
+                self.stdout.write(line, ending='')
+        else:
+            with open(options['file'], 'w', encoding='utf-8') as file:
+                file.writelines(export_posts(user.pk))
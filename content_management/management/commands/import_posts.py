@@ -0,0 +1,38 @@
+"""
+Import a user's posts from an NDJSON file, one post per line, e.g. history
+converted from an Instagram or Facebook data download.
+"""
+
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from content_management.bulk import import_posts
+
+
+class Command(BaseCommand):
+    help = "Import posts for a user from NDJSON, reporting invalid records by line"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('file', nargs='?', default='-', help="NDJSON file, or - for stdin")
+        parser.add_argument('--batch-size', type=int, help="Posts inserted per query, defaults to BULK_IMPORT_BATCH_SIZE")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"User {options['username']} does not exist.")
+
+        if options['file'] == '-':
+            created, rejected, errors = import_posts(user, sys.stdin, options['batch_size'])
+        else:
+            with open(options['file'], encoding='utf-8') as file:
+                created, rejected, errors = import_posts(user, file, options['batch_size'])
+
+        for record in errors:
+            self.stderr.write(f"Line {record['line']}: {json.dumps(record['errors'])}")
+        if rejected > len(errors):
+            self.stderr.write(f"... and {rejected - len(errors)} more rejected record(s).")
+        self.stdout.write(f"Imported {created} post(s), rejected {rejected}.")
@@ -0,0 +1,28 @@
+"""
+Generate the media variants of posts that have not been processed yet, e.g.
+posts created before background processing existed or while it was failing.
+"""
+
+from django.core.management.base import BaseCommand
+
+from content_management.media import process_post_media
+from userauth.models import Post
+
+
+class Command(BaseCommand):
+    help = "Generate resized variants and video posters for post media"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Reprocess posts that already have variants")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(content_type__in=['image', 'video'], media_file__gt='')
+        if not options['all']:
+            posts = posts.exclude(metadata__has_key='media')
+        processed = failed = 0
+        for post_id in posts.values_list('id', flat=True).iterator():
+            if process_post_media(post_id) is None:
+                failed += 1
+            else:
+                processed += 1
+        self.stdout.write(f"Processed {processed} post(s), {failed} failed.")
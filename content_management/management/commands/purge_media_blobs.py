@@ -0,0 +1,22 @@
+"""
+Delete stored media files that no post or profile picture refers to anymore.
+Run it periodically, e.g. daily from cron.
+"""
+
+from django.core.management.base import BaseCommand
+
+from content_management.blobs import purge_blobs, rebuild_blob_refs
+
+
+class Command(BaseCommand):
+    help = "Delete media blobs unreferenced for longer than MEDIA_BLOB_GRACE_PERIOD"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Recount every blob's references before purging")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            counted = rebuild_blob_refs()
+            self.stdout.write(f"Recounted references of {counted} blob(s).")
+        deleted = purge_blobs()
+        self.stdout.write(f"Purged {deleted} blob(s).")
@@ -0,0 +1,16 @@
+"""
+Delete abandoned chunked uploads and their partial files.
+Run it periodically, e.g. hourly from cron.
+"""
+
+from django.core.management.base import BaseCommand
+
+from content_management.uploads import purge_upload_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions idle for longer than UPLOAD_SESSION_EXPIRY"
+
+    def handle(self, *args, **options):
+        deleted = purge_upload_sessions()
+        self.stdout.write(f"Purged {deleted} upload session(s).")
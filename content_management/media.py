@@ -0,0 +1,203 @@
+"""
+Background processing of post media.
+After an image or video post is saved, a worker generates resized WebP and
+JPEG variants (from a poster frame for videos) and records them with the
+original's dimensions in ``Post.metadata['media']``. Templates then use the
+smallest variant that fits through the ``media_variants`` template filters
+instead of the original upload.
+"""
+
+from io import BytesIO
+from pathlib import Path
+import logging
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from SLID.workers import BackgroundQueue
+from userauth.models import Post
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+
+
+def get_variant_widths():
+    return sorted(getattr(settings, 'MEDIA_VARIANT_WIDTHS', [160, 480, 1080]))
+
+
+def get_variant_quality():
+    return getattr(settings, 'MEDIA_VARIANT_QUALITY', 80)
+
+
+def variant_dir(post_id):
+    return f"posts/variants/{post_id}"
+
+
+def variant_name(post, label, extension):
+    return f"{variant_dir(post.pk)}/{label}.{extension}"
+
+
+def delete_variants(post_id):
+    """Delete the stored variants of a post that no longer exists. Returns the number of files deleted."""
+    directory = variant_dir(post_id)
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for file in files:
+        default_storage.delete(f"{directory}/{file}")
+    try:
+        Path(default_storage.path(directory)).rmdir()
+    except (NotImplementedError, OSError):
+        # Remote storages have no directories to remove
+        pass
+    return len(files)
+
+
+def save_image(name, image, image_format):
+    """
+    Encode an image and store it, replacing an earlier version. Returns the stored name.
+    Variants belong to a single post, so they are kept outside the content-addressed storage.
+    """
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(buffer, image_format, quality=get_variant_quality(), optimize=image_format == 'JPEG')
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_variants(post, image):
+    """Store WebP and JPEG variants narrower than the image. Returns their descriptions."""
+    variants = []
+    for width in get_variant_widths():
+        if width >= image.width:
+            break
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        variants.append({
+            'width': width,
+            'height': height,
+            'webp': save_image(variant_name(post, width, 'webp'), resized, 'WEBP'),
+            'jpeg': save_image(variant_name(post, width, 'jpg'), resized, 'JPEG'),
+        })
+    return variants
+
+
+def open_image(file):
+    """Load an image, returning it upright together with its original format"""
+    image = Image.open(file)
+    image.load()
+    # Apply the camera orientation so variants are not sideways
+    return ImageOps.exif_transpose(image), image.format
+
+
+def process_image(post):
+    with post.media_file.open('rb') as file:
+        image, image_format = open_image(file)
+    return {
+        'width': image.width,
+        'height': image.height,
+        'format': image_format,
+        'variants': build_variants(post, image),
+    }
+
+
+def local_copy(post):
+    """Path of the media file on disk, copying it to a temporary file for remote storages"""
+    try:
+        return Path(post.media_file.path), None
+    except NotImplementedError:
+        temp = tempfile.NamedTemporaryFile(suffix=Path(post.media_file.name).suffix)
+        with post.media_file.open('rb') as file:
+            shutil.copyfileobj(file, temp)
+        temp.flush()
+        return Path(temp.name), temp
+
+
+def extract_poster(path):
+    """JPEG bytes of an early frame of a video, or None"""
+    for seek in ('1', '0'):
+        result = subprocess.run(
+            [FFMPEG, '-v', 'error', '-ss', seek, '-i', str(path), '-frames:v', '1', '-f', 'image2', '-c:v', 'mjpeg', 'pipe:1'],
+            capture_output=True, timeout=60,
+        )
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+    return None
+
+
+def probe_duration(path):
+    if FFPROBE is None:
+        return None
+    result = subprocess.run(
+        [FFPROBE, '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=nw=1:nk=1', str(path)],
+        capture_output=True, text=True, timeout=60,
+    )
+    try:
+        return round(float(result.stdout.strip()), 2)
+    except ValueError:
+        return None
+
+
+def process_video(post):
+    if FFMPEG is None:
+        logger.info(f"ffmpeg is not installed, skipping the poster of post {post.pk}.")
+        return {}
+
+    path, temp = local_copy(post)
+    try:
+        media = {'duration': probe_duration(path)}
+        poster = extract_poster(path)
+    finally:
+        if temp is not None:
+            temp.close()
+    if poster is None:
+        return media
+
+    image, _ = open_image(BytesIO(poster))
+    media.update({
+        'width': image.width,
+        'height': image.height,
+        'poster': save_image(variant_name(post, 'poster', 'jpg'), image, 'JPEG'),
+        'variants': build_variants(post, image),
+    })
+    return media
+
+
+def process_post_media(post_id):
+    """Queue handler: generate the variants of a post's media and record them in its metadata"""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.media_file:
+        return None
+
+    try:
+        media = process_image(post) if post.content_type == 'image' else process_video(post)
+    except (OSError, UnidentifiedImageError, subprocess.SubprocessError, Image.DecompressionBombError) as e:
+        logger.warning(f"Processing media of post {post.pk} failed: {e!r}")
+        return None
+
+    post.metadata = {**(post.metadata or {}), 'media': media}
+    # Saving through the model lets the profile caches pick up the variants
+    post.save(update_fields=['metadata'])
+    return media
+
+
+media_queue = BackgroundQueue(
+    process_post_media,
+    name='media-processing',
+    workers=getattr(settings, 'MEDIA_PROCESSING_WORKERS', 1),
+)
+
+
+def enqueue(post):
+    """Schedule processing of a post's media"""
+    return media_queue.put(post.pk)
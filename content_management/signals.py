@@ -0,0 +1,81 @@
+"""
+Signal handlers that keep the PostStats counters in sync with posts, queue new
+media for processing, remove the variants of deleted posts and count the
+references to stored media blobs.
+"""
+
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+from userauth.models import Post, UserProfile
+from . import blobs, media
+from .stats import adjust_post_stats
+
+# Sent after posts were created with bulk_create, which sends no post_save, with user_id and count
+posts_imported = Signal()
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, update_fields, **kwargs):
+    """Only live posts are counted, soft deleting or restoring one moves the counters"""
+    if created:
+        if not instance.is_deleted:
+            adjust_post_stats(instance, 1)
+    elif update_fields and 'is_deleted' in update_fields:
+        adjust_post_stats(instance, -1 if instance.is_deleted else 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    # Purged tombstones were uncounted when they were soft deleted
+    if not instance.is_deleted:
+        adjust_post_stats(instance, -1)
+
+
+@receiver(post_delete, sender=Post)
+def delete_media_variants(sender, instance, **kwargs):
+    """Variants belong to their post alone, unlike the shared blobs, so they go with it"""
+    post_id = instance.pk
+    # After the commit, a rolled back delete keeps them
+    transaction.on_commit(lambda: media.delete_variants(post_id))
+
+
+@receiver(post_save, sender=Post)
+def process_created_media(sender, instance, created, **kwargs):
+    if created and instance.media_file:
+        # Wait for the commit so the worker can see the post
+        transaction.on_commit(lambda: media.enqueue(instance))
+
+
+@receiver(post_init, sender=Post)
+@receiver(post_init, sender=UserProfile)
+def remember_blob_names(sender, instance, **kwargs):
+    instance._blob_names = {field: blobs.stored_name(instance, field) for field in blobs.BLOB_FIELDS[sender]}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=UserProfile)
+def update_blob_refs(sender, instance, created, update_fields, **kwargs):
+    for field in blobs.BLOB_FIELDS[sender]:
+        if update_fields is not None and field not in update_fields:
+            continue
+        name = blobs.stored_name(instance, field)
+        previous = None if created else instance._blob_names.get(field)
+        if name is DEFERRED or name == previous:
+            continue
+        blobs.retain(name)
+        # A file whose previous value was never loaded keeps its reference until the next recount
+        if previous is not DEFERRED:
+            blobs.release(previous)
+        instance._blob_names[field] = name
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=UserProfile)
+def release_blob_refs(sender, instance, **kwargs):
+    for field in blobs.BLOB_FIELDS[sender]:
+        name = instance._blob_names.get(field)
+        if name is not DEFERRED:
+            blobs.release(name)
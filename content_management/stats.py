@@ -0,0 +1,57 @@
+"""
+Per-user post statistics.
+Counts of live posts are kept in the PostStats counter table and are adjusted by
+one UPDATE when a post is created or deleted (see content_management.signals), so reading them
+never scans a user's post history. A missing row is seeded with a single
+conditional aggregation over the user's posts.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from userauth.models import Post, PostStats
+
+# Post content types with their own counter column
+COUNTED_TYPES = [content_type for content_type, _ in Post.CONTENT_TYPES]
+
+
+def aggregate_post_stats(user_id):
+    """Count a user's posts, overall and per content type, in one query"""
+    return Post.objects.filter(user_id=user_id).aggregate(
+        total_posts=Count('id'),
+        **{
+            f"{content_type}_posts": Count('id', filter=Q(content_type=content_type))
+            for content_type in COUNTED_TYPES
+        }
+    )
+
+
+def rebuild_post_stats(user_id):
+    """Recount a user's posts into their PostStats row"""
+    counts = aggregate_post_stats(user_id)
+    try:
+        with transaction.atomic():
+            stats, _ = PostStats.objects.update_or_create(user_id=user_id, defaults=counts)
+    except IntegrityError:
+        # Created concurrently, the recount is still correct
+        PostStats.objects.filter(user_id=user_id).update(**counts)
+        stats = PostStats(user_id=user_id, **counts)
+    return stats
+
+
+def get_post_stats(user_id):
+    """A user's post counters, seeding them on first use"""
+    stats = PostStats.objects.filter(user_id=user_id).first()
+    return stats if stats is not None else rebuild_post_stats(user_id)
+
+
+def adjust_post_stats(post, delta):
+    """Add delta to the counters a post contributes to"""
+    # Clamped at 0 like the profile counters, rebuild_post_stats fixes any drift
+    fields = {'total_posts': Greatest(F('total_posts') + delta, 0)}
+    if post.content_type in COUNTED_TYPES:
+        field = f"{post.content_type}_posts"
+        fields[field] = Greatest(F(field) + delta, 0)
+    if not PostStats.objects.filter(user_id=post.user_id).update(**fields):
+        rebuild_post_stats(post.user_id)
@@ -0,0 +1,53 @@
+"""
+Template filters selecting the smallest processed variant of a post's media.
+Variants are recorded in ``Post.metadata['media']`` by content_management.media.
+Until a post has been processed the filters fall back to the original upload.
+Posts without an image to show (text posts, videos without a poster) have no
+media_url, so templates guard the tag:
+
+    {% load media_variants %}
+    {% with src=post|media_url:120 %}{% if src %}
+    <img src="{{ src }}" srcset="{{ post|media_srcset }}" sizes="120px">
+    {% endif %}{% endwith %}
+"""
+
+from django import template
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+
+def _media(post):
+    return (post.metadata or {}).get('media') or {}
+
+
+def _original_url(post):
+    return post.media_file.url if post.media_file and post.content_type == 'image' else None
+
+
+@register.filter
+def media_url(post, width):
+    """URL of the smallest JPEG variant at least width pixels wide, or None without an image to show"""
+    variants = _media(post).get('variants') or []
+    for variant in variants:
+        if variant['width'] >= int(width):
+            return default_storage.url(variant['jpeg'])
+    # Nothing wide enough: the original is the next size up, or the poster for videos
+    return media_poster(post) or _original_url(post)
+
+
+@register.filter
+def media_srcset(post, image_format='webp'):
+    """srcset of every variant in the given format (webp or jpeg), including the original image"""
+    media = _media(post)
+    candidates = [f"{default_storage.url(variant[image_format])} {variant['width']}w" for variant in media.get('variants') or []]
+    if media.get('width') and _original_url(post):
+        candidates.append(f"{_original_url(post)} {media['width']}w")
+    return ', '.join(candidates)
+
+
+@register.filter
+def media_poster(post):
+    """URL of a video's poster frame, or None"""
+    poster = _media(post).get('poster')
+    return default_storage.url(poster) if poster else None
@@ -1,8 +1,29 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.template import Context, Template
 from django.urls import reverse
 from django.contrib.auth.models import User
-from userauth.models import UserProfile, Post
+from userauth.models import UserProfile, Post, PostStats, UploadSession, StoredBlob
+from content_management.stats import aggregate_post_stats
+from content_management.media import process_post_media, variant_dir
+from content_management.blobs import purge_blobs, rebuild_blob_refs
+from content_management.bulk import import_posts
+from content_management.uploads import get_max_chunk_size
+from SLID.storage import content_storage, serve_blob, IMMUTABLE_CACHE_CONTROL
+from content_management.templatetags.media_variants import media_url, media_srcset
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from datetime import timedelta
+from django.utils import timezone
+import hashlib
+import json
+from PIL import Image
+import shutil
+import tempfile
 
 
 class PostManagementTests(TestCase):
@@ -151,4 +172,441 @@ class PostManagementTests(TestCase):
 
 #         # Or, if you want to check the response directly (might need to adjust status code)
 #         # response = self.client.post(reverse('content_management:delete', args=[post.pk]))
-#         # self.assertEqual(response.status_code, 403)  # Forbidden
\ No newline at end of file
+#         # self.assertEqual(response.status_code, 403)  # Forbidden
+
+
+class PostStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_counters_follow_create_and_delete(self):
+        Post.objects.create(user=self.user, content_type='text', content='First')
+        image = Post.objects.create(user=self.user, content_type='image', content='Second')
+        image.delete()
+        stats = PostStats.objects.get(user=self.user)
+        self.assertEqual((stats.total_posts, stats.text_posts, stats.image_posts), (1, 1, 0))
+        self.assertEqual(aggregate_post_stats(self.user.pk)['total_posts'], 1)
+
+    def test_missing_counters_are_seeded(self):
+        Post.objects.bulk_create([Post(user=self.user, content_type='video') for _ in range(3)])
+        PostStats.objects.filter(user=self.user).delete()
+        response = self.client.get(reverse('content_management:create'))
+        self.assertEqual((response.context['total_posts'], response.context['video_posts']), (3, 3))
+
+    def test_stats_include_new_post(self):
+        response = self.client.post(reverse('content_management:create'), {'twitte_submit': 'true', 'twitte': 'Hello'})
+        self.assertEqual(response.context['total_posts'], 1)
+        self.assertEqual(response.context['latest_post'].content, 'Hello')
+
+    def test_stats_do_not_scan_posts(self):
+        Post.objects.create(user=self.user, content_type='text', content='First')
+        self.client.get(reverse('content_management:create'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('content_management:create'))
+        post_queries = [query['sql'] for query in queries if 'userauth_post"' in query['sql'] and 'COUNT' in query['sql']]
+        self.assertEqual(post_queries, [])
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_TEMP_DIR=self.temp_dir, MEDIA_ROOT=self.temp_dir)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def start(self, size, content_type='video'):
+        response = self.client.post(reverse('content_management:upload_start'), {
+            'content_type': content_type, 'filename': 'clip.mp4', 'size': size, 'caption': 'My clip'
+        })
+        self.assertEqual(response.status_code, 201)
+        return response['Location']
+
+    def send(self, url, offset, data):
+        return self.client.patch(url, data, content_type='application/octet-stream', headers={'Upload-Offset': str(offset)})
+
+    def test_chunks_assemble_into_post(self):
+        url = self.start(10)
+        self.assertEqual(self.send(url, 0, b'01234').json()['offset'], 5)
+        self.assertFalse(Post.objects.exists())
+
+        response = self.send(url, 5, b'56789').json()
+        self.assertTrue(response['complete'])
+        post = Post.objects.get(pk=response['post_id'])
+        self.assertEqual((post.content_type, post.content), ('video', 'My clip'))
+        with post.media_file.open('rb') as media:
+            self.assertEqual(media.read(), b'0123456789')
+
+    def test_resume_after_interrupted_chunk(self):
+        url = self.start(10)
+        self.send(url, 0, b'01234')
+        # A retried chunk at a stale offset is told where to resume from
+        response = self.send(url, 2, b'23456')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 5)
+        self.assertEqual(self.client.get(url).json()['offset'], 5)
+        self.assertTrue(self.send(url, 5, b'56789').json()['complete'])
+
+    def test_resume_status_includes_chunk_size(self):
+        url = self.start(10)
+        self.send(url, 0, b'01234')
+        status = self.client.get(url).json()
+        self.assertEqual(status['offset'], 5)
+        self.assertEqual(status['chunk_size'], get_max_chunk_size())
+
+    def test_failed_finish_leaves_no_post(self):
+        url = self.start(10)
+        self.send(url, 0, b'01234')
+        # The post is rolled back with the session update that failed
+        with patch.object(UploadSession, 'save', side_effect=RuntimeError('database went away')):
+            self.assertEqual(self.send(url, 5, b'56789').status_code, 500)
+        self.assertFalse(Post.objects.exists())
+        session = UploadSession.objects.get()
+        self.assertEqual((session.status, session.received), ('uploading', 10))
+
+        # An empty PATCH at the final offset retries, creating the post once
+        response = self.send(url, 10, b'').json()
+        self.assertTrue(response['complete'])
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertTrue(self.send(url, 10, b'').json()['complete'])
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_finish_losing_race_discards_stored_file(self):
+        url = self.start(10)
+        self.send(url, 0, b'01234')
+        session = UploadSession.objects.get()
+        store = content_storage.save
+
+        def store_then_finish_elsewhere(name, content):
+            # Another request completes the upload while this one copies the file
+            UploadSession.objects.filter(pk=session.pk).update(status='complete')
+            stored.append(store(name, content))
+            return stored[-1]
+
+        stored = []
+        with patch('content_management.uploads.content_storage.save', side_effect=store_then_finish_elsewhere):
+            response = self.send(url, 5, b'56789')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(content_storage.exists(stored[0]))
+
+    def test_rejects_invalid_uploads(self):
+        response = self.client.post(reverse('content_management:upload_start'), {
+            'content_type': 'text', 'filename': 'notes.txt', 'size': 10
+        })
+        self.assertEqual(response.status_code, 400)
+        url = self.start(4)
+        self.assertEqual(self.send(url, 0, b'too long').status_code, 400)
+
+    def test_other_users_cannot_resume(self):
+        url = self.start(10)
+        User.objects.create_user(username='other', password='testpass')
+        self.client.login(username='other', password='testpass')
+        self.assertEqual(self.send(url, 0, b'01234').status_code, 404)
+        self.assertEqual(UploadSession.objects.get().received, 0)
+
+
+@override_settings(MEDIA_VARIANT_WIDTHS=[160, 480, 1080])
+class MediaProcessingTests(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def image_post(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG')
+        media_file = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+        return Post.objects.create(user=self.user, content_type='image', media_file=media_file)
+
+    def test_image_variants(self):
+        post = self.image_post(1200, 600)
+        self.assertEqual(media_url(post, 120), post.media_file.url)
+
+        process_post_media(post.pk)
+        post.refresh_from_db()
+        media = post.metadata['media']
+        self.assertEqual((media['width'], media['height'], media['format']), (1200, 600, 'JPEG'))
+        self.assertEqual([(variant['width'], variant['height']) for variant in media['variants']], [(160, 80), (480, 240), (1080, 540)])
+        for variant in media['variants']:
+            with default_storage.open(variant['webp']) as file:
+                self.assertEqual(Image.open(file).size, (variant['width'], variant['height']))
+
+        self.assertTrue(media_url(post, 120).endswith('/160.jpg'))
+        self.assertTrue(media_url(post, 200).endswith('/480.jpg'))
+        self.assertEqual(media_url(post, 1500), post.media_file.url)
+        self.assertEqual(len(media_srcset(post, 'webp').split(', ')), 4)
+
+    def test_small_images_keep_the_original(self):
+        post = self.image_post(100, 100)
+        process_post_media(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.metadata['media']['variants'], [])
+        self.assertEqual(media_url(post, 480), post.media_file.url)
+
+    def test_variants_are_deleted_with_the_post(self):
+        post = self.image_post(1200, 600)
+        process_post_media(post.pk)
+        post.refresh_from_db()
+        names = [variant['jpeg'] for variant in post.metadata['media']['variants']]
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        post.soft_delete()
+        self.assertTrue(default_storage.exists(names[0]))
+        # Purging the tombstone hard-deletes the post
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.purge(timezone.now() + timedelta(seconds=1))
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+        self.assertFalse(default_storage.exists(variant_dir(post.pk)))
+
+    def test_posts_without_an_image_have_no_media_url(self):
+        text = Post.objects.create(user=self.user, content_type='text', content='No media')
+        video = Post.objects.create(user=self.user, content_type='video', media_file=SimpleUploadedFile('clip.mp4', b'video'))
+        self.assertIsNone(media_url(text, 120))
+        self.assertIsNone(media_url(video, 120))
+        rendered = Template("{% load media_variants %}{% with src=post|media_url:120 %}{% if src %}<img src=\"{{ src }}\">{% endif %}{% endwith %}")
+        self.assertEqual(rendered.render(Context({'post': video})), '')
+
+    def test_invalid_media_is_skipped(self):
+        media_file = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        post = Post.objects.create(user=self.user, content_type='image', media_file=media_file)
+        self.assertIsNone(process_post_media(post.pk))
+        post.refresh_from_db()
+        self.assertIsNone(post.metadata)
+
+    def test_process_media_command(self):
+        processed = self.image_post(600, 400)
+        process_post_media(processed.pk)
+        pending = self.image_post(600, 400)
+        Post.objects.create(user=self.user, content_type='text', content='No media')
+
+        out = StringIO()
+        call_command('process_media', stdout=out)
+        self.assertIn("Processed 1 post(s), 0 failed.", out.getvalue())
+        pending.refresh_from_db()
+        self.assertEqual(len(pending.metadata['media']['variants']), 2)
+
+    def test_created_posts_are_queued_on_commit(self):
+        with patch('content_management.media.media_queue.put') as put:
+            with self.captureOnCommitCallbacks(execute=True):
+                post = self.image_post(600, 400)
+                Post.objects.create(user=self.user, content_type='text', content='No media')
+        put.assert_called_once_with(post.pk)
+
+
+class BlobStorageTests(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def video_post(self, data=b'same video bytes', filename='clip.MP4'):
+        media_file = SimpleUploadedFile(filename, data, content_type='video/mp4')
+        return Post.objects.create(user=self.user, content_type='video', media_file=media_file)
+
+    def later(self):
+        return timezone.now() + timedelta(days=2)
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.video_post()
+        second = self.video_post(filename='repost.mp4')
+        digest = hashlib.sha256(b'same video bytes').hexdigest()
+        self.assertEqual(first.media_file.name, f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.mp4")
+        self.assertEqual(second.media_file.name, first.media_file.name)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+        self.assertEqual(StoredBlob.objects.get().size, len(b'same video bytes'))
+
+        first.delete()
+        self.assertEqual(purge_blobs(now=self.later()), 0)
+        self.assertTrue(content_storage.exists(second.media_file.name))
+
+        second.delete()
+        self.assertEqual(StoredBlob.objects.get().ref_count, 0)
+        self.assertEqual(purge_blobs(), 0)
+        self.assertEqual(purge_blobs(now=self.later()), 1)
+        self.assertFalse(content_storage.exists(second.media_file.name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_replaced_profile_picture_is_released(self):
+        profile = UserProfile.objects.create(user=self.user)
+        self.assertEqual(profile.profilePicture.name, 'default_pp.png')
+        profile.profilePicture = SimpleUploadedFile('me.png', b'first picture')
+        profile.save()
+        first = profile.profilePicture.name
+        profile = UserProfile.objects.get(pk=profile.pk)
+        profile.profilePicture = SimpleUploadedFile('me.png', b'second picture')
+        profile.save()
+
+        self.assertEqual(StoredBlob.objects.get(name=first).ref_count, 0)
+        self.assertEqual(StoredBlob.objects.get(name=profile.profilePicture.name).ref_count, 1)
+        # Saves that leave the picture alone keep the counts
+        UserProfile.objects.get(pk=profile.pk).save(update_fields=['bio'])
+        UserProfile.objects.only('bio').get(pk=profile.pk).save()
+        self.assertEqual(StoredBlob.objects.get(name=profile.profilePicture.name).ref_count, 1)
+
+    def test_orphaned_files_and_recount(self):
+        orphan = content_storage.save('left.mp4', SimpleUploadedFile('left.mp4', b'never saved'))
+        post = self.video_post()
+        StoredBlob.objects.update(ref_count=5)
+
+        self.assertEqual(rebuild_blob_refs(), 1)
+        self.assertEqual(StoredBlob.objects.get(name=post.media_file.name).ref_count, 1)
+        self.assertEqual(purge_blobs(now=self.later()), 1)
+        self.assertFalse(content_storage.exists(orphan))
+        self.assertTrue(content_storage.exists(post.media_file.name))
+
+    @override_settings(DEBUG=True)
+    def test_blob_urls_are_immutable(self):
+        post = self.video_post()
+        self.assertTrue(post.media_file.url.startswith('/images/blobs/'))
+        response = serve_blob(RequestFactory().get(post.media_file.url), post.media_file.name[len('blobs/'):])
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+
+class BulkPostTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def ndjson(self, *records):
+        return ''.join((record if isinstance(record, str) else json.dumps(record)) + '\n' for record in records)
+
+    def test_import_reports_invalid_records(self):
+        body = self.ndjson(
+            {'content_type': 'text', 'content': 'First post', 'created_at': '2019-05-01T10:00:00Z', 'metadata': {'likes': 3}},
+            {'content_type': 'image', 'content': 'Embedded photo'},
+            '',
+            {'content_type': 'text', 'content': ''},
+            '{not json',
+            {'content_type': 'audio', 'content': 'Podcast'},
+            {'content_type': 'text', 'content': 'Hi', 'shares': 1},
+            {'content_type': 'text', 'content': 'Naive date', 'created_at': '2020-01-01 12:00'},
+        )
+        response = self.client.post(reverse('content_management:bulk'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['created'], report['rejected']), (3, 4))
+        self.assertEqual([error['line'] for error in report['errors']], [4, 5, 6, 7])
+        self.assertIn('content', report['errors'][0]['errors'])
+        self.assertIn('content_type', report['errors'][2]['errors'])
+
+        first = Post.objects.get(content='First post')
+        self.assertEqual(first.created_at.isoformat(), '2019-05-01T10:00:00+00:00')
+        self.assertEqual(first.metadata, {'likes': 3})
+        stats = PostStats.objects.get(user=self.user)
+        self.assertEqual((stats.total_posts, stats.text_posts, stats.image_posts), (3, 2, 1))
+
+    def test_import_batches_inserts(self):
+        lines = [json.dumps({'content_type': 'text', 'content': f'Post {i}'}) for i in range(25)]
+        with CaptureQueriesContext(connection) as queries:
+            created, rejected, errors = import_posts(self.user, lines, batch_size=10)
+        self.assertEqual((created, rejected, errors), (25, 0, []))
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "userauth_post"')]
+        self.assertEqual(len(inserts), 3)
+
+    def test_export_round_trip(self):
+        Post.objects.create(user=self.user, content_type='text', content='Hello')
+        Post.objects.create(user=self.user, content_type='text', content='Deleted', is_deleted=True)
+        other = User.objects.create_user(username='other', password='testpass')
+        Post.objects.create(user=other, content_type='text', content='Not mine')
+
+        response = self.client.get(reverse('content_management:bulk'))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['content'] for line in lines], ['Hello'])
+
+        out = StringIO()
+        call_command('export_posts', 'testuser', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), lines)
+
+        created, rejected, errors = import_posts(other, lines)
+        self.assertEqual((created, rejected, errors), (1, 0, []))
+        self.assertEqual(Post.objects.filter(user=other, content='Hello').count(), 1)
+
+    def test_import_keeps_only_the_first_errors(self):
+        lines = ['{not json'] * 50 + [json.dumps({'content_type': 'text', 'content': 'Valid'})]
+        created, rejected, errors = import_posts(self.user, lines, max_errors=3)
+        self.assertEqual((created, rejected), (1, 50))
+        self.assertEqual([error['line'] for error in errors], [1, 2, 3])
+
+    def test_import_checks_media_references(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with override_settings(MEDIA_ROOT=temp_dir):
+            photo = Post.objects.create(
+                user=self.user, content_type='image', media_file=SimpleUploadedFile('photo.jpg', b'jpeg bytes')
+            )
+            name = photo.media_file.name
+            other = User.objects.create_user(username='other', password='testpass')
+            record = json.dumps({'content_type': 'image', 'media_file': name})
+            missing = json.dumps({'content_type': 'image', 'media_file': 'blobs/00/00/' + '0' * 64 + '.jpg'})
+
+            # Another user cannot attach the file by its name, nor anyone a blob that is not stored
+            created, rejected, errors = import_posts(other, [record, missing])
+            self.assertEqual((created, rejected), (0, 2))
+            self.assertIn('media_file', errors[0]['errors'])
+            created, rejected, _ = import_posts(self.user, [record, missing])
+            self.assertEqual((created, rejected), (1, 1))
+            self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 2)
+
+
+class SoftDeleteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_deleted_posts_are_hidden_and_uncounted(self):
+        post = Post.objects.create(user=self.user, content_type='text', content='Goodbye')
+        Post.objects.create(user=self.user, content_type='text', content='Staying')
+        self.client.post(reverse('content_management:delete', args=[post.pk]))
+
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        tombstone = Post.all_objects.get(pk=post.pk)
+        self.assertTrue(tombstone.is_deleted)
+        self.assertIsNotNone(tombstone.deleted_at)
+        self.assertEqual(PostStats.objects.get(user=self.user).total_posts, 1)
+        self.assertEqual(aggregate_post_stats(self.user.pk)['total_posts'], 1)
+
+        tombstone.restore()
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        self.assertEqual(PostStats.objects.get(user=self.user).total_posts, 2)
+
+    def test_purge_removes_old_tombstones_in_batches(self):
+        posts = [Post.objects.create(user=self.user, content_type='text', content=f'Post {i}') for i in range(5)]
+        for post in posts[:4]:
+            post.soft_delete()
+        Post.all_objects.filter(pk__in=[post.pk for post in posts[:3]]).update(deleted_at=timezone.now() - timedelta(days=40))
+
+        out = StringIO()
+        call_command('purge_deleted', '--batch-size', '2', stdout=out)
+        self.assertIn("Purged 3 deleted posts.", out.getvalue())
+        self.assertEqual(list(Post.all_objects.values_list('pk', flat=True).order_by('pk')), [posts[3].pk, posts[4].pk])
+        # Purging a tombstone does not count it a second time
+        self.assertEqual(PostStats.objects.get(user=self.user).total_posts, 1)
@@ -0,0 +1,154 @@
+"""
+Chunked, resumable media uploads.
+Chunks are streamed from the request straight into a partial file at the
+offset the session expects, so neither a chunk nor the whole file is ever held
+in memory, and outside any transaction, so a slow client never keeps a
+database connection idle in one; the offset then moves with one conditional
+UPDATE. A client that loses its connection asks for the session's offset
+and continues from there. Once the last byte arrives the partial file is saved
+to the media storage, again outside any transaction, and the Post is created
+in a short one.
+"""
+
+from datetime import timedelta
+from pathlib import Path
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from SLID.storage import content_storage
+from userauth.models import Post, UploadSession
+from . import blobs
+
+logger = logging.getLogger(__name__)
+
+# Bytes copied from the request to disk at a time
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+def get_upload_dir():
+    """Directory of partial uploads, it must be shared by every web server process"""
+    return Path(getattr(settings, 'UPLOAD_TEMP_DIR', None) or Path(tempfile.gettempdir()) / 'slid-uploads')
+
+
+def get_max_upload_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 ** 2)
+
+
+def get_session_expiry():
+    return timedelta(seconds=getattr(settings, 'UPLOAD_SESSION_EXPIRY', 24 * 60 * 60))
+
+
+def part_path(session):
+    return get_upload_dir() / f"{session.pk}.part"
+
+
+def start_upload(user, content_type, filename, size, caption=''):
+    """Open an upload session. Raises ValueError for invalid uploads."""
+    if content_type not in dict(UploadSession.CONTENT_TYPES):
+        raise ValueError(f"Unsupported content type: {content_type}")
+    if size <= 0 or size > get_max_upload_size():
+        raise ValueError(f"Upload size must be between 1 and {get_max_upload_size()} bytes.")
+    filename = get_valid_filename(Path(filename).name) if filename else ''
+    if not filename:
+        raise ValueError("A file name is required.")
+    return UploadSession.objects.create(
+        user=user, content_type=content_type, filename=filename, size=size, caption=caption
+    )
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Stream up to length bytes into the session's partial file at offset.
+    Returns the number of bytes written, which is less than length when the client disconnected.
+    """
+    path = part_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    # Opened without truncating: a chunk retried concurrently writes the same bytes at the same offset,
+    # and whatever lies past the session's offset is overwritten by the next chunk
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+    return written
+
+
+def advance_upload(session, offset, written):
+    """
+    Move the session's offset past a written chunk with one conditional UPDATE.
+    Returns False if another request moved it first.
+    """
+    advanced = UploadSession.objects.filter(pk=session.pk, status='uploading', received=offset).update(
+        received=offset + written, updated_at=timezone.now()
+    )
+    if advanced:
+        session.received = offset + written
+    return bool(advanced)
+
+
+def finish_upload(session):
+    """
+    Save the assembled file to the media storage, then create the Post and mark
+    the session complete in one short transaction. Returns the Post, or None if
+    another request already finished the upload.
+    """
+    current = UploadSession.objects.get(pk=session.pk)
+    if current.status != 'uploading':
+        session.status, session.post_id = current.status, current.post_id
+        return None
+
+    # Hashing and copying up to UPLOAD_MAX_SIZE bytes holds no connection or lock
+    path = part_path(session)
+    with open(path, 'rb') as part:
+        name = content_storage.save(session.filename, File(part))
+
+    post = None
+    try:
+        with transaction.atomic():
+            # The row lock keeps a concurrent retry from creating the post twice
+            locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if locked.status == 'uploading':
+                post = Post.objects.create(
+                    user=session.user, content_type=session.content_type, content=session.caption, media_file=name
+                )
+                session.status = 'complete'
+                session.post = post
+                session.save(update_fields=['status', 'post', 'updated_at'])
+            else:
+                session.status, session.post_id = locked.status, locked.post_id
+    except Exception:
+        blobs.discard(name)
+        raise
+    if post is None:
+        # A concurrent request finished first, its post refers to its own copy of the file
+        blobs.discard(name)
+        return None
+    # Only removed once the post is committed, so a failed attempt can be retried
+    path.unlink(missing_ok=True)
+    logger.info(f"{session.content_type.capitalize()} post created by user {session.user.username} from upload {session.pk}.")
+    return post
+
+
+def purge_upload_sessions(now=None):
+    """Delete sessions not touched within UPLOAD_SESSION_EXPIRY and their partial files"""
+    cutoff = (now or timezone.now()) - get_session_expiry()
+    sessions = UploadSession.objects.filter(updated_at__lt=cutoff)
+    for session in sessions.filter(status='uploading').iterator():
+        part_path(session).unlink(missing_ok=True)
+    deleted, _ = sessions.delete()
+    return deleted
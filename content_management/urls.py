@@ -7,4 +7,7 @@ urlpatterns = [
     path("create/", views.create, name="create"),
     path("update/<int:pk>/", views.update, name="update"),
     path("delete/<int:pk>/", views.delete, name="delete"),
+    path("uploads/", views.upload_start, name="upload_start"),
+    path("uploads/<uuid:pk>/", views.upload, name="upload"),
+    path("bulk/", views.bulk, name="bulk"),
 ]
\ No newline at end of file
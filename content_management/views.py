@@ -2,16 +2,23 @@
 Post Management Views for the post management app.
 Includes functions for creating, updating, and deleting user posts,
 handling various content types (text, image, video),
+resumable chunked uploads of image and video files,
+and bulk NDJSON import and export of posts.
 """
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseBadRequest, JsonResponse
-from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.urls import reverse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.utils import timezone
 import logging
 
-from userauth.models import UserProfile, Post
+from userauth.models import UserProfile, Post, UploadSession
+from .bulk import achunked, chunked, export_posts, import_posts
+from .stats import get_post_stats
+from .uploads import advance_upload, finish_upload, get_max_chunk_size, part_path, start_upload, write_chunk
 from django.contrib.auth.decorators import login_required
 
 # Initialize logger
@@ -33,20 +40,6 @@ def create(request):
         messages.error(request, "Profile not found. Please contact support.")
         return redirect('some_fallback_view')  # Redirect to a fallback view in case of error
 
-    # Fetch post counts and recent posts for the user
-    try:
-        total_posts = Post.objects.filter(user=user).count()
-        image_posts = Post.objects.filter(user=user, content_type="image").count()
-        video_posts = Post.objects.filter(user=user, content_type="video").count()
-        text_posts = Post.objects.filter(user=user, content_type="text").count()
-        recent_posts = Post.objects.filter(user=user).order_by('-created_at')[:5]
-        
-        # Handle case when there are no posts
-        latest_post = Post.objects.filter(user=user).latest('created_at')
-    except ObjectDoesNotExist:
-        latest_post = None
-        logger.info(f"No posts found for user {user.username}.")
-
     # Handle form submissions based on post type
     if request.method == 'POST':
         try:
@@ -83,13 +76,20 @@ def create(request):
             logger.error(f"Error while creating post for user {user.username}: {e}")
             messages.error(request, "There was an error while submitting your post. Please try again.")
 
+    # Fetch post counts and recent posts after any new post has been saved
+    stats = get_post_stats(user.pk)
+    recent_posts = list(Post.objects.filter(user=user).order_by('-created_at', '-id')[:5])
+    latest_post = recent_posts[0] if recent_posts else None
+    if latest_post is None:
+        logger.info(f"No posts found for user {user.username}.")
+
     # Pass context data to the template
     context = {
         "user_profile": user_profile,
-        "total_posts": total_posts,
-        "text_posts": text_posts,
-        "image_posts": image_posts,
-        "video_posts": video_posts,
+        "total_posts": stats.total_posts,
+        "text_posts": stats.text_posts,
+        "image_posts": stats.image_posts,
+        "video_posts": stats.video_posts,
         "recent_posts": recent_posts,
         "latest_post": latest_post,
     }
@@ -168,8 +168,8 @@ def delete(request, pk):
         raise PermissionDenied("You are not authorized to delete this post.")
 
     try:
-        # Delete the post and log the action
-        post.delete()
+        # Soft delete the post, the tombstone is purged later by purge_deleted
+        post.soft_delete()
         messages.success(request, "Post deleted successfully.")
         logger.info(f"Post ID {post.pk} deleted by user {request.user.username}.")
     except Exception as e:
@@ -181,3 +181,115 @@ def delete(request, pk):
     return redirect('profile_management:profile', username=request.user.username)
 
 
+def upload_status(session):
+    return {
+        "id": str(session.pk),
+        "offset": session.received,
+        "size": session.size,
+        "complete": session.status == 'complete',
+        "post_id": session.post_id,
+    }
+
+
+@login_required
+def upload_start(request):
+    """
+    Opens a resumable upload for an image or video post. The client then PATCHes
+    the file in chunks to the returned URL, each with an Upload-Offset header.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        session = start_upload(
+            request.user,
+            request.POST.get('content_type'),
+            request.POST.get('filename'),
+            int(request.POST.get('size', 0)),
+            request.POST.get('caption', ''),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    logger.info(f"Upload {session.pk} of {session.size} bytes started by user {request.user.username}.")
+    response = JsonResponse({**upload_status(session), "chunk_size": get_max_chunk_size()}, status=201)
+    response['Location'] = reverse('content_management:upload', args=[session.pk])
+    return response
+
+
+@login_required
+def upload(request, pk):
+    """
+    GET returns the offset to resume from, PATCH appends a chunk at the
+    Upload-Offset header and DELETE cancels the upload. An empty PATCH at the
+    final offset retries creating the post if that failed.
+    """
+    if request.method == 'GET':
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        return JsonResponse({**upload_status(session), "chunk_size": get_max_chunk_size()})
+
+    if request.method == 'DELETE':
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user, status='uploading')
+        part_path(session).unlink(missing_ok=True)
+        session.delete()
+        return HttpResponse(status=204)
+
+    if request.method != 'PATCH':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        # An empty retry may omit Content-Length
+        length = int(request.headers.get('Content-Length') or 0)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+    if length > get_max_chunk_size():
+        return JsonResponse({'error': f'Chunks may be at most {get_max_chunk_size()} bytes'}, status=413)
+
+    session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+    if session.status == 'complete':
+        return JsonResponse(upload_status(session))
+    if offset != session.received:
+        # Tell the client where to resume from
+        return JsonResponse({**upload_status(session), 'error': 'Offset mismatch'}, status=409)
+    if offset + length > session.size:
+        return JsonResponse({'error': 'Chunk exceeds the announced upload size'}, status=400)
+
+    # Streamed outside any transaction, only the offset update below touches the row
+    written = write_chunk(session, offset, request, length)
+    if written and not advance_upload(session, offset, written):
+        session.refresh_from_db()
+        return JsonResponse({**upload_status(session), 'error': 'Offset mismatch'}, status=409)
+
+    if session.received == session.size:
+        try:
+            post = finish_upload(session)
+        except Exception as e:
+            logger.error(f"Error while creating post from upload {session.pk} for user {request.user.username}: {e}")
+            return JsonResponse({'error': 'The upload could not be saved. Please try again.'}, status=500)
+        if post is not None:
+            messages.success(request, f"{session.content_type.capitalize()} post created successfully.")
+
+    return JsonResponse(upload_status(session))
+
+
+@login_required
+def bulk(request):
+    """
+    GET streams the user's posts as NDJSON. POST imports an NDJSON body, one
+    post per line, and reports the records that failed validation by line.
+    """
+    if request.method == 'GET':
+        lines = export_posts(request.user.pk)
+        # ASGI servers buffer sync iterators whole, so they get an async one
+        content = achunked(lines) if isinstance(request, ASGIRequest) else chunked(lines)
+        response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="posts-{request.user.username}.ndjson"'
+        return response
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    # Iterating the request reads the body line by line instead of loading it whole
+    created, rejected, errors = import_posts(request.user, request)
+    return JsonResponse({'created': created, 'rejected': rejected, 'errors': errors})
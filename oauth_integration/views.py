@@ -7,6 +7,7 @@ from django.conf import settings
 from django.utils import timezone
 
 from userauth.models import User, UserProfile, SocialMediaAccount
+from profile_management import sync
 from SLID.secrets import (
     INSTAGRAM_CLIENT_ID, INSTAGRAM_CLIENT_SECRET,
     FACEBOOK_CLIENT_ID, FACEBOOK_CLIENT_SECRET
@@ -41,6 +42,8 @@ def create_social_media_account(user, platform, token_data):
         account.is_linked = True
         account.save()
 
+    # Fetch the platform data in the background instead of on the next profile view
+    sync.enqueue(account)
     return account
 
 
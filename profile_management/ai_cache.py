@@ -0,0 +1,154 @@
+"""
+Response cache for the AI profile assistant.
+Answers are keyed on the user, the normalized question and the user's profile
+cache version, so any change to their posts, connections or linked accounts
+(see profile_management.signals) invalidates them. When
+AI_CACHE_SIMILARITY_THRESHOLD is set, questions that miss the exact cache are
+also matched against a bounded in-process index of question embeddings, so
+rephrasings of an earlier question skip the agent run as well.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from .ai_engine import ai_engine
+from .cache import get_profile_cache, profile_cache_version
+
+logger = logging.getLogger(__name__)
+
+NON_WORD_CHARS = re.compile(r"[^\w\s]")
+
+
+def get_ai_cache_timeout():
+    return getattr(settings, 'AI_CACHE_TIMEOUT', 600)
+
+
+def get_similarity_threshold():
+    """Minimum cosine similarity for a semantic hit, or None when semantic lookup is disabled"""
+    return getattr(settings, 'AI_CACHE_SIMILARITY_THRESHOLD', None)
+
+
+def normalize_query(query):
+    """Lowercase a question and strip punctuation and repeated whitespace"""
+    return ' '.join(NON_WORD_CHARS.sub(' ', query.lower()).split())
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SemanticIndex:
+    """
+    LRU of (question embedding, answer) pairs per user with a TTL.
+    Entries remember the profile version they were answered at and never match
+    another version, so invalidation needs no extra bookkeeping.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_user = {}
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        questions = self._by_user.get(key[0])
+        if questions is not None:
+            questions.discard(key[1])
+            if not questions:
+                del self._by_user[key[0]]
+
+    def add(self, user_id, version, question, vector, answer, timeout):
+        key = (user_id, question)
+        with self._lock:
+            self._entries[key] = (version, vector, answer, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, set()).add(question)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def search(self, user_id, version, vector, threshold):
+        """Answer of the most similar live question above the threshold, or None"""
+        now = time.monotonic()
+        best_key, best_score = None, threshold
+        with self._lock:
+            for question in list(self._by_user.get(user_id, ())):
+                key = (user_id, question)
+                entry_version, entry_vector, _, expires = self._entries[key]
+                if entry_version != version or expires < now:
+                    self._discard(key)
+                    continue
+                score = cosine_similarity(vector, entry_vector)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+
+semantic_index = SemanticIndex(getattr(settings, 'AI_CACHE_MAX_ENTRIES', 1000))
+
+
+def _embed(question):
+    try:
+        return ai_engine.embed(question)
+    except Exception as e:
+        logger.warning(f"Embedding AI question failed, skipping semantic cache: {e!r}")
+        return None
+
+
+class CachedQuestion:
+    """Cache lookup for one question, split in two steps so async callers can produce the answer themselves"""
+
+    def __init__(self, user_id, query):
+        self.user_id = user_id
+        self.question = normalize_query(query)
+        self.version = profile_cache_version(user_id)
+        self.key = f"ai:{user_id}:{self.version}:{hashlib.sha256(self.question.encode()).hexdigest()}"
+        self.vector = None
+
+    def get(self):
+        """Cached answer to the question or a similar one, or None"""
+        cache = get_profile_cache()
+        answer = cache.get(self.key)
+        if answer is not None:
+            return answer
+
+        threshold = get_similarity_threshold()
+        if threshold is not None:
+            self.vector = _embed(self.question)
+        if self.vector is not None:
+            answer = semantic_index.search(self.user_id, self.version, self.vector, threshold)
+            if answer is not None:
+                cache.set(self.key, answer, get_ai_cache_timeout())
+        return answer
+
+    def set(self, answer):
+        get_profile_cache().set(self.key, answer, get_ai_cache_timeout())
+        if self.vector is not None:
+            semantic_index.add(self.user_id, self.version, self.question, self.vector, answer, get_ai_cache_timeout())
+
+
+def cached_ai_answer(user_id, query, builder):
+    """Return the answer to a user's question from the cache, calling builder() on a miss"""
+    cached = CachedQuestion(user_id, query)
+    answer = cached.get()
+    if answer is None:
+        answer = builder()
+        cached.set(answer)
+    return answer
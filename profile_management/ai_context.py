@@ -0,0 +1,158 @@
+"""
+Compact per-user context for AI prompts.
+The context is split in sections (profile, activity, platforms and connections)
+that are cached independently. The signals in profile_management.signals drop
+only the sections affected by a changed row, so a new post rebuilds the activity
+section while the rest stays cached. Reading the context is a single get_many.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from userauth.models import UserProfile, SocialMediaAccount, SocialMediaItem, Connection, Post
+from .cache import get_profile_cache
+
+RECENT_POSTS = 5
+TOP_CONNECTIONS = 10
+SUMMARY_LENGTH = 80
+
+
+def get_ai_context_timeout():
+    return getattr(settings, 'AI_CONTEXT_TIMEOUT', 60 * 60)
+
+
+def get_ai_context_budget():
+    """Approximate number of prompt tokens the rendered context may use"""
+    return getattr(settings, 'AI_CONTEXT_TOKEN_BUDGET', 300)
+
+
+def _key(user_id, section):
+    return f"ai-context:{user_id}:{section}"
+
+
+def summarize(text, length=SUMMARY_LENGTH):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= length else text[:length - 3] + '...'
+
+
+def build_profile_section(user_id):
+    user_profile = UserProfile.objects.select_related('user').filter(user_id=user_id).first()
+    if user_profile is None:
+        return {}
+    return {
+        'username': user_profile.user.username,
+        'full_name': user_profile.fullName,
+        'bio': summarize(user_profile.bio, 200),
+        'verified': user_profile.verified,
+        'joined': user_profile.created_at.date().isoformat(),
+    }
+
+
+def build_activity_section(user_id):
+    now = timezone.now()
+    posts = Post.objects.filter(user_id=user_id)
+    counts = posts.aggregate(
+        total=Count('id'),
+        last_7_days=Count('id', filter=Q(created_at__gte=now - timedelta(days=7))),
+        last_30_days=Count('id', filter=Q(created_at__gte=now - timedelta(days=30))),
+    )
+    by_type = dict(posts.order_by().values_list('content_type').annotate(Count('id')))
+    recent = posts.order_by('-created_at', '-id').only('content_type', 'content', 'created_at')[:RECENT_POSTS]
+    return {
+        'posts': counts,
+        'posts_by_type': by_type,
+        'recent_posts': [
+            {'type': post.content_type, 'date': post.created_at.date().isoformat(), 'summary': summarize(post.content)}
+            for post in recent
+        ],
+    }
+
+
+def build_platforms_section(user_id):
+    platforms = list(
+        SocialMediaAccount.objects.filter(user_id=user_id, is_linked=True).values_list('platform', flat=True)
+    )
+    items = dict(
+        SocialMediaItem.objects.filter(user_id=user_id).order_by().values_list('platform').annotate(Count('id'))
+    )
+    return {'platforms': {platform: items.get(platform, 0) for platform in platforms}}
+
+
+def build_connections_section(user_id):
+    connections = Connection.objects.filter(user_id=user_id)
+    top = connections.select_related('connected_user').order_by('-created_at')[:TOP_CONNECTIONS]
+    return {
+        'connections': connections.count(),
+        'top_connections': [connection.connected_user.username for connection in top],
+    }
+
+
+SECTION_BUILDERS = {
+    'profile': build_profile_section,
+    'activity': build_activity_section,
+    'platforms': build_platforms_section,
+    'connections': build_connections_section,
+}
+
+
+def get_ai_context(user_id):
+    """Return a user's AI context, rebuilding only the sections missing from the cache"""
+    cache = get_profile_cache()
+    keys = {section: _key(user_id, section) for section in SECTION_BUILDERS}
+    cached = cache.get_many(keys.values())
+
+    context, missing = {}, {}
+    for section, key in keys.items():
+        if key in cached:
+            context[section] = cached[key]
+        else:
+            context[section] = missing[key] = SECTION_BUILDERS[section](user_id)
+    if missing:
+        cache.set_many(missing, get_ai_context_timeout())
+    return context
+
+
+def invalidate_ai_context(user_id, *sections):
+    """Drop cached sections of a user's context, all of them when none are given"""
+    get_profile_cache().delete_many([_key(user_id, section) for section in sections or SECTION_BUILDERS])
+
+
+def render_ai_context(context, budget=None):
+    """
+    Render the context as prompt lines, most important first, stopping at the token
+    budget (estimated at four characters per token).
+    """
+    profile = context['profile']
+    activity = context['activity']
+    connections = context['connections']
+    platforms = context['platforms']['platforms']
+
+    lines = [
+        f"User: {profile['username']}" + (f" ({profile['full_name']})" if profile['full_name'] else '')
+        + (", verified" if profile['verified'] else '') + f", joined {profile['joined']}",
+        f"Posts: {activity['posts']['total']} total, {activity['posts']['last_7_days']} in the last 7 days, "
+        f"{activity['posts']['last_30_days']} in the last 30 days",
+        f"Connections: {connections['connections']}",
+        "Linked platforms: " + (
+            ', '.join(f"{platform} ({count} items)" for platform, count in platforms.items()) or 'none'
+        ),
+    ]
+    if activity['posts_by_type']:
+        lines.append("Posts by type: " + ', '.join(f"{kind} {count}" for kind, count in activity['posts_by_type'].items()))
+    if connections['top_connections']:
+        lines.append("Recent connections: " + ', '.join(connections['top_connections']))
+    if profile['bio']:
+        lines.append(f"Bio: {profile['bio']}")
+    lines.extend(f"Recent {post['type']} post on {post['date']}: {post['summary']}" for post in activity['recent_posts'])
+
+    remaining = (budget or get_ai_context_budget()) * 4
+    rendered = []
+    for line in lines:
+        remaining -= len(line) + 1
+        if remaining < 0:
+            break
+        rendered.append(line)
+    return '\n'.join(rendered)
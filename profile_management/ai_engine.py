@@ -0,0 +1,157 @@
+"""
+Process-wide engine behind the AI profile assistant.
+Reflecting the database schema and creating the LLM and SQL agent is expensive,
+so it happens once per process on first use. The resulting objects only hold a
+pooled SQLAlchemy engine and a pooled OpenAI HTTP client, both of which are safe
+to share between requests and threads.
+"""
+
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from langchain_community.agent_toolkits import create_sql_agent
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from sqlalchemy.engine import URL
+
+from userauth.models import UserProfile, SocialMediaAccount, SocialMediaItem, Connection, Post
+from .ai_sql import SandboxedSQLDatabase, ai_user_scope, get_statement_timeout
+
+logger = logging.getLogger(__name__)
+
+# Only these tables are reflected and exposed to the agent
+AI_MODELS = (UserProfile, SocialMediaAccount, SocialMediaItem, Connection, Post)
+
+
+def get_database_url():
+    """SQLAlchemy URL of the database queried by the agent, defaulting to Django's own database"""
+    url = getattr(settings, 'AI_DATABASE_URL', None) or os.getenv('DATABASE_URL')
+    if url:
+        return url
+    db = settings.DATABASES['default']
+    if not settings.DEBUG:
+        logger.warning("AI_DATABASE_URL is not set, the AI agent uses Django's own database credentials. "
+                       "Point it at a read-only role that can only read the tables in profile_management.ai_sql.SCOPES.")
+    if db['ENGINE'].endswith('sqlite3'):
+        return f"sqlite:///{db['NAME']}"
+    host = db.get('HOST') or None
+    # Unix socket directories are passed as a query parameter
+    socket = host if host and host.startswith('/') else None
+    return URL.create(
+        'postgresql+psycopg2',
+        username=db.get('USER') or None,
+        password=db.get('PASSWORD') or None,
+        host=None if socket else host,
+        port=int(db['PORT']) if db.get('PORT') else None,
+        database=db.get('NAME'),
+        query={'host': socket} if socket else {},
+    ).render_as_string(hide_password=False)
+
+
+def get_ai_tables():
+    return [model._meta.db_table for model in AI_MODELS]
+
+
+class AIEngine:
+    """Lazily built, shared SQL database, LLM client, agent and embeddings client"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agent = None
+        self._embeddings = None
+
+    def build_database(self):
+        engine_args = {
+            'pool_pre_ping': True,
+            'pool_recycle': 300,
+        }
+        if not str(get_database_url()).startswith('sqlite'):
+            engine_args['pool_size'] = getattr(settings, 'AI_DATABASE_POOL_SIZE', 5)
+            # Session defaults backing up the per-query limits of the sandbox
+            engine_args['connect_args'] = {
+                'options': f"-c default_transaction_read_only=on -c statement_timeout={int(get_statement_timeout())}"
+            }
+        return SandboxedSQLDatabase.from_uri(
+            get_database_url(),
+            engine_args=engine_args,
+            include_tables=get_ai_tables(),
+            sample_rows_in_table_info=getattr(settings, 'AI_SAMPLE_ROWS', 0),
+        )
+
+    def build_llm(self):
+        return ChatOpenAI(
+            model=getattr(settings, 'AI_MODEL', 'gpt-3.5-turbo'),
+            temperature=0.7,
+            api_key=os.getenv('OPENAI_API_KEY'),
+            timeout=getattr(settings, 'AI_REQUEST_TIMEOUT', 30),
+            max_retries=2,
+        )
+
+    def build_agent(self):
+        logger.info("Building AI engine.")
+        # Tool calling agents keep reasoning out of the message content, so content tokens are answer tokens
+        return create_sql_agent(
+            self.build_llm(), db=self.build_database(), agent_type='openai-tools', verbose=settings.DEBUG
+        )
+
+    def build_embeddings(self):
+        return OpenAIEmbeddings(
+            model=getattr(settings, 'AI_EMBEDDING_MODEL', 'text-embedding-3-small'),
+            api_key=os.getenv('OPENAI_API_KEY'),
+            timeout=getattr(settings, 'AI_REQUEST_TIMEOUT', 30),
+            max_retries=2,
+        )
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            with self._lock:
+                if self._agent is None:
+                    self._agent = self.build_agent()
+        return self._agent
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.build_embeddings()
+        return self._embeddings
+
+    def run(self, query, user_id):
+        """Answer a natural language query, reading only the given user's rows"""
+        with ai_user_scope(user_id):
+            return self.agent.invoke({'input': query})['output']
+
+    async def astream(self, query, user_id):
+        """
+        Answer a natural language query incrementally, yielding ``('step', {...})``
+        for every tool the agent calls and ``('token', text)`` for every answer token.
+        Like run, the agent only reads the given user's rows.
+        """
+        # The first call reflects the database, keep that off the event loop
+        agent = await sync_to_async(lambda: self.agent, thread_sensitive=False)()
+        with ai_user_scope(user_id):
+            async for event in agent.astream_events({'input': query}, version='v1'):
+                if event['event'] == 'on_tool_start':
+                    yield 'step', {'tool': event['name'], 'input': event['data'].get('input')}
+                elif event['event'] == 'on_chat_model_stream':
+                    content = event['data']['chunk'].content
+                    if content:
+                        yield 'token', content
+
+    def embed(self, text):
+        """Embedding vector of a piece of text"""
+        return self.embeddings.embed_query(text)
+
+    def reset(self):
+        """Drop the cached components, e.g. after a schema or settings change"""
+        with self._lock:
+            self._agent = None
+            self._embeddings = None
+
+
+ai_engine = AIEngine()
@@ -0,0 +1,217 @@
+"""
+Fast path for the AI assistant.
+Common questions about a user's own posts, connections and linked accounts are
+matched against known templates and answered with a direct ORM query, skipping
+the LLM agent entirely. Everything else falls through to the agent. Hits and
+misses are counted in the cache so the share of fast path traffic can be
+checked with ``manage.py ai_router_stats``.
+"""
+
+from datetime import timedelta
+import logging
+import re
+
+from django.db.models import Count
+from django.utils import timezone
+
+from userauth.models import SocialMediaAccount, Connection, Post, User
+from . import graph
+from .ai_cache import normalize_query
+from .cache import get_profile_cache
+
+logger = logging.getLogger(__name__)
+
+# Connections listed in an answer before the rest are summarized as a count
+MAX_LISTED_CONNECTIONS = 20
+
+# People suggested in an answer to "who should I connect with"
+MAX_SUGGESTIONS = 5
+
+POST_TYPES = r"(?:(?P<type>image|photo|picture|video|text)\s+)?"
+PERIOD = r"(?:\s+(?P<period>today|this week|this month|this year|in the last (?P<days>\d{1,4}) days|in total|so far|ever))?"
+
+INTENTS = []
+
+
+def intent(pattern, raw=False):
+    """
+    Register a handler for questions matching the regular expression. Patterns
+    match the normalized question, or with raw=True the question as asked with
+    its whitespace collapsed, for names that normalizing would mangle.
+    """
+    def register(handler):
+        flags = re.IGNORECASE if raw else 0
+        INTENTS.append((handler.__name__, re.compile(rf"^(?:{pattern})$", flags), handler, raw))
+        return handler
+    return register
+
+
+def period_start(match):
+    """Start of the period named in a question, or None for all time"""
+    now = timezone.localtime()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    period = match.groupdict().get('period') or ''
+    if period == 'today':
+        return today
+    if period == 'this week':
+        return today - timedelta(days=today.weekday())
+    if period == 'this month':
+        return today.replace(day=1)
+    if period == 'this year':
+        return today.replace(month=1, day=1)
+    if match.groupdict().get('days'):
+        return now - timedelta(days=int(match.group('days')))
+    return None
+
+
+def describe_period(match):
+    period = match.groupdict().get('period')
+    return f" {period}" if period and period not in ('in total', 'so far', 'ever') else ''
+
+
+@intent(rf"how many {POST_TYPES}posts (?:did|have) i (?:made|make|posted|post|created|create|shared|share){PERIOD}")
+def post_count(user_id, match):
+    posts = Post.objects.filter(user_id=user_id)
+    content_type = {'photo': 'image', 'picture': 'image'}.get(match.group('type'), match.group('type'))
+    if content_type:
+        posts = posts.filter(content_type=content_type)
+    start = period_start(match)
+    if start:
+        posts = posts.filter(created_at__gte=start)
+    count = posts.count()
+    kind = f"{content_type} " if content_type else ''
+    return f"You made {count} {kind}post{'' if count == 1 else 's'}{describe_period(match)}."
+
+
+@intent(r"(?:how many posts (?:did i make |have i made )?(?:of each|per|by) (?:content )?type|what (?:kind|type|types|kinds) of posts (?:did i make|have i made|do i have))")
+def posts_by_type(user_id, match):
+    counts = dict(
+        Post.objects.filter(user_id=user_id).order_by()
+        .values_list('content_type').annotate(Count('id'))
+    )
+    if not counts:
+        return "You haven't made any posts yet."
+    return "Your posts by type: " + ', '.join(f"{kind} {count}" for kind, count in sorted(counts.items())) + "."
+
+
+@intent(r"how many (?:connections|friends) do i have|how many (?:people|users|members) am i connected (?:to|with)")
+def connection_count(user_id, match):
+    count = graph.degree(user_id)['connections']
+    return f"You have {count} connection{'' if count == 1 else 's'}."
+
+
+@intent(r"how many (?:people|users|members) (?:are connected (?:to|with) me|have connected (?:to|with) me|follow me)")
+def connected_to_count(user_id, match):
+    count = graph.degree(user_id)['connected_to']
+    return f"{count} {'person is' if count == 1 else 'people are'} connected to you."
+
+
+def usernames(user_ids):
+    return dict(User.objects.filter(pk__in=user_ids).values_list('pk', 'username'))
+
+
+# Characters Django allows in usernames
+USERNAME = r"@?(?P<username>[\w.@+-]+?)(?P<trailing>[.?!]*)\s*[.?!]*"
+
+
+@intent(rf"(?:how many |which |what |who are (?:our |my )?)?mutual (?:connections|friends) (?:do i have |have i got )?with {USERNAME}", raw=True)
+def mutual_connections(user_id, match):
+    username, trailing = match.group('username'), match.group('trailing')
+    # Trailing punctuation ends the sentence unless it is part of an existing username
+    candidates = [username + trailing[:end] for end in range(len(trailing), -1, -1)]
+    found = dict(User.objects.filter(username__in=candidates).values_list('username', 'pk'))
+    username = next((candidate for candidate in candidates if candidate in found), username)
+    other = found.get(username)
+    if other is None:
+        return f"There is no member called {username}."
+    mutual = usernames(graph.mutual_connections(user_id, other))
+    if not mutual:
+        return f"You have no mutual connections with {username}."
+    names = sorted(mutual.values())
+    listed = ', '.join(names[:MAX_LISTED_CONNECTIONS]) + (f" and {len(names) - MAX_LISTED_CONNECTIONS} more" if len(names) > MAX_LISTED_CONNECTIONS else '')
+    return f"You have {len(names)} mutual connection{'' if len(names) == 1 else 's'} with {username}: {listed}."
+
+
+@intent(r"who should i (?:connect|link) with|(?:who are )?(?:people|users|members) i (?:may|might|could) know|(?:suggest|recommend) (?:some )?(?:people|users|members|connections)(?: (?:for me )?to connect with)?")
+def suggested_connections(user_id, match):
+    suggested = graph.suggestions(user_id, limit=MAX_SUGGESTIONS)
+    names = usernames([suggested_id for suggested_id, _ in suggested])
+    people = [f"{names[suggested_id]} ({mutual} mutual)" for suggested_id, mutual in suggested if suggested_id in names]
+    if not people:
+        return "I have no suggestions yet, connect with a few people first and check back."
+    return f"People you may know: {', '.join(people)}."
+
+
+@intent(r"who am i connected (?:to|with)|(?:list|show|who are) (?:all )?my (?:connections|friends)")
+def connection_list(user_id, match):
+    connections = Connection.objects.filter(user_id=user_id)
+    usernames = list(
+        connections.order_by('-created_at').values_list('connected_user__username', flat=True)[:MAX_LISTED_CONNECTIONS + 1]
+    )
+    if not usernames:
+        return "You aren't connected to anyone yet."
+    if len(usernames) > MAX_LISTED_CONNECTIONS:
+        rest = connections.count() - MAX_LISTED_CONNECTIONS
+        return f"You are connected to {', '.join(usernames[:MAX_LISTED_CONNECTIONS])} and {rest} more."
+    return f"You are connected to {', '.join(usernames)}."
+
+
+@intent(r"(?:which|what) (?:platforms|accounts|social media accounts|social media) (?:are|have i|did i) (?:linked|connected|link|connect)|(?:which|what) (?:platforms|accounts) do i have (?:linked|connected)")
+def linked_platforms(user_id, match):
+    platforms = sorted(
+        SocialMediaAccount.objects.filter(user_id=user_id, is_linked=True).values_list('platform', flat=True)
+    )
+    if not platforms:
+        return "You haven't linked any social media accounts yet."
+    return f"Your linked platforms are {', '.join(platforms)}."
+
+
+@intent(r"when (?:was|were|did) (?:my )?(?:(?P<platform>instagram|facebook|youtube|linkedin|google|x|tiktok) )?(?:data |account |accounts )?(?:last )?(?:synced|sync|updated|update|refreshed|refresh)(?: last)?")
+def last_sync(user_id, match):
+    accounts = SocialMediaAccount.objects.filter(user_id=user_id, is_linked=True)
+    if match.group('platform'):
+        accounts = accounts.filter(platform=match.group('platform'))
+    synced = accounts.exclude(last_sync__isnull=True).order_by('-last_sync').values_list('platform', 'last_sync').first()
+    if synced is None:
+        return "None of your linked accounts have been synced yet."
+    platform, synced_at = synced
+    return f"Your {platform} data was last synced on {timezone.localtime(synced_at):%Y-%m-%d at %H:%M}."
+
+
+def _count(name):
+    cache = get_profile_cache()
+    key = f"ai-router:{name}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, 1, None)
+
+
+def route(user_id, query):
+    """Answer a question on the fast path, or return None if it needs the agent"""
+    question = normalize_query(query)
+    raw_question = ' '.join(query.split())
+    for name, pattern, handler, raw in INTENTS:
+        match = pattern.match(raw_question if raw else question)
+        if match:
+            try:
+                answer = handler(user_id, match)
+            except Exception as e:
+                # A question the template matched but the handler cannot answer goes to the agent
+                logger.exception(f"AI fast path {name} failed: {e!r}")
+                break
+            _count('hits')
+            _count(f"hits:{name}")
+            logger.info(f"AI question answered by the {name} fast path.")
+            return answer
+    _count('misses')
+    return None
+
+
+def router_stats():
+    """Fast path hit and miss counters, overall and per intent"""
+    names = ['hits', 'misses'] + [f"hits:{name}" for name, *_ in INTENTS]
+    counts = get_profile_cache().get_many([f"ai-router:{name}" for name in names])
+    return {name: counts.get(f"ai-router:{name}", 0) for name in names}
@@ -0,0 +1,250 @@
+"""
+Sandboxed SQL execution for the AI agent.
+Every query the agent runs is checked to be a single SELECT, scoped to the rows
+of the user asking the question, capped with a LIMIT and, on PostgreSQL,
+rejected when its planned cost is too high. It then runs in a read-only
+transaction with a statement timeout, so one bad prompt cannot write data or
+hold the database for everyone else.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+
+from django.conf import settings
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+import sqlparse
+from sqlparse.sql import Function, Identifier, IdentifierList, Parenthesis
+from sqlparse.tokens import CTE, Comment, Name, Punctuation, String
+
+from userauth.models import UserProfile, SocialMediaAccount, SocialMediaItem, Connection, Post
+
+logger = logging.getLogger(__name__)
+
+# User whose rows the agent may read, set for the duration of an agent run
+current_ai_user = ContextVar('current_ai_user', default=None)
+
+# Row filter and hidden columns of every table exposed to the agent, deleted rows are never visible
+SCOPES = {
+    Post: ("user_id = {user_id} AND NOT is_deleted", ()),
+    SocialMediaItem: ("user_id = {user_id}", ()),
+    SocialMediaAccount: ("user_id = {user_id}", ('token', 'token_type')),
+    Connection: ("(user_id = {user_id} OR connected_user_id = {user_id}) AND NOT is_deleted", ()),
+    UserProfile: (
+        "NOT is_deleted AND (user_id = {user_id} OR user_id IN "
+        "(SELECT connected_user_id FROM {connection} WHERE user_id = {user_id} AND NOT is_deleted))",
+        ('search_text', 'search_vector'),
+    ),
+}
+
+
+# Functions that run SQL given as a string, reach other databases or read server files
+BLOCKED_FUNCTIONS = {
+    'query_to_xml', 'query_to_xmlschema', 'query_to_xml_and_xmlschema', 'cursor_to_xml',
+    'table_to_xml', 'table_to_xmlschema', 'table_to_xml_and_xmlschema',
+    'schema_to_xml', 'schema_to_xmlschema', 'schema_to_xml_and_xmlschema',
+    'database_to_xml', 'database_to_xmlschema', 'database_to_xml_and_xmlschema',
+    'current_setting', 'set_config', 'load_extension', 'readfile', 'writefile', 'fts3_tokenizer',
+}
+BLOCKED_FUNCTION_PREFIXES = ('pg_', 'lo_', 'dblink')
+# Schemas a qualified name could use to reach the unscoped tables behind the CTEs
+SCHEMAS = {'main', 'temp', 'public', 'pg_catalog', 'information_schema'}
+
+
+def _is_table_keyword(token):
+    return token.is_keyword and (token.normalized == 'FROM' or token.normalized.endswith('JOIN'))
+
+
+def _from_item(token):
+    """Table references of the item following FROM or JOIN, as (schema, name), with None for functions"""
+    if isinstance(token, IdentifierList):
+        for item in token.get_identifiers():
+            yield from _from_item(item)
+    elif isinstance(token, Parenthesis):
+        yield from table_references(token)
+    elif isinstance(token, Function):
+        yield None, None
+    elif isinstance(token, Identifier):
+        first = token.token_first(skip_cm=True)
+        if isinstance(first, Parenthesis):
+            yield from table_references(first)
+        elif isinstance(first, Function):
+            yield None, None
+        else:
+            yield token.get_parent_name(), token.get_real_name()
+    else:
+        # Anything else, e.g. LATERAL or a keyword used as a name, is reported as is and rejected
+        yield None, token.value
+
+
+def table_references(token_list):
+    """Every table a statement reads from, including those of subqueries and CTEs"""
+    expect_table = after_table = False
+    for token in token_list.tokens:
+        if token.is_whitespace or token.ttype in Comment:
+            continue
+        if expect_table:
+            expect_table, after_table = False, True
+            yield from _from_item(token)
+            continue
+        if after_table and token.ttype in Punctuation and token.value == ',':
+            # Comma separated tables sqlparse did not group into one list
+            expect_table = True
+            continue
+        after_table = False
+        if _is_table_keyword(token):
+            expect_table = True
+        elif token.is_group:
+            yield from table_references(token)
+
+
+def cte_names(statement):
+    """Names of the common table expressions a statement defines itself"""
+    names = set()
+    tokens = [token for token in statement.tokens if not token.is_whitespace]
+    for token, following in zip(tokens, tokens[1:]):
+        if token.ttype in CTE:
+            items = following.get_identifiers() if isinstance(following, IdentifierList) else [following]
+            names.update(item.token_first(skip_cm=True).value for item in items if isinstance(item, Identifier))
+    return names
+
+
+def function_names(token_list):
+    for token in token_list.tokens:
+        if isinstance(token, Function):
+            yield (token.get_name() or '').lower()
+        if token.is_group:
+            yield from function_names(token)
+
+
+def get_statement_timeout():
+    """Milliseconds an agent query may run"""
+    return getattr(settings, 'AI_SQL_STATEMENT_TIMEOUT', 5000)
+
+
+def get_max_rows():
+    return getattr(settings, 'AI_SQL_MAX_ROWS', 100)
+
+
+def get_max_cost():
+    """Highest planner cost estimate accepted on PostgreSQL"""
+    return getattr(settings, 'AI_SQL_MAX_COST', 10000)
+
+
+@contextmanager
+def ai_user_scope(user_id):
+    """Scope the agent's queries to a user's rows"""
+    token = current_ai_user.set(user_id)
+    try:
+        yield
+    finally:
+        try:
+            current_ai_user.reset(token)
+        except ValueError:
+            # An async generator finalized from another context, which is discarded anyway
+            pass
+
+
+class QueryRejected(SQLAlchemyError):
+    """
+    A query the sandbox refuses to run. It is a SQLAlchemyError so the agent's
+    query tool reports it back to the model instead of aborting the run.
+    """
+
+
+class SandboxedSQLDatabase(SQLDatabase):
+    """SQLDatabase that only runs bounded, read-only, user scoped SELECT queries"""
+
+    def _table(self, table):
+        # SQLite treats a CTE referencing a table of the same name as circular
+        return f"main.{table}" if self.dialect == 'sqlite' else table
+
+    def scope_query(self, command, user_id):
+        """Validate a query and wrap it in user scoped CTEs and a LIMIT"""
+        statements = [statement for statement in sqlparse.parse(command) if statement.token_first(skip_cm=True)]
+        if len(statements) != 1:
+            raise QueryRejected("Only a single SQL statement can be run.")
+        if statements[0].get_type() != 'SELECT':
+            raise QueryRejected("Only SELECT queries are allowed.")
+        self.check_references(statements[0])
+        query = str(statements[0]).strip().rstrip(';')
+
+        connection_table = self._table(Connection._meta.db_table)
+        scopes = []
+        for model, (condition, hidden) in SCOPES.items():
+            columns = ', '.join(
+                f'"{field.column}"' for field in model._meta.concrete_fields if field.name not in hidden
+            )
+            condition = condition.format(user_id=int(user_id), connection=connection_table)
+            scopes.append(
+                f"{model._meta.db_table} AS (SELECT {columns} FROM {self._table(model._meta.db_table)} WHERE {condition})"
+            )
+        return f"WITH {', '.join(scopes)} SELECT * FROM ({query}) AS ai_query LIMIT {get_max_rows()}"
+
+    def check_references(self, statement):
+        """
+        Reject tables the scoping CTEs do not cover: schema qualified names would
+        bypass them and other tables are not scoped at all.
+        """
+        allowed = {model._meta.db_table for model in SCOPES}
+        defined = {name.lower() for name in cte_names(statement)}
+        for schema, name in table_references(statement):
+            if name is None:
+                raise QueryRejected("Table functions cannot be queried.")
+            if schema is not None:
+                raise QueryRejected(f"Use unqualified table names, {schema}.{name} cannot be queried.")
+            if name not in allowed and name.lower() not in defined:
+                raise QueryRejected(f"Table {name} cannot be queried. Available tables: {', '.join(sorted(allowed))}.")
+        for name in function_names(statement):
+            if name in BLOCKED_FUNCTIONS or name.startswith(BLOCKED_FUNCTION_PREFIXES):
+                raise QueryRejected(f"Function {name} cannot be used.")
+        # Names parsed as something other than a table reference still may not reach other tables
+        restricted = set(getattr(self, '_all_tables', ())) - allowed
+        tokens = [token for token in statement.flatten() if not token.is_whitespace]
+        for token, following in zip(tokens, tokens[1:] + [None]):
+            if token.ttype not in Name and token.ttype not in String.Symbol:
+                continue
+            name = token.value.strip('"`[]')
+            if name in restricted:
+                raise QueryRejected(f"Table {name} cannot be queried.")
+            if name.lower() in SCHEMAS and following is not None and following.value == '.':
+                raise QueryRejected(f"Use unqualified table names, schema {name} cannot be used.")
+
+    def check_cost(self, connection, query):
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+        cost = plan[0]['Plan']['Total Cost']
+        if cost > get_max_cost():
+            raise QueryRejected(
+                f"Query is too expensive (estimated cost {cost:.0f}, limit {get_max_cost()}). "
+                "Filter on indexed columns or aggregate the data instead."
+            )
+
+    def _execute(self, command, fetch='all', *, parameters=None, execution_options=None):
+        user_id = current_ai_user.get()
+        if user_id is None:
+            raise QueryRejected("Queries can only be run on behalf of a user.")
+        if fetch not in ('all', 'one'):
+            raise QueryRejected("Only 'all' and 'one' fetches are supported.")
+        if not isinstance(command, str):
+            command = str(command)
+
+        query = self.scope_query(command, user_id)
+        with self._engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                if self.dialect == 'postgresql':
+                    connection.execute(text("SET TRANSACTION READ ONLY"))
+                    connection.execute(text(f"SET LOCAL statement_timeout = {int(get_statement_timeout())}"))
+                    self.check_cost(connection, query)
+                elif self.dialect == 'sqlite':
+                    connection.exec_driver_sql("PRAGMA query_only = ON")
+
+                cursor = connection.execute(text(query), parameters or {}, execution_options=execution_options or {})
+                rows = cursor.fetchall() if fetch == 'all' else cursor.fetchmany(1)
+                return [row._asdict() for row in rows]
+            finally:
+                transaction.rollback()
+                if self.dialect == 'sqlite':
+                    connection.exec_driver_sql("PRAGMA query_only = OFF")
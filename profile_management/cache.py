@@ -0,0 +1,66 @@
+"""
+Versioned per-profile cache for the members-page profile view.
+Every cached entry for a profile embeds the profile's current version number,
+so bumping the version (from the signals in profile_management.signals)
+invalidates the whole profile at once without having to know its keys.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_profile_cache():
+    """Cache backend used for profile data, configurable through settings.PROFILE_CACHE_ALIAS"""
+    return caches[getattr(settings, 'PROFILE_CACHE_ALIAS', 'default')]
+
+
+def get_profile_cache_timeout():
+    return getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300)
+
+
+def _version_key(user_id):
+    return f"profile:{user_id}:version"
+
+
+def _new_version():
+    # Time based so an evicted version never reuses the number of an older cached entry
+    return time.time_ns()
+
+
+def profile_cache_version(user_id):
+    """Current cache version of a user's profile"""
+    cache = get_profile_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = _new_version()
+        cache.add(_version_key(user_id), version, None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_profile_version(user_id):
+    """Invalidate everything cached for a user's profile"""
+    cache = get_profile_cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), _new_version(), None)
+
+
+def bump_profile_versions(user_ids):
+    """Invalidate everything cached for several profiles with one cache write"""
+    version = _new_version()
+    get_profile_cache().set_many({_version_key(user_id): version for user_id in user_ids}, None)
+
+
+def cached_profile_data(user_id, section, builder, timeout=None):
+    """Return a section of a profile's data from the cache, building and storing it on a miss"""
+    cache = get_profile_cache()
+    key = f"profile:{user_id}:{profile_cache_version(user_id)}:{section}"
+    data = cache.get(key)
+    if data is None:
+        data = builder()
+        cache.set(key, data, timeout or get_profile_cache_timeout())
+    return data
@@ -0,0 +1,110 @@
+"""
+Connection state changes as single statements.
+Connecting is one INSERT ... ON CONFLICT DO UPDATE that creates the row or
+revives a soft deleted one, and disconnecting is one UPDATE, so concurrent
+clicks cannot race between a read and a write. Both return the users whose
+connection actually changed, which moves the profile counters in the same
+transaction. Many connections are changed with one such statement per batch.
+Neither sends model signals, so the caches the connection signals maintain are
+updated here, once per batch.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from userauth.models import Connection, User
+from .ai_context import invalidate_ai_context
+from . import feed, graph
+from .cache import bump_profile_versions
+from .counters import adjust_counter
+
+
+def get_bulk_batch_size():
+    return getattr(settings, 'CONNECTION_BULK_BATCH_SIZE', 1000)
+
+
+def connections_changed(user_id, connected_user_ids, connected):
+    """Update the caches depending on a user's connections once the change commits"""
+    transaction.on_commit(lambda: bump_profile_versions([user_id, *connected_user_ids]))
+    transaction.on_commit(lambda: invalidate_ai_context(user_id, 'connections'))
+    transaction.on_commit(lambda: graph.update_connections(user_id, connected_user_ids, connected))
+    transaction.on_commit(lambda: feed.invalidate_feed(user_id))
+    transaction.on_commit(lambda: feed.update_heavy_posters(connected_user_ids))
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _upsert(user_id, connected_user_ids):
+    """Connect a user to others, returning the ids of those not connected before"""
+    quote = connection.ops.quote_name
+    table = quote(Connection._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = ', '.join(['(%s, %s, %s, NULL, %s)'] * len(connected_user_ids))
+    params = []
+    for connected_user_id in connected_user_ids:
+        params += [user_id, connected_user_id, False, now]
+    # The WHERE clause leaves live rows alone, so only new and revived rows are returned
+    return _execute(
+        f"INSERT INTO {table} (user_id, connected_user_id, is_deleted, deleted_at, created_at) VALUES {rows} "
+        f"ON CONFLICT (user_id, connected_user_id) DO UPDATE SET is_deleted = %s, deleted_at = NULL "
+        f"WHERE {table}.is_deleted RETURNING connected_user_id",
+        params + [False],
+    )
+
+
+def _remove(user_id, connected_user_ids):
+    """Soft delete a user's connections to others, returning the ids of those that were live"""
+    table = connection.ops.quote_name(Connection._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    placeholders = ', '.join(['%s'] * len(connected_user_ids))
+    return _execute(
+        f"UPDATE {table} SET is_deleted = %s, deleted_at = %s "
+        f"WHERE user_id = %s AND NOT is_deleted AND connected_user_id IN ({placeholders}) RETURNING connected_user_id",
+        [True, now, user_id, *connected_user_ids],
+    )
+
+
+def _change(user_id, connected_user_ids, connected):
+    with transaction.atomic():
+        changed = (_upsert if connected else _remove)(user_id, connected_user_ids)
+        delta = 1 if connected else -1
+        adjust_counter([user_id], 'following_count', delta * len(changed))
+        adjust_counter(changed, 'followers_count', delta)
+    if changed:
+        connections_changed(user_id, changed, connected)
+    return changed
+
+
+def connect(user_id, connected_user_id):
+    """Connect two users, reviving a removed connection. Returns False if they were already connected."""
+    return bool(_change(user_id, [connected_user_id], True))
+
+
+def disconnect(user_id, connected_user_id):
+    """Soft delete a connection. Returns False if there was none."""
+    return bool(_change(user_id, [connected_user_id], False))
+
+
+def bulk_connect(user, usernames, connected=True, batch_size=None):
+    """
+    Connect a user to, or disconnect them from, many users by username, one
+    statement per batch. Returns the number of users changed and the usernames
+    that do not exist.
+    """
+    batch_size = batch_size or get_bulk_batch_size()
+    usernames = list(dict.fromkeys(usernames))
+    changed = 0
+    not_found = []
+    for start in range(0, len(usernames), batch_size):
+        batch = usernames[start:start + batch_size]
+        found = dict(User.objects.filter(username__in=batch).values_list('username', 'id'))
+        not_found.extend(username for username in batch if username not in found)
+        ids = [user_id for user_id in found.values() if user_id != user.pk]
+        if ids:
+            changed += len(_change(user.pk, ids, connected))
+    return changed, not_found
@@ -0,0 +1,83 @@
+"""
+Denormalized counters on UserProfile.
+Following, follower and linked platform counts are stored on the profile and
+moved with F() expression UPDATEs in the same transaction as the change they
+count (see profile_management.signals and profile_management.connections), so
+profile headers and member listings read them without aggregate queries. Post
+counts are kept once, in PostStats, which UserProfile.post_count reads.
+``manage.py repair_profile_counters`` recounts them and fixes any drift.
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from userauth.models import Connection, SocialMediaAccount, UserProfile
+from .cache import bump_profile_versions
+
+# Counter field: (queryset of the counted rows, field holding the profile owner's user id)
+COUNTED = {
+    'following_count': (Connection.objects.all(), 'user'),
+    'followers_count': (Connection.objects.all(), 'connected_user'),
+    'platform_count': (SocialMediaAccount.objects.filter(is_linked=True), 'user'),
+}
+
+
+def adjust_counter(user_ids, field, delta):
+    """Add delta to a counter of several users' profiles with one UPDATE"""
+    if user_ids and delta:
+        # Clamped so a counter that drifted low stops at 0 instead of failing the unsigned column
+        UserProfile.all_objects.filter(user_id__in=user_ids).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def _count(field):
+    queryset, owner = COUNTED[field]
+    counted = queryset.filter(**{owner: OuterRef('user_id')}).order_by().values(owner).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def recount_counter(user_id, field):
+    """Recount one counter of a user's profile with a single UPDATE"""
+    UserProfile.all_objects.filter(user_id=user_id).update(**{field: _count(field)})
+
+
+def recount_counters(user_id):
+    UserProfile.all_objects.filter(user_id=user_id).update(**{field: _count(field) for field in COUNTED})
+
+
+def aggregate_counters(user_ids):
+    """Actual counts of several users, as {user_id: {field: count}}, with one grouped query per counter"""
+    counts = {user_id: dict.fromkeys(COUNTED, 0) for user_id in user_ids}
+    for field, (queryset, owner) in COUNTED.items():
+        grouped = queryset.filter(**{f"{owner}__in": user_ids}).order_by().values_list(owner).annotate(Count('pk'))
+        for user_id, count in grouped:
+            counts[user_id][field] = count
+    return counts
+
+
+def repair_counters(batch_size=1000, dry_run=False):
+    """
+    Compare every profile's counters with the actual counts and fix the ones
+    that drifted. Returns the number of profiles that had drifted.
+    """
+    drifted = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            UserProfile.all_objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'user_id', *COUNTED)[:batch_size]
+        )
+        if not batch:
+            return drifted
+        last_pk = batch[-1].pk
+        counts = aggregate_counters([user_profile.user_id for user_profile in batch])
+        changed = []
+        for user_profile in batch:
+            actual = counts[user_profile.user_id]
+            if any(getattr(user_profile, field) != count for field, count in actual.items()):
+                for field, count in actual.items():
+                    setattr(user_profile, field, count)
+                changed.append(user_profile)
+        drifted += len(changed)
+        if changed and not dry_run:
+            UserProfile.all_objects.bulk_update(changed, list(COUNTED))
+            bump_profile_versions([user_profile.user_id for user_profile in changed])
@@ -0,0 +1,193 @@
+"""
+Home feed of posts from the users someone is connected to.
+Feeds are materialized in the profile cache as packed ``(created_at, post id)``
+arrays, newest first. A new post is pushed into the cached feed of every user
+connected to its author when it is committed (fan-out on write), so reading a
+page is a slice of that array and one primary key lookup. Authors with more
+than FEED_FANOUT_LIMIT followers, by their profile's followers_count, are not
+pushed anywhere; their posts are read at request time and merged in (fan-out
+on read). Authors move in and out of that set as their follower counts change.
+Feeds that are not cached, or
+were dropped because their owner's connections changed, are rebuilt with one
+query on the next read.
+"""
+
+from array import array
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from userauth.models import Post, UserProfile
+from . import graph
+from .cache import get_profile_cache
+from .pagination import decode_cursor, encode_cursor, get_page_size
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+HEAVY_POSTERS_KEY = 'feed:heavy-posters'
+
+
+def get_feed_max_length():
+    return getattr(settings, 'FEED_MAX_LENGTH', 500)
+
+
+def get_fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+
+
+def get_feed_cache_timeout():
+    return getattr(settings, 'FEED_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _key(user_id):
+    return f"feed:{user_id}"
+
+
+def _timestamp(created_at):
+    return (created_at - EPOCH) // timedelta(microseconds=1)
+
+
+def _pack(entries):
+    packed = array('q')
+    for entry in entries:
+        packed.extend(entry)
+    return packed.tobytes()
+
+
+def _unpack(data):
+    packed = array('q')
+    packed.frombytes(data)
+    return list(zip(packed[0::2], packed[1::2]))
+
+
+def _store_heavy_posters(heavy):
+    get_profile_cache().set(HEAVY_POSTERS_KEY, array('q', sorted(heavy)).tobytes(), get_feed_cache_timeout())
+
+
+def heavy_posters():
+    """Ids of users with more followers than FEED_FANOUT_LIMIT"""
+    data = get_profile_cache().get(HEAVY_POSTERS_KEY)
+    if data is not None:
+        return set(array('q', data))
+    heavy = set(
+        UserProfile.all_objects.filter(followers_count__gt=get_fanout_limit()).values_list('user_id', flat=True)
+    )
+    _store_heavy_posters(heavy)
+    return heavy
+
+
+def update_heavy_posters(user_ids):
+    """Move users whose follower counts changed into or out of the heavy posters"""
+    limit = get_fanout_limit()
+    counts = UserProfile.all_objects.filter(user_id__in=user_ids).values_list('user_id', 'followers_count')
+    heavy = heavy_posters()
+    joined = {user_id for user_id, followers in counts if followers > limit} - heavy
+    left = {user_id for user_id, followers in counts if followers <= limit} & heavy
+    if joined or left:
+        _store_heavy_posters((heavy | joined) - left)
+    for user_id in left:
+        # Their posts were read at request time rather than pushed, rebuilt feeds include them
+        invalidate_feed(*graph.connected_to(user_id))
+
+
+def build_feed(user_id):
+    """Feed entries of a user from the database, newest first, without heavy posters"""
+    authors = graph.connections(user_id) - heavy_posters()
+    posts = (
+        Post.objects.filter(user_id__in=authors).order_by('-created_at', '-id')
+        .values_list('created_at', 'id')[:get_feed_max_length()]
+    )
+    return [(_timestamp(created_at), post_id) for created_at, post_id in posts]
+
+
+def load_feed(user_id):
+    cache = get_profile_cache()
+    data = cache.get(_key(user_id))
+    if data is not None:
+        return _unpack(data)
+    entries = build_feed(user_id)
+    cache.set(_key(user_id), _pack(entries), get_feed_cache_timeout())
+    return entries
+
+
+def fan_out(post):
+    """Push a new post into the cached feeds of the users connected to its author"""
+    if post.user_id in heavy_posters():
+        return 0
+
+    followers = graph.connected_to(post.user_id)
+    cache = get_profile_cache()
+    # Feeds that are not cached include the post when they are rebuilt
+    feeds = cache.get_many([_key(follower) for follower in followers])
+    entry = (-_timestamp(post.created_at), -post.pk)
+    updated = {}
+    for key, data in feeds.items():
+        # Entries are kept newest first, insort works on the negated keys
+        entries = [(-created, -post_id) for created, post_id in _unpack(data)]
+        if entry not in entries:
+            insort(entries, entry)
+        updated[key] = _pack([(-created, -post_id) for created, post_id in entries[:get_feed_max_length()]])
+    cache.set_many(updated, get_feed_cache_timeout())
+    return len(updated)
+
+
+def invalidate_feed(*user_ids):
+    get_profile_cache().delete_many([_key(user_id) for user_id in user_ids])
+
+
+def invalidate_followers(user_id):
+    """Drop the feeds a user's posts were pushed into, e.g. after importing old posts"""
+    if user_id not in heavy_posters():
+        invalidate_feed(*graph.connected_to(user_id))
+
+
+def _keyset(queryset, cursor):
+    if cursor is None:
+        return queryset
+    created_at, pk = cursor
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+
+def read_feed(user_id, cursor=None, page_size=None):
+    """
+    One page of a user's feed, newest first, and the cursor of the next page
+    (None on the last page). Cursors are those of profile_management.pagination.
+    Raises ValueError for malformed cursors.
+    """
+    page_size = page_size or get_page_size()
+    position = decode_cursor(cursor) if cursor else None
+    feed = entries = load_feed(user_id)
+    if position is not None:
+        if position[0].tzinfo is None:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        # Entries are newest first, so bisect over the negated keys
+        start = bisect_right(feed, (-_timestamp(position[0]), -position[1]), key=lambda entry: (-entry[0], -entry[1]))
+        entries = feed[start:]
+
+    # One extra row tells whether another page exists
+    candidates = [post_id for _, post_id in entries[:page_size + 1]]
+    posts = {post.pk: post for post in Post.objects.filter(pk__in=candidates).select_related('user')}
+
+    authors = graph.connections(user_id)
+    read_time = authors & heavy_posters()
+    if len(entries) <= page_size and len(feed) >= get_feed_max_length():
+        # Paged past the materialized part of a full feed, read everything at request time
+        read_time = authors
+    if read_time:
+        queryset = Post.objects.filter(user_id__in=read_time).select_related('user').order_by('-created_at', '-id')
+        posts.update({post.pk: post for post in _keyset(queryset, position)[:page_size + 1]})
+
+    # Posts of users disconnected since they were pushed are dropped here
+    page = sorted(
+        (post for post in posts.values() if post.user_id in authors),
+        key=lambda post: (post.created_at, post.pk), reverse=True,
+    )
+    if len(page) > page_size:
+        next_cursor = encode_cursor(page[page_size - 1])
+    elif page and len(entries) > page_size + 1:
+        # Deleted posts left the page short but more of the feed follows
+        next_cursor = encode_cursor(page[-1])
+    else:
+        next_cursor = None
+    return page[:page_size], next_cursor
@@ -0,0 +1,146 @@
+"""
+Connection graph.
+Every user's outgoing and incoming connections are kept in the profile cache
+as compact sorted arrays of user ids, loaded from Connection on a miss and
+updated in place when a connection is made or removed (see
+profile_management.signals). Mutual connections, degrees and "people you may
+know" suggestions are then set operations over a few cache reads instead of
+self-joins of the connection table on every request.
+"""
+
+from array import array
+from collections import Counter
+
+from django.conf import settings
+
+from userauth.models import Connection
+from .cache import get_profile_cache
+
+OUT = 'out'
+IN = 'in'
+
+
+def get_graph_cache_timeout():
+    return getattr(settings, 'GRAPH_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_max_fanout():
+    """Most connections whose own connections are read for suggestions"""
+    return getattr(settings, 'GRAPH_MAX_FANOUT', 500)
+
+
+def _key(direction, user_id):
+    return f"graph:{direction}:{user_id}"
+
+
+def _pack(user_ids):
+    return array('q', sorted(user_ids)).tobytes()
+
+
+def _unpack(data):
+    ids = array('q')
+    ids.frombytes(data)
+    return ids
+
+
+def _load(direction, user_ids):
+    """Adjacency of users from the database, as {user_id: set of neighbour ids}"""
+    source, target = ('user_id', 'connected_user_id') if direction == OUT else ('connected_user_id', 'user_id')
+    adjacency = {user_id: set() for user_id in user_ids}
+    for user_id, neighbour in Connection.objects.filter(**{f"{source}__in": user_ids}).values_list(source, target).iterator():
+        adjacency[user_id].add(neighbour)
+    return adjacency
+
+
+def adjacency(user_ids, direction=OUT):
+    """Neighbour sets of several users, reading the cache once and the database once for misses"""
+    user_ids = list(dict.fromkeys(user_ids))
+    cache = get_profile_cache()
+    cached = cache.get_many([_key(direction, user_id) for user_id in user_ids])
+    result = {}
+    missing = []
+    for user_id in user_ids:
+        data = cached.get(_key(direction, user_id))
+        if data is None:
+            missing.append(user_id)
+        else:
+            result[user_id] = set(_unpack(data))
+    if missing:
+        loaded = _load(direction, missing)
+        cache.set_many({_key(direction, user_id): _pack(ids) for user_id, ids in loaded.items()}, get_graph_cache_timeout())
+        result.update(loaded)
+    return result
+
+
+def connections(user_id):
+    """Ids of the users a user is connected to"""
+    return adjacency([user_id])[user_id]
+
+
+def connected_to(user_id):
+    """Ids of the users connected to a user"""
+    return adjacency([user_id], IN)[user_id]
+
+
+def is_connected(user_id, other_id):
+    return other_id in connections(user_id)
+
+
+def degree(user_id):
+    """Number of connections a user has made and received"""
+    return {'connections': len(connections(user_id)), 'connected_to': len(connected_to(user_id))}
+
+
+def mutual_connections(user_id, other_id):
+    """Ids of the users both users are connected to"""
+    graph = adjacency([user_id, other_id])
+    return graph[user_id] & graph[other_id]
+
+
+def mutual_counts(user_id, other_ids):
+    """Number of mutual connections between a user and each of several others"""
+    graph = adjacency([user_id, *other_ids])
+    own = graph[user_id]
+    return {other_id: len(own & graph[other_id]) for other_id in other_ids}
+
+
+def suggestions(user_id, limit=10):
+    """
+    People you may know: users two hops away, not yet connected, ranked by the
+    number of mutual connections. Returns (user_id, mutual_count) pairs.
+    """
+    own = connections(user_id)
+    # Bound the work for users with very many connections, preferring the newest accounts
+    neighbours = sorted(own)[-get_max_fanout():]
+    counts = Counter()
+    for ids in adjacency(neighbours).values():
+        counts.update(ids)
+    for excluded in own | {user_id}:
+        counts.pop(excluded, None)
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def _update(direction, neighbours, connected):
+    """Add or remove neighbours from cached adjacencies, given as {user_id: neighbour ids}"""
+    cache = get_profile_cache()
+    # Adjacencies that are not cached are loaded from the database on the next read
+    cached = cache.get_many([_key(direction, user_id) for user_id in neighbours])
+    updated = {}
+    for user_id, ids in neighbours.items():
+        data = cached.get(_key(direction, user_id))
+        if data is None:
+            continue
+        # Concurrent updates of the same user can race, the entry expires after GRAPH_CACHE_TIMEOUT
+        current = set(_unpack(data))
+        if connected:
+            current.update(ids)
+        else:
+            current.difference_update(ids)
+        updated[_key(direction, user_id)] = _pack(current)
+    cache.set_many(updated, get_graph_cache_timeout())
+
+
+def update_connections(user_id, connected_user_ids, connected):
+    """Apply connections a user made or removed to the cached adjacency of everyone involved"""
+    _update(OUT, {user_id: connected_user_ids}, connected)
+    _update(IN, {connected_user_id: [user_id] for connected_user_id in connected_user_ids}, connected)
@@ -0,0 +1,21 @@
+"""
+Report how much AI assistant traffic is answered by the fast path router.
+Counters live in the profile cache, so they cover every process sharing it.
+"""
+
+from django.core.management.base import BaseCommand
+
+from profile_management.ai_router import router_stats
+
+
+class Command(BaseCommand):
+    help = "Show AI fast path hit and miss counts"
+
+    def handle(self, *args, **options):
+        stats = router_stats()
+        total = stats['hits'] + stats['misses']
+        rate = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(f"Fast path: {stats['hits']} hit(s), {stats['misses']} miss(es), {rate:.1f}% hit rate")
+        for name, count in stats.items():
+            if name.startswith('hits:'):
+                self.stdout.write(f"  {name[len('hits:'):]}: {count}")
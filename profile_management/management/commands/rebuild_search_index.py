@@ -0,0 +1,36 @@
+"""
+Rebuild the member search columns of every UserProfile.
+
+On PostgreSQL this also makes sure the pg_trgm extension exists, which the
+trigram index on ``UserProfile.search_text`` needs. Run it once before
+migrating a database that did not have the extension yet, and again to
+backfill existing profiles after migrating.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from userauth.models import UserProfile
+from profile_management.search import is_postgresql, update_search_index
+
+
+class Command(BaseCommand):
+    help = "Create the pg_trgm extension and rebuild UserProfile search columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Profiles loaded per query")
+        parser.add_argument('--extension-only', action='store_true', help="Only create the pg_trgm extension")
+
+    def handle(self, *args, **options):
+        if is_postgresql():
+            with connection.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        if options['extension_only']:
+            return
+
+        profiles = UserProfile.objects.select_related('user').order_by('pk')
+        indexed = 0
+        for user_profile in profiles.iterator(chunk_size=options['batch_size']):
+            update_search_index(user_profile)
+            indexed += 1
+        self.stdout.write(f"Indexed {indexed} profile(s).")
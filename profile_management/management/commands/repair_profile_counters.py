@@ -0,0 +1,21 @@
+"""
+Verify the denormalized counters on UserProfile against the rows they count
+and fix any that drifted, e.g. after raw SQL edits or a restored backup.
+"""
+
+from django.core.management.base import BaseCommand
+
+from profile_management.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = "Recount UserProfile following, follower and platform counters and repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Profiles checked per batch")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many profiles drifted")
+
+    def handle(self, *args, **options):
+        drifted = repair_counters(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        action = "would be repaired" if options['dry_run'] else "repaired"
+        self.stdout.write(f"{drifted} profile(s) with drifted counters {action}.")
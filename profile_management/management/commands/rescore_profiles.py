@@ -0,0 +1,19 @@
+"""
+Recompute UserProfile.profile_score for every profile in batches and write
+back the scores that changed.
+"""
+
+from django.core.management.base import BaseCommand
+
+from profile_management.scoring import rescore_profiles
+
+
+class Command(BaseCommand):
+    help = "Recompute every UserProfile's profile_score"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Profiles rescored per bulk update")
+
+    def handle(self, *args, **options):
+        rescored = rescore_profiles(batch_size=options['batch_size'])
+        self.stdout.write(f"Updated the score of {rescored} profile(s).")
@@ -0,0 +1,34 @@
+"""
+Refresh linked social media accounts whose data is due for a sync.
+
+Run once (e.g. from cron) with ``python manage.py sync_social_media``, or keep
+it running as a worker process with ``python manage.py sync_social_media --loop``.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from profile_management import sync
+
+
+class Command(BaseCommand):
+    help = "Refresh SocialMediaAccount data for accounts whose last_sync has expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running and sync on every interval")
+        parser.add_argument('--interval', type=int, default=60, help="Seconds to wait between passes in loop mode")
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of users per pass")
+        parser.add_argument('--workers', type=int, default=sync.sync_queue.workers, help="Number of concurrent sync workers")
+
+    def handle(self, *args, **options):
+        sync.sync_queue.workers = options['workers']
+
+        while True:
+            queued = sync.enqueue_stale_accounts(limit=options['limit'])
+            sync.sync_queue.join()
+            self.stdout.write(f"Processed social media accounts for {queued} user(s).")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
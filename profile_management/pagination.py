@@ -0,0 +1,50 @@
+"""
+Keyset (cursor) pagination over ``(created_at, id)`` for post feeds.
+Each page is a bounded index range scan, so loading page N costs the same as
+loading the first page regardless of how many posts a user has.
+"""
+
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def get_page_size():
+    return getattr(settings, 'POSTS_PAGE_SIZE', 20)
+
+
+def encode_cursor(post):
+    """Opaque cursor pointing just after the given post"""
+    raw = f"{post.created_at.isoformat()}|{post.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) position of a cursor. Raises ValueError for malformed cursors."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def paginate_posts(queryset, cursor=None, page_size=None):
+    """
+    Return one page of posts ordered newest first, and the cursor of the next page
+    (None on the last page).
+    """
+    page_size = page_size or get_page_size()
+    queryset = queryset.order_by('-created_at', '-id')
+
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    # Fetch one extra row to know whether another page exists
+    posts = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(posts[page_size - 1]) if len(posts) > page_size else None
+    return posts[:page_size], next_cursor
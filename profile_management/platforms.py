@@ -0,0 +1,263 @@
+"""
+Social media platform API clients used to refresh SocialMediaAccount data.
+Requests for all of a user's platforms run concurrently on a shared event loop
+that keeps a pooled, keep-alive HTTP client alive for the whole process.
+"""
+
+from datetime import datetime
+import asyncio
+import importlib.util
+import logging
+import threading
+
+from django.conf import settings
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package, fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+def parse_timestamp(value):
+    """Parse a Graph API timestamp such as 2024-01-01T00:00:00+0000"""
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+
+
+class PlatformClient:
+    """
+    Base class for a single platform's Graph API client.
+    Items are fetched newest first, following ``paging.next`` cursors until the
+    account's sync checkpoint is passed, so later syncs only download new items.
+    A walk cut short by SOCIAL_SYNC_MAX_PAGES still moves the checkpoint to the
+    newest item and leaves a resume cursor, which later syncs follow to backfill
+    the older items a page budget at a time.
+    """
+    platform = None
+    timeout = 10.0
+    page_size = 100
+    timestamp_field = 'timestamp'
+
+    def get_timeout(self):
+        """Per-platform timeout in seconds, overridable through settings.SOCIAL_PLATFORM_TIMEOUTS"""
+        return getattr(settings, 'SOCIAL_PLATFORM_TIMEOUTS', {}).get(self.platform, self.timeout)
+
+    def get_max_pages(self):
+        return getattr(settings, 'SOCIAL_SYNC_MAX_PAGES', 10)
+
+    async def get_json(self, http, url, params=None):
+        response = await http.get(url, params=params, timeout=self.get_timeout())
+        return response.json() if response.status_code == 200 else None
+
+    async def fetch_items(self, http, url, params, floor):
+        """
+        Collect items not older than floor across at most SOCIAL_SYNC_MAX_PAGES pages, once each.
+        Returns the items and the next page's URL if the walk was cut short, or None if any page fails.
+        """
+        items = []
+        seen = set()
+        for _ in range(self.get_max_pages()):
+            page = await self.get_json(http, url, params)
+            if page is None:
+                return None
+
+            for item in page.get('data', []):
+                # Items sharing the floor's timestamp may not all have been stored yet
+                if floor and item.get(self.timestamp_field, '') < floor:
+                    return items, None
+                item_id = item.get('id')
+                if item_id is not None:
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                items.append(item)
+
+            # The next cursor URL already carries the query parameters and token
+            url, params = page.get('paging', {}).get('next'), None
+            if not url:
+                return items, None
+        return items, url
+
+    def resume_cursor(self, url, until):
+        """Resume cursor for a walk cut short, stored without the access token, which may be refreshed"""
+        return {'url': str(httpx.URL(url).copy_remove_param('access_token')), 'until': until}
+
+    async def fetch_new_items(self, http, url, params, account):
+        """
+        Walk from the newest item down to the checkpoint, then continue any unfinished backfill.
+        Returns the new items, the backfilled older items and the resume cursor, or None if any page fails.
+        """
+        head = await self.fetch_items(http, url, params, account.sync_checkpoint)
+        if head is None:
+            return None
+        items, cut_at = head
+
+        backfill = []
+        resume = account.sync_resume
+        if resume:
+            fetched = await self.fetch_items(http, resume['url'], {'access_token': account.token}, resume['until'])
+            if fetched is None:
+                return None
+            backfill, next_url = fetched
+            resume = self.resume_cursor(next_url, resume['until']) if next_url else None
+        if cut_at:
+            # The items between this walk and the old checkpoint are still missing. An unfinished
+            # older backfill is folded in by walking down to its floor instead.
+            resume = self.resume_cursor(cut_at, resume['until'] if resume else account.sync_checkpoint)
+        return items, backfill, resume
+
+    def build_result(self, account, items, backfill=(), resume=None, profile=None):
+        """Package new and backfilled items with the account's new high-water mark and resume cursor"""
+        timestamps = [item[self.timestamp_field] for item in items if item.get(self.timestamp_field)]
+        return {
+            'profile': profile or {},
+            'data': items,
+            'backfill': list(backfill),
+            'checkpoint': max(timestamps, default=account.sync_checkpoint),
+            'resume': resume,
+        }
+
+    async def fetch(self, http, account):
+        """Fetch new platform data for an account. Returns None on any API error."""
+        raise NotImplementedError
+
+    def normalize_item(self, item):
+        """Map a raw platform item to SocialMediaItem fields"""
+        raise NotImplementedError
+
+
+class InstagramClient(PlatformClient):
+    """Fetch Instagram media using the platform's API"""
+    platform = 'instagram'
+    media_url = 'https://graph.instagram.com/me/media'
+    fields = 'id,caption,media_type,media_url,thumbnail_url,username,timestamp'
+
+    async def fetch(self, http, account):
+        params = {
+            'fields': self.fields,
+            'limit': self.page_size,
+            'access_token': account.token
+        }
+        fetched = await self.fetch_new_items(http, self.media_url, params, account)
+        return None if fetched is None else self.build_result(account, *fetched)
+
+    def normalize_item(self, item):
+        media_types = {'IMAGE': 'image', 'VIDEO': 'video', 'CAROUSEL_ALBUM': 'carousel'}
+        return {
+            'external_id': item['id'],
+            'media_type': media_types.get(item.get('media_type'), 'image'),
+            'timestamp': parse_timestamp(item['timestamp']),
+            'caption': item.get('caption'),
+            'media_url': item.get('media_url'),
+            'thumbnail_url': item.get('thumbnail_url'),
+        }
+
+
+class FacebookClient(PlatformClient):
+    """Fetch the Facebook profile and new posts using the platform's API"""
+    platform = 'facebook'
+    profile_url = 'https://graph.facebook.com/v12.0/me'
+    posts_url = 'https://graph.facebook.com/v12.0/me/posts'
+    fields = 'name,email,birthday,hometown'
+    post_fields = 'id,message,created_time,full_picture,permalink_url'
+    timestamp_field = 'created_time'
+    timeout = 15.0
+
+    async def fetch(self, http, account):
+        profile_params = {
+            'fields': self.fields,
+            'access_token': account.token
+        }
+        posts_params = {
+            'fields': self.post_fields,
+            'limit': self.page_size,
+            'access_token': account.token
+        }
+        if account.sync_checkpoint:
+            posts_params['since'] = int(parse_timestamp(account.sync_checkpoint).timestamp())
+
+        profile, fetched = await asyncio.gather(
+            self.get_json(http, self.profile_url, profile_params),
+            self.fetch_new_items(http, self.posts_url, posts_params, account),
+        )
+        if profile is None or fetched is None:
+            return None
+        return self.build_result(account, *fetched, profile=profile)
+
+    def normalize_item(self, item):
+        return {
+            'external_id': item['id'],
+            'media_type': 'image' if item.get('full_picture') else 'text',
+            'timestamp': parse_timestamp(item['created_time']),
+            'caption': item.get('message'),
+            'media_url': item.get('full_picture'),
+            'thumbnail_url': None,
+        }
+
+
+PLATFORM_CLIENTS = {
+    client.platform: client
+    for client in (InstagramClient(), FacebookClient())
+}
+
+
+async def fetch_account_async(http, account):
+    """Fetch a single account, enforcing its platform timeout"""
+    client = PLATFORM_CLIENTS.get(account.platform)
+    if client is None:
+        return None
+    try:
+        return await asyncio.wait_for(client.fetch(http, account), client.get_timeout())
+    except (asyncio.TimeoutError, httpx.HTTPError, ValueError) as e:
+        logger.warning(f"Fetching {account.platform} data for {account} failed: {e!r}")
+        return None
+
+
+async def fetch_accounts_async(http, accounts):
+    """Fetch several accounts concurrently. Returns a dict of account pk to platform data."""
+    results = await asyncio.gather(*(fetch_account_async(http, account) for account in accounts))
+    return {account.pk: data for account, data in zip(accounts, results)}
+
+
+class _ClientLoop:
+    """Background event loop owning the pooled HTTP client, shared by all sync callers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._http = None
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='platform-clients', daemon=True).start()
+        self._http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+
+    def run(self, coroutine_function, *args):
+        with self._lock:
+            if self._loop is None:
+                self._start()
+        future = asyncio.run_coroutine_threadsafe(coroutine_function(self._http, *args), self._loop)
+        return future.result()
+
+
+_client_loop = _ClientLoop()
+
+
+def fetch_accounts(accounts):
+    """
+    Synchronous wrapper around fetch_accounts_async for views, commands and workers.
+    Each result is a dict with the new ``data`` items, optional ``profile`` fields
+    and the account's new ``checkpoint``, or None if the fetch failed.
+    """
+    accounts = list(accounts)
+    if not accounts:
+        return {}
+    return _client_loop.run(fetch_accounts_async, accounts)
+
+
+def fetch_social_media_data(account):
+    """Generic function to fetch data from social media platforms"""
+    return fetch_accounts([account]).get(account.pk)
@@ -0,0 +1,39 @@
+"""
+Bulk rescoring of UserProfile.profile_score.
+Saves keep the score current by rescoring only the components whose fields
+changed (see UserProfile.save). This recomputes every profile in batches,
+e.g. after the score components change or after rows were edited with
+queryset updates, writing back only the scores that differ.
+"""
+
+from django.conf import settings
+
+from userauth.models import UserProfile
+from .cache import bump_profile_versions
+
+
+def get_rescore_batch_size():
+    return getattr(settings, 'PROFILE_RESCORE_BATCH_SIZE', 1000)
+
+
+def rescore_profiles(batch_size=None):
+    """Recompute every profile's score with one bulk_update per batch. Returns the number of scores changed."""
+    batch_size = batch_size or get_rescore_batch_size()
+    fields = ['pk', 'user_id', 'profile_score', *UserProfile.SCORE_COMPONENTS]
+    rescored = 0
+    last_pk = 0
+    while True:
+        batch = list(UserProfile.all_objects.filter(pk__gt=last_pk).order_by('pk').only(*fields)[:batch_size])
+        if not batch:
+            return rescored
+        last_pk = batch[-1].pk
+        changed = []
+        for user_profile in batch:
+            score = user_profile.compute_profile_score()
+            if score != user_profile.profile_score:
+                user_profile.profile_score = score
+                changed.append(user_profile)
+        if changed:
+            UserProfile.all_objects.bulk_update(changed, ['profile_score'])
+            bump_profile_versions([user_profile.user_id for user_profile in changed])
+            rescored += len(changed)
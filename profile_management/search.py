@@ -0,0 +1,78 @@
+"""
+Member search backed by PostgreSQL full-text search and trigram indexes.
+
+Every UserProfile keeps a denormalized ``search_text`` (username, full name,
+email and user code) and a weighted ``search_vector`` built from the same
+fields. Both are GIN indexed, so prefix matching on the vector and fuzzy or
+substring matching on the text are index scans instead of sequential scans.
+"""
+
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+)
+from django.db import connection
+from django.db.models import CharField, F, Q, Value
+
+from userauth.models import UserProfile
+
+# Characters with a meaning in to_tsquery syntax are stripped from search terms
+TSQUERY_SPECIAL_CHARS = re.compile(r"[^\w@.+-]")
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def build_search_text(user_profile):
+    """Lowercased text used for trigram matching"""
+    user = user_profile.user
+    fields = [user.username, user_profile.fullName, user.email, user_profile.user_code]
+    return ' '.join(field for field in fields if field).lower()
+
+
+def build_search_vector(user_profile):
+    """Weighted search vector: names rank above email and user code"""
+    user = user_profile.user
+    return (
+        SearchVector(Value(user.username, output_field=CharField()), weight='A', config='simple')
+        + SearchVector(Value(user_profile.fullName or '', output_field=CharField()), weight='A', config='simple')
+        + SearchVector(Value(user.email or '', output_field=CharField()), weight='B', config='simple')
+        + SearchVector(Value(user_profile.user_code or '', output_field=CharField()), weight='B', config='simple')
+    )
+
+
+def update_search_index(user_profile):
+    """Refresh the stored search columns of a single profile without touching any other column"""
+    fields = {'search_text': build_search_text(user_profile)}
+    if is_postgresql():
+        fields['search_vector'] = build_search_vector(user_profile)
+    UserProfile.objects.filter(pk=user_profile.pk).update(**fields)
+
+
+def build_prefix_query(query):
+    """Turn free text into a tsquery where every term is prefix matched, or None if nothing is left"""
+    terms = [TSQUERY_SPECIAL_CHARS.sub('', term) for term in query.split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return None
+    return SearchQuery(' & '.join(f"{term}:*" for term in terms), search_type='raw', config='simple')
+
+
+def search_profiles(queryset, query):
+    """Filter a UserProfile queryset by a search query, best matches first"""
+    query = query.strip()
+    if not is_postgresql():
+        # Fallback for other databases, e.g. SQLite during local development
+        return queryset.filter(search_text__icontains=query.lower()).order_by('-created_at', '-id')
+
+    tsquery = build_prefix_query(query)
+    matches = Q(search_text__trigram_similar=query.lower())
+    if tsquery is not None:
+        matches |= Q(search_vector=tsquery)
+
+    return queryset.filter(matches).annotate(
+        rank=SearchRank(F('search_vector'), tsquery) if tsquery is not None else Value(0.0),
+        similarity=TrigramSimilarity('search_text', query.lower()),
+    ).order_by('-rank', '-similarity', '-id')
@@ -0,0 +1,138 @@
+"""
+Signal handlers that keep the profile cache in sync with the underlying rows.
+Cache invalidations are deferred until the transaction commits, so a request
+reading in between cannot cache the old rows again under the new version.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from content_management.signals import posts_imported
+from userauth.models import Connection, Post, SocialMediaAccount, User, UserProfile
+from .ai_context import invalidate_ai_context
+from . import feed, graph
+from .cache import bump_profile_version, bump_profile_versions
+from .connections import connections_changed
+from . import counters
+from .search import build_search_text, update_search_index
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=SocialMediaAccount)
+def invalidate_owner_profile(sender, instance, **kwargs):
+    """Posts, profile details and linked accounts are all shown on their owner's profile"""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_profile_version(user_id))
+
+
+@receiver([post_save, post_delete], sender=Connection)
+def invalidate_connection_caches(sender, instance, signal, **kwargs):
+    """Profiles, the graph, the owner's feed and AI context all depend on connections"""
+    connected = signal is post_save and not instance.is_deleted
+    connections_changed(instance.user_id, [instance.connected_user_id], connected)
+
+
+def liveness_delta(instance, created, update_fields):
+    """+1 or -1 when a soft-deletable row was created live, soft deleted or restored, else 0"""
+    if created:
+        return 0 if instance.is_deleted else 1
+    if update_fields and 'is_deleted' in update_fields:
+        return -1 if instance.is_deleted else 1
+    return 0
+
+
+@receiver(post_save, sender=Connection)
+def count_saved_connection(sender, instance, created, update_fields=None, **kwargs):
+    delta = liveness_delta(instance, created, update_fields)
+    counters.adjust_counter([instance.user_id], 'following_count', delta)
+    counters.adjust_counter([instance.connected_user_id], 'followers_count', delta)
+
+
+@receiver(post_delete, sender=Connection)
+def count_deleted_connection(sender, instance, **kwargs):
+    # Purged tombstones were uncounted when they were soft deleted
+    if not instance.is_deleted:
+        counters.adjust_counter([instance.user_id], 'following_count', -1)
+        counters.adjust_counter([instance.connected_user_id], 'followers_count', -1)
+
+
+@receiver([post_save, post_delete], sender=SocialMediaAccount)
+def count_platforms(sender, instance, **kwargs):
+    """Accounts are linked and unlinked by plain saves, so the count is redone in one UPDATE"""
+    counters.recount_counter(instance.user_id, 'platform_count')
+
+
+@receiver(post_save, sender=UserProfile)
+def count_new_profile(sender, instance, created, **kwargs):
+    """Connections and posts can exist before their user's profile"""
+    if created:
+        counters.recount_counters(instance.user_id)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, update_fields=None, **kwargs):
+    """Push new and restored posts into the feeds of the author's connections"""
+    restored = update_fields is not None and 'is_deleted' in update_fields
+    if (created or restored) and not instance.is_deleted:
+        transaction.on_commit(lambda: feed.fan_out(instance))
+
+
+@receiver(post_save, sender=UserProfile)
+def index_profile(sender, instance, **kwargs):
+    """Keep the member search columns in sync with the profile"""
+    if instance.search_text != build_search_text(instance):
+        update_search_index(instance)
+
+
+@receiver(post_save, sender=User)
+def index_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """Usernames and emails live on User, re-index the profile when they change"""
+    if created or (update_fields and not {'username', 'email'} & set(update_fields)):
+        return
+    user_profile = UserProfile.objects.filter(user=instance).first()
+    if user_profile is not None:
+        user_profile.user = instance
+        index_profile(UserProfile, user_profile)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_ai_activity(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_ai_context(user_id, 'activity'))
+
+
+@receiver(posts_imported, sender=Post)
+def invalidate_imported_posts(sender, user_id, **kwargs):
+    transaction.on_commit(lambda: bump_profile_version(user_id))
+    transaction.on_commit(lambda: invalidate_ai_context(user_id, 'activity'))
+    transaction.on_commit(lambda: feed.invalidate_followers(user_id))
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_ai_profile(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_ai_context(user_id, 'profile'))
+
+
+@receiver([post_save, post_delete], sender=SocialMediaAccount)
+def invalidate_ai_platforms(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_ai_context(user_id, 'platforms'))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_profiles(sender, instance, created, update_fields=None, **kwargs):
+    """A user's name is shown on their profile and on the profiles listing them as a connection"""
+    if created or (update_fields and not {'username', 'email', 'first_name', 'last_name'} & set(update_fields)):
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_profile_versions([user_id, *graph.connected_to(user_id)]))
+
+
+@receiver(post_save, sender=User)
+def invalidate_ai_user(sender, instance, created, **kwargs):
+    if not created:
+        user_id = instance.pk
+        transaction.on_commit(lambda: invalidate_ai_context(user_id, 'profile'))
@@ -0,0 +1,128 @@
+"""
+Background synchronisation of linked social media accounts.
+Accounts are refreshed on a schedule based on ``last_sync`` so that profile
+pages only ever read the cached ``SocialMediaAccount.data``.
+"""
+
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from SLID.workers import BackgroundQueue
+from userauth.models import SocialMediaAccount, SocialMediaItem
+from .platforms import PLATFORM_CLIENTS, fetch_accounts
+
+logger = logging.getLogger(__name__)
+
+
+def sync_interval():
+    """Return how long fetched platform data stays fresh."""
+    return timedelta(seconds=getattr(settings, 'SOCIAL_SYNC_INTERVAL', 30 * 60))
+
+
+def stale_accounts(now=None):
+    """Linked accounts that have never been synced or whose data has expired."""
+    cutoff = (now or timezone.now()) - sync_interval()
+    return SocialMediaAccount.objects.filter(is_linked=True).filter(
+        Q(data__isnull=True) | Q(last_sync__lt=cutoff)
+    ).order_by('last_sync')
+
+
+def merge_platform_data(data, result):
+    """
+    Prepend newly fetched items to the cached data and append backfilled older
+    ones, keeping at most SOCIAL_SYNC_MAX_ITEMS.
+    """
+    data = dict(data or {})
+    data.update(result.get('profile', {}))
+
+    new_items = result['data']
+    backfill = result.get('backfill', [])
+    fetched_ids = {item.get('id') for item in new_items + backfill}
+    cached_items = [item for item in data.get('data', []) if item.get('id') not in fetched_ids]
+    data['data'] = (new_items + cached_items + backfill)[:getattr(settings, 'SOCIAL_SYNC_MAX_ITEMS', 500)]
+    return data
+
+
+def store_items(account, items):
+    """Upsert fetched items into the normalized SocialMediaItem table."""
+    client = PLATFORM_CLIENTS[account.platform]
+    rows = [
+        SocialMediaItem(account=account, user_id=account.user_id, platform=account.platform, **client.normalize_item(item))
+        for item in items
+        if item.get('id') and item.get(client.timestamp_field)
+    ]
+    SocialMediaItem.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['account', 'external_id'],
+        update_fields=['media_type', 'timestamp', 'caption', 'media_url', 'thumbnail_url'],
+    )
+
+
+def sync_accounts(accounts):
+    """Fetch new platform items for several accounts concurrently and store them. Returns the number refreshed."""
+    accounts = list(accounts)
+    results = fetch_accounts(accounts)
+
+    synced = 0
+    for account in accounts:
+        result = results.get(account.pk)
+        if result is None:
+            logger.info(f"No data returned for {account}.")
+            continue
+        with transaction.atomic():
+            store_items(account, result['data'] + result.get('backfill', []))
+            account.data = merge_platform_data(account.data, result)
+            account.sync_checkpoint = result['checkpoint']
+            account.sync_resume = result.get('resume')
+            account.save(update_fields=['data', 'sync_checkpoint', 'sync_resume', 'last_sync'])
+        synced += 1
+    return synced
+
+
+def sync_account(account):
+    """Refresh a single account. Returns True on success."""
+    return sync_accounts([account]) == 1
+
+
+def sync_user(user_id):
+    """Queue handler of the periodic sweep: refresh all of a user's stale accounts in one concurrent round."""
+    return sync_accounts(stale_accounts().filter(user_id=user_id))
+
+
+def refresh_account(account_id):
+    """Queue handler: refresh a linked account whether or not its data is stale."""
+    return sync_accounts(SocialMediaAccount.objects.filter(pk=account_id, is_linked=True))
+
+
+sync_queue = BackgroundQueue(
+    sync_user,
+    name='social-sync',
+    workers=getattr(settings, 'SOCIAL_SYNC_WORKERS', 2),
+)
+
+# Saving an account moves its auto_now last_sync, so refreshes asked for right after are not filtered by staleness
+refresh_queue = BackgroundQueue(
+    refresh_account,
+    name='social-refresh',
+    workers=getattr(settings, 'SOCIAL_SYNC_WORKERS', 2),
+)
+
+
+def enqueue(account):
+    """Schedule a background refresh of an account, e.g. right after it has been linked."""
+    return refresh_queue.put(account.pk)
+
+
+def enqueue_stale_accounts(limit=None):
+    """Queue every user with an account due for a refresh. Returns the number of users queued."""
+    user_ids = stale_accounts().order_by().values_list('user_id', flat=True).distinct()
+    if limit:
+        user_ids = user_ids[:limit]
+    return sum(1 for user_id in user_ids if sync_queue.put(user_id))
@@ -1,9 +1,27 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
-from userauth.models import UserProfile, Instagram, Facebook, Connection
+from userauth.models import UserProfile, Connection, SocialMediaAccount, SocialMediaItem, Post
 from unittest.mock import patch
 from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from profile_management import sync, platforms, views, graph, feed, connections, counters
+from profile_management import ai_cache
+from profile_management.ai_context import get_ai_context, render_ai_context
+from profile_management.ai_engine import AIEngine
+from profile_management.ai_router import route, router_stats
+from profile_management.ai_sql import QueryRejected, SandboxedSQLDatabase, ai_user_scope
+from profile_management.cache import profile_cache_version
+from profile_management.pagination import paginate_posts
+import asyncio
+from io import StringIO
+import json
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
 
 
 
@@ -34,6 +52,14 @@ class UserProfileTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertJSONEqual(response.content, {'message': 'Sample AI response'})
 
+    def test_update_restores_deleted_profile(self):
+        self.user_profile.soft_delete()
+        response = self.client.post(reverse('profile_management:update_profile'), {'fullName': 'Test User', 'bio': 'Back again'})
+        self.assertRedirects(response, reverse('profile_management:profile', args=[self.user.username]))
+        user_profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((user_profile.fullName, user_profile.bio), ('Test User', 'Back again'))
+        self.assertIsNone(user_profile.deleted_at)
+
     def test_members_view(self):
         # Test members view for the logged-in user
         response = self.client.get(reverse('profile_management:members'))
@@ -41,6 +67,952 @@ class UserProfileTests(TestCase):
         self.assertTemplateUsed(response, 'userauth/members2.html')
 
 
+class ProfileCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cacheduser', password='testpass')
+        self.user_profile = UserProfile.objects.create(user=self.user)
+
+    def test_profile_sections_are_cached(self):
+        views.get_profile_sections(self.user)
+        views.get_cached_user_profile(self.user.id)
+        with self.assertNumQueries(0):
+            views.get_profile_sections(self.user)
+            views.get_cached_user_profile(self.user.id)
+
+    def test_post_save_invalidates_profile(self):
+        version = profile_cache_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.user, content_type='text', content='New post')
+            # Bumped only once the post is committed, a read before that caches nothing stale
+            self.assertEqual(profile_cache_version(self.user.id), version)
+        self.assertNotEqual(profile_cache_version(self.user.id), version)
+
+    def test_username_change_invalidates_profiles(self):
+        other = User.objects.create_user(username='otheruser', password='testpass')
+        Connection.objects.create(user=other, connected_user=self.user)
+        versions = (profile_cache_version(self.user.id), profile_cache_version(other.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = 'renamed'
+            self.user.save()
+        # The renamed user's own profile and the profile listing them as a connection
+        self.assertNotEqual(profile_cache_version(self.user.id), versions[0])
+        self.assertNotEqual(profile_cache_version(other.id), versions[1])
+
+        version = profile_cache_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(profile_cache_version(self.user.id), version)
+
+    def test_connection_invalidates_both_profiles(self):
+        other = User.objects.create_user(username='otheruser', password='testpass')
+        versions = (profile_cache_version(self.user.id), profile_cache_version(other.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            Connection.objects.create(user=self.user, connected_user=other)
+        self.assertNotEqual(profile_cache_version(self.user.id), versions[0])
+        self.assertNotEqual(profile_cache_version(other.id), versions[1])
+
+
+class PostPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='poster', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.posts = [
+            Post.objects.create(user=self.user, content_type='text', content=f'Post {i}')
+            for i in range(5)
+        ]
+        self.client = Client()
+        self.client.login(username='poster', password='testpass')
+
+    def test_cursor_walks_all_posts_once(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_posts(Post.objects.filter(user=self.user), cursor=cursor, page_size=2)
+            seen.extend(post.pk for post in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    @override_settings(POSTS_PAGE_SIZE=3)
+    def test_profile_posts_json(self):
+        url = reverse('profile_management:profile_posts', args=[self.user.username])
+        first = self.client.get(url, {'format': 'json'}).json()
+        second = self.client.get(url, {'format': 'json', 'cursor': first['next_cursor']}).json()
+
+        self.assertEqual(len(first['posts']), 3)
+        self.assertEqual([post['content'] for post in second['posts']], ['Post 1', 'Post 0'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_profile_posts_partial(self):
+        response = self.client.get(reverse('profile_management:profile_posts', args=[self.user.username]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'userauth/members-page-posts.html')
+        self.assertContains(response, 'Post 4')
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('profile_management:profile_posts', args=[self.user.username]), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MemberSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        UserProfile.objects.create(user=self.alice, fullName='Alice Walker', user_code='1111222233334444')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        UserProfile.objects.create(user=self.bob, fullName='Bob Stone')
+        self.client = Client()
+        self.client.login(username='searcher', password='testpass')
+
+    def test_search_index_is_maintained(self):
+        self.assertEqual(UserProfile.objects.get(user=self.alice).search_text, 'alice alice walker alice@example.com 1111222233334444')
+
+        self.alice.email = 'walker@example.com'
+        self.alice.save()
+        self.assertIn('walker@example.com', UserProfile.objects.get(user=self.alice).search_text)
+
+    def test_members_search(self):
+        response = self.client.post(reverse('profile_management:members'), {'search_query': 'walk'})
+        self.assertEqual([p.user.username for p in response.context['users_profile']], ['alice'])
+
+    def test_members_typeahead(self):
+        response = self.client.get(reverse('profile_management:members_search'), {'q': 'Bo'})
+        self.assertEqual([result['username'] for result in response.json()['results']], ['bob'])
+
+
+class MembersQueryCountTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.client = Client()
+        self.client.login(username='viewer', password='testpass')
+
+    def create_members(self, start, count):
+        users = User.objects.bulk_create([User(username=f'member{i}', email=f'member{i}@example.com') for i in range(start, start + count)])
+        UserProfile.objects.bulk_create([UserProfile(user=user, user_code=str(user.pk)) for user in users])
+        # Every other member is already connected, so both button states are rendered
+        Connection.objects.bulk_create([Connection(user=self.user, connected_user=user) for user in users[::2]])
+
+    def count_members_queries(self):
+        # bulk_create sends no signals, so compare cold caches
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile_management:members'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), len(response.context['users_profile'])
+
+    @patch('profile_management.views.MEMBERS_PAGE_SIZE', 1000)
+    def test_query_count_does_not_grow_with_rows(self):
+        self.create_members(0, 10)
+        small_queries, small_rows = self.count_members_queries()
+
+        self.create_members(10, 990)
+        large_queries, large_rows = self.count_members_queries()
+
+        self.assertEqual((small_rows, large_rows), (10, 1000))
+        self.assertEqual(small_queries, large_queries)
+
+
+def statements(queries):
+    """Kinds of the statements run, without the savepoints of atomic blocks"""
+    kinds = [query['sql'].split()[0] for query in queries]
+    return [kind for kind in kinds if kind not in ('SAVEPOINT', 'RELEASE')]
+
+
+class ConnectionSoftDeleteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other = User.objects.create_user(username='other', password='testpass')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_reconnecting_restores_the_connection(self):
+        self.client.get(reverse('profile_management:connect', args=['other']))
+        self.client.get(reverse('profile_management:disconnect', args=['other']))
+        self.assertFalse(Connection.objects.exists())
+        self.assertTrue(Connection.all_objects.get().is_deleted)
+
+        self.client.get(reverse('profile_management:connect', args=['other']))
+        restored = Connection.objects.get()
+        self.assertIsNone(restored.deleted_at)
+        self.assertEqual(Connection.all_objects.count(), 1)
+
+    def test_connect_and_disconnect_are_single_statements(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            connections.connect(self.user.pk, self.other.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(connections.connect(self.user.pk, self.other.pk))
+        self.assertEqual(statements(queries), ['INSERT'])
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.assertTrue(connections.disconnect(self.user.pk, self.other.pk))
+        # The connection and both users' counters
+        self.assertEqual(statements(queries), ['UPDATE', 'UPDATE', 'UPDATE'])
+        self.assertFalse(connections.disconnect(self.user.pk, self.other.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(connections.connect(self.user.pk, self.other.pk))
+        self.assertEqual(graph.connections(self.user.pk), {self.other.pk})
+
+    def test_bulk_connect(self):
+        friends = [User.objects.create_user(username=f"friend{i}", password='testpass') for i in range(5)]
+        Connection.objects.create(user=self.user, connected_user=friends[0], is_deleted=True)
+        usernames = [friend.username for friend in friends] + ['testuser', 'nobody']
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.settings(CONNECTION_BULK_BATCH_SIZE=3), CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    reverse('profile_management:bulk_connect'), json.dumps({'usernames': usernames}),
+                    content_type='application/json'
+                )
+        self.assertEqual(response.json(), {'changed': 5, 'not_found': ['nobody']})
+        # One upsert per batch with users to connect
+        self.assertEqual(sum(query['sql'].startswith('INSERT') for query in queries), 2)
+        self.assertEqual(Connection.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(Connection.all_objects.count(), 5)
+        self.assertEqual(graph.connected_to(friends[4].pk), {self.user.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('profile_management:bulk_connect'),
+                json.dumps({'usernames': ['friend1', 'friend2'], 'action': 'disconnect'}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.json(), {'changed': 2, 'not_found': []})
+        self.assertEqual(graph.connections(self.user.pk), {friends[0].pk, friends[3].pk, friends[4].pk})
+        self.assertEqual(self.client.post(
+            reverse('profile_management:bulk_connect'), 'not json', content_type='application/json'
+        ).status_code, 400)
+
+
+class ConnectionGraphTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = {name: User.objects.create_user(username=name, password='testpass') for name in ('me', 'ann', 'ben', 'cat', 'dan', 'eve')}
+
+    def connect(self, user, other):
+        return Connection.objects.create(user=self.users[user], connected_user=self.users[other])
+
+    def ids(self, *names):
+        return {self.users[name].pk for name in names}
+
+    def test_mutuals_suggestions_and_degree(self):
+        for user, other in [('me', 'ann'), ('me', 'ben'), ('ann', 'cat'), ('ben', 'cat'), ('ann', 'dan'), ('cat', 'me'), ('eve', 'ann')]:
+            self.connect(user, other)
+        me = self.users['me'].pk
+
+        self.assertEqual(graph.connections(me), self.ids('ann', 'ben'))
+        self.assertEqual(graph.degree(me), {'connections': 2, 'connected_to': 1})
+        self.assertTrue(graph.is_connected(me, self.users['ann'].pk))
+        self.assertEqual(graph.mutual_connections(me, self.users['eve'].pk), self.ids('ann'))
+        self.assertEqual(graph.suggestions(me), [(self.users['cat'].pk, 2), (self.users['dan'].pk, 1)])
+
+        # Everything is answered from the cache
+        with self.assertNumQueries(0):
+            graph.suggestions(me)
+            graph.mutual_counts(me, [self.users['eve'].pk])
+
+    def test_connect_and_disconnect_update_cached_adjacency(self):
+        me = self.users['me'].pk
+        self.assertEqual(graph.connections(me), set())
+        self.assertEqual(graph.connected_to(self.users['ann'].pk), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            connection = self.connect('me', 'ann')
+        with self.assertNumQueries(0):
+            self.assertEqual(graph.connections(me), self.ids('ann'))
+            self.assertEqual(graph.connected_to(self.users['ann'].pk), self.ids('me'))
+        with self.captureOnCommitCallbacks(execute=True):
+            connection.soft_delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(graph.connections(me), set())
+            self.assertEqual(graph.connected_to(self.users['ann'].pk), set())
+
+    def test_ai_fast_paths(self):
+        for user, other in [('me', 'ann'), ('ann', 'cat'), ('eve', 'ann'), ('eve', 'cat')]:
+            self.connect(user, other)
+        me = self.users['me'].pk
+        self.assertEqual(route(me, 'Who should I connect with?'), 'People you may know: cat (1 mutual).')
+        self.assertEqual(route(me, 'Mutual connections with eve?'), 'You have 1 mutual connection with eve: ann.')
+        self.assertEqual(route(self.users['cat'].pk, 'How many people are connected to me?'), '2 people are connected to you.')
+
+
+class ProfileCounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = {name: User.objects.create_user(username=name, password='testpass') for name in ('me', 'ann', 'ben')}
+        for user in self.users.values():
+            UserProfile.objects.create(user=user)
+
+    def counts(self, name):
+        user_profile = UserProfile.objects.get(user=self.users[name])
+        return {field: getattr(user_profile, field) for field in counters.COUNTED}
+
+    def test_counters_follow_changes(self):
+        me, ann, ben = (self.users[name].pk for name in ('me', 'ann', 'ben'))
+        connections.connect(me, ann)
+        connections.bulk_connect(self.users['me'], ['ann', 'ben'])
+        connection = Connection.objects.create(user=self.users['ann'], connected_user=self.users['me'])
+        post = Post.objects.create(user=self.users['me'], content_type='text', content='hi')
+        Post.objects.create(user=self.users['me'], content_type='text', content='there')
+        SocialMediaAccount.objects.create(user=self.users['me'], platform='x', is_linked=True)
+        self.assertEqual(self.counts('me'), {'following_count': 2, 'followers_count': 1, 'platform_count': 1})
+        self.assertEqual(self.counts('ann')['followers_count'], 1)
+        self.assertEqual(UserProfile.objects.get(user=self.users['me']).post_count, 2)
+
+        connections.disconnect(me, ann)
+        connections.disconnect(me, ann)
+        connection.soft_delete()
+        post.soft_delete()
+        self.assertEqual(self.counts('me'), {'following_count': 1, 'followers_count': 0, 'platform_count': 1})
+        self.assertEqual(self.counts('ann'), {'following_count': 0, 'followers_count': 0, 'platform_count': 0})
+        self.assertEqual(UserProfile.objects.get(user=self.users['me']).post_count, 1)
+
+    def test_full_save_keeps_counters(self):
+        stale = UserProfile.objects.get(user=self.users['me'])
+        Connection.objects.create(user=self.users['ann'], connected_user=self.users['me'])
+        stale.bio = 'Updated'
+        stale.save()
+        self.assertEqual(self.counts('me')['followers_count'], 1)
+
+    def test_drifted_counter_stops_at_zero(self):
+        counters.adjust_counter([self.users['me'].pk], 'followers_count', -1)
+        self.assertEqual(self.counts('me')['followers_count'], 0)
+
+    def test_post_count_is_read_from_post_stats(self):
+        Post.objects.create(user=self.users['me'], content_type='text', content='hi')
+        with self.assertNumQueries(1):
+            user_profile = UserProfile.objects.select_related('user__post_stats').get(user=self.users['me'])
+            self.assertEqual(user_profile.post_count, 1)
+        self.assertEqual(UserProfile.objects.get(user=self.users['ann']).post_count, 0)
+
+    def test_new_profile_counts_existing_rows(self):
+        newcomer = User.objects.create_user(username='newcomer', password='testpass')
+        Connection.objects.create(user=self.users['ann'], connected_user=newcomer)
+        Post.objects.create(user=newcomer, content_type='text', content='hi')
+        user_profile = UserProfile.objects.create(user=newcomer)
+        user_profile.refresh_from_db()
+        self.assertEqual((user_profile.followers_count, user_profile.post_count), (1, 1))
+
+    def test_repair_command(self):
+        UserProfile.objects.filter(user=self.users['ann']).update(following_count=7, followers_count=3)
+        out = StringIO()
+        call_command('repair_profile_counters', '--dry-run', stdout=out)
+        self.assertIn("1 profile(s) with drifted counters would be repaired.", out.getvalue())
+        self.assertEqual(self.counts('ann')['following_count'], 7)
+        call_command('repair_profile_counters', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(self.counts('ann'), {'following_count': 0, 'followers_count': 0, 'platform_count': 0})
+
+
+class ProfileScoreTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='scored', password='testpass')
+        self.user_profile = UserProfile.objects.create(user=self.user, profilePicture='', qr_code='')
+
+    def test_saves_rescore_changed_components(self):
+        self.assertEqual(self.user_profile.profile_score, 0)
+        user_profile = UserProfile.objects.only('id', 'user_id', 'bio', 'profile_score').get(pk=self.user_profile.pk)
+        user_profile.bio = 'Hello'
+        with CaptureQueriesContext(connection) as queries:
+            user_profile.save(update_fields=['bio'])
+        # Signal handlers run their own queries, the save itself is one narrow UPDATE
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "userauth_userprofile" SET "bio"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"profile_score"', updates[0])
+        self.assertNotIn('"fullName"', updates[0])
+
+        user_profile = UserProfile.objects.get(pk=self.user_profile.pk)
+        self.assertEqual(user_profile.profile_score, 20)
+        user_profile.verified = True
+        user_profile.bio = ''
+        user_profile.fullName = 'Scored User'
+        user_profile.save()
+        self.assertEqual(UserProfile.objects.get(pk=self.user_profile.pk).profile_score, 40)
+
+    def test_rescore_command_and_leaderboard(self):
+        others = [User.objects.create_user(username=f"other{i}", password='testpass') for i in range(3)]
+        UserProfile.objects.bulk_create([
+            UserProfile(user=other, fullName='Name', bio='Bio' if i else '', profilePicture='', qr_code='')
+            for i, other in enumerate(others)
+        ])
+        out = StringIO()
+        call_command('rescore_profiles', '--batch-size', '2', stdout=out)
+        self.assertIn("Updated the score of 3 profile(s).", out.getvalue())
+        self.assertEqual(
+            [(user_profile.user.username, user_profile.profile_score) for user_profile in UserProfile.objects.leaderboard(3)],
+            [('other1', 40), ('other2', 40), ('other0', 20)]
+        )
+
+        self.client.login(username='scored', password='testpass')
+        response = self.client.get(reverse('profile_management:leaderboard'))
+        self.assertEqual([result['username'] for result in response.json()['results']][:3], ['other1', 'other2', 'other0'])
+
+
+class HomeFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = {name: User.objects.create_user(username=name, password='testpass') for name in ('me', 'ann', 'ben', 'cat')}
+        for user in self.users.values():
+            UserProfile.objects.create(user=user)
+        for other in ('ann', 'ben'):
+            Connection.objects.create(user=self.users['me'], connected_user=self.users[other])
+        self.me = self.users['me'].pk
+
+    def post(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(user=self.users[name], content_type='text', content=content)
+
+    def test_new_posts_are_pushed_into_cached_feeds(self):
+        old = self.post('ann', 'old')
+        self.assertEqual(feed.read_feed(self.me)[0], [old])
+        new = self.post('ben', 'new')
+        self.post('cat', 'not connected')
+        with self.assertNumQueries(1):
+            # Only the posts themselves are fetched, the feed and graph are cached
+            posts, next_cursor = feed.read_feed(self.me)
+        self.assertEqual(posts, [new, old])
+        self.assertIsNone(next_cursor)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new.soft_delete()
+        self.assertEqual(feed.read_feed(self.me)[0], [old])
+
+    def test_pagination_and_connection_changes(self):
+        posts = [self.post('ann' if i % 2 else 'ben', f"post {i}") for i in range(5)]
+        page, next_cursor = feed.read_feed(self.me, page_size=2)
+        self.assertEqual(page, posts[:-3:-1])
+        page, next_cursor = feed.read_feed(self.me, cursor=next_cursor, page_size=2)
+        self.assertEqual(page, posts[2:0:-1])
+        page, next_cursor = feed.read_feed(self.me, cursor=next_cursor, page_size=2)
+        self.assertEqual(page, posts[:1])
+        self.assertIsNone(next_cursor)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Connection.objects.get(user=self.users['me'], connected_user=self.users['ben']).soft_delete()
+        self.assertEqual(feed.read_feed(self.me)[0], [posts[3], posts[1]])
+
+    @override_settings(FEED_FANOUT_LIMIT=1, FEED_MAX_LENGTH=2)
+    def test_heavy_posters_are_read_at_request_time(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            connections.connect(self.users['cat'].pk, self.users['ann'].pk)
+        first = self.post('ben', 'first')
+        self.assertEqual(feed.read_feed(self.me)[0], [first])
+        heavy = self.post('ann', 'heavy')
+        self.assertIn(self.users['ann'].pk, feed.heavy_posters())
+        self.assertEqual(feed.load_feed(self.me), [(feed._timestamp(first.created_at), first.pk)])
+
+        later = [self.post('ben', f"later {i}") for i in range(2)]
+        page, next_cursor = feed.read_feed(self.me, page_size=2)
+        self.assertEqual(page, later[::-1])
+        # Past the end of the full materialized feed posts are read from the database
+        page, next_cursor = feed.read_feed(self.me, cursor=next_cursor, page_size=2)
+        self.assertEqual(page, [heavy, first])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_heavy_posters_leave_when_followers_drop(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            connections.connect(self.users['cat'].pk, self.users['ann'].pk)
+        heavy = self.post('ann', 'heavy')
+        self.assertEqual(feed.load_feed(self.me), [])
+        self.assertEqual(feed.read_feed(self.me)[0], [heavy])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            connections.disconnect(self.users['cat'].pk, self.users['ann'].pk)
+        self.assertNotIn(self.users['ann'].pk, feed.heavy_posters())
+        # The feeds of ann's followers were rebuilt with the posts read at request time
+        self.assertEqual(feed.load_feed(self.me), [(feed._timestamp(heavy.created_at), heavy.pk)])
+        pushed = self.post('ann', 'pushed')
+        self.assertEqual(feed.load_feed(self.me)[0], (feed._timestamp(pushed.created_at), pushed.pk))
+
+    def test_feed_view(self):
+        post = self.post('ann', 'hello')
+        self.client.login(username='me', password='testpass')
+        response = self.client.get(reverse('profile_management:feed'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([(item['id'], item['username']) for item in data['posts']], [(post.pk, 'ann')])
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(self.client.get(reverse('profile_management:feed'), {'cursor': 'bad'}).status_code, 400)
+
+
+class AIEngineTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    @patch('profile_management.ai_engine.create_sql_agent')
+    @patch('profile_management.ai_engine.ChatOpenAI')
+    @patch('profile_management.ai_engine.SandboxedSQLDatabase.from_uri')
+    def test_components_built_once_per_process(self, mock_from_uri, mock_llm, mock_create_agent):
+        mock_create_agent.return_value.invoke.return_value = {'output': 'Answer'}
+
+        with patch('profile_management.views.ai_engine', AIEngine()):
+            for question in ('Summarize my posts', 'How can I grow my audience?', 'Improve my bio'):
+                response = self.client.post(reverse('profile_management:ai'), {'data': question})
+                self.assertEqual(response.json(), {'message': 'Answer'})
+
+        mock_from_uri.assert_called_once()
+        mock_llm.assert_called_once()
+        mock_create_agent.assert_called_once()
+        self.assertEqual(mock_create_agent.return_value.invoke.call_count, 3)
+
+    @patch('profile_management.ai_engine.SandboxedSQLDatabase.from_uri')
+    def test_database_restricted_to_profile_tables(self, mock_from_uri):
+        AIEngine().build_database()
+        include_tables = mock_from_uri.call_args.kwargs['include_tables']
+        self.assertIn('userauth_post', include_tables)
+        self.assertNotIn('auth_user', include_tables)
+
+
+class AICacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ai_cache.semantic_index.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def ask(self, question):
+        response = self.client.post(reverse('profile_management:ai'), {'data': question})
+        return response.json()['message']
+
+    @patch('profile_management.views.ai_engine')
+    def test_repeated_question_skips_agent(self, mock_engine):
+        mock_engine.run.return_value = 'Your posts are mostly photos.'
+        self.assertEqual(self.ask('Summarize my posts!'), 'Your posts are mostly photos.')
+        self.assertEqual(self.ask('  summarize my posts '), 'Your posts are mostly photos.')
+        mock_engine.run.assert_called_once()
+
+    @patch('profile_management.views.ai_engine')
+    def test_data_change_invalidates_answer(self, mock_engine):
+        mock_engine.run.side_effect = ['You have no posts yet.', 'Your only post is about a new post.']
+        self.ask('Summarize my posts')
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.user, content='New post')
+        self.assertEqual(self.ask('Summarize my posts'), 'Your only post is about a new post.')
+
+    @override_settings(AI_CACHE_SIMILARITY_THRESHOLD=0.9)
+    @patch('profile_management.ai_cache.ai_engine.embed')
+    @patch('profile_management.views.ai_engine')
+    def test_similar_question_reuses_answer(self, mock_engine, mock_embed):
+        mock_engine.run.return_value = 'Post more videos.'
+        mock_embed.side_effect = [[1.0, 0.0], [0.99, 0.05], [0.0, 1.0]]
+        self.ask('How can I grow my audience?')
+        self.assertEqual(self.ask('Ideas to grow my audience'), 'Post more videos.')
+        self.ask('Improve my bio')
+        self.assertEqual(mock_engine.run.call_count, 2)
+
+    def test_semantic_index_evicts_least_recently_used(self):
+        index = ai_cache.SemanticIndex(max_entries=2)
+        index.add(1, 'v', 'first', [1.0, 0.0], 'a', 60)
+        index.add(1, 'v', 'second', [0.0, 1.0], 'b', 60)
+        index.search(1, 'v', [1.0, 0.0], 0.9)
+        index.add(1, 'v', 'third', [1.0, 1.0], 'c', 60)
+        self.assertEqual(index.search(1, 'v', [1.0, 0.0], 0.9), 'a')
+        self.assertIsNone(index.search(1, 'v', [0.0, 1.0], 0.9))
+        self.assertIsNone(index.search(1, 'other', [1.0, 0.0], 0.9))
+
+
+class AIStreamTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        self.async_client.force_login(self.user)
+
+    async def read_events(self, response):
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split('\n\n'):
+            event, data = block.split('\n')
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    @patch('profile_management.views.ai_engine')
+    async def test_streams_steps_and_tokens(self, mock_engine):
+        async def astream(query, user_id):
+            yield 'step', {'tool': 'sql_db_query', 'input': 'SELECT 1'}
+            yield 'token', 'You have '
+            yield 'token', '3 posts.'
+        mock_engine.astream = astream
+
+        response = await self.async_client.post(reverse('profile_management:ai_stream'), {'data': 'How many posts?'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(await self.read_events(response), [
+            ('step', {'tool': 'sql_db_query', 'input': 'SELECT 1'}),
+            ('token', {'text': 'You have '}),
+            ('token', {'text': '3 posts.'}),
+            ('answer', {'message': 'You have 3 posts.'}),
+        ])
+
+        # The streamed answer is cached like a regular one
+        response = await self.async_client.post(reverse('profile_management:ai_stream'), {'data': 'How many posts?'})
+        self.assertEqual(await self.read_events(response), [('answer', {'message': 'You have 3 posts.'})])
+
+    async def test_requires_login(self):
+        await self.async_client.alogout()
+        response = await self.async_client.post(reverse('profile_management:ai_stream'), {'data': 'Hi'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_chat_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profile_management:ai_chat'))
+        self.assertContains(response, reverse('profile_management:ai_stream'))
+
+
+class AIContextTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user, fullName='Test User')
+        self.friend = User.objects.create_user(username='friend', password='testpass')
+        Connection.objects.create(user=self.user, connected_user=self.friend)
+        SocialMediaAccount.objects.create(user=self.user, platform='instagram', is_linked=True)
+        Post.objects.create(user=self.user, content_type='text', content='Hello world')
+
+    def test_cached_context_is_one_cache_read(self):
+        context = get_ai_context(self.user.id)
+        self.assertEqual(context['activity']['posts']['total'], 1)
+        self.assertEqual(context['connections']['top_connections'], ['friend'])
+        self.assertEqual(context['platforms']['platforms'], {'instagram': 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_ai_context(self.user.id), context)
+
+    def test_change_rebuilds_only_affected_section(self):
+        get_ai_context(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.user, content_type='image', content='Second post')
+        # Only the activity section is rebuilt: aggregate, counts by type and recent posts
+        with self.assertNumQueries(3):
+            context = get_ai_context(self.user.id)
+        self.assertEqual(context['activity']['posts']['total'], 2)
+        self.assertEqual(context['activity']['recent_posts'][0]['summary'], 'Second post')
+
+    def test_rendered_context_respects_budget(self):
+        Post.objects.bulk_create([Post(user=self.user, content_type='text', content='x' * 500) for _ in range(10)])
+        rendered = render_ai_context(get_ai_context(self.user.id), budget=50)
+        self.assertLessEqual(len(rendered), 200)
+        self.assertTrue(rendered.startswith('User: testuser (Test User)'))
+
+
+class AIRouterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        UserProfile.objects.create(user=self.user)
+        for username in ('alice', 'bob'):
+            Connection.objects.create(user=self.user, connected_user=User.objects.create_user(username=username))
+        Post.objects.create(user=self.user, content_type='image', content='Photo')
+        Post.objects.create(user=self.user, content_type='text', content='Hello')
+        SocialMediaAccount.objects.create(user=self.user, platform='instagram', is_linked=True)
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_common_questions(self):
+        self.assertEqual(route(self.user.id, 'How many posts did I make?'), 'You made 2 posts.')
+        self.assertEqual(route(self.user.id, 'How many image posts have I made this week?'), 'You made 1 image post this week.')
+        self.assertEqual(route(self.user.id, 'What kind of posts have I made?'), 'Your posts by type: image 1, text 1.')
+        self.assertEqual(route(self.user.id, 'How many connections do I have?'), 'You have 2 connections.')
+        self.assertEqual(route(self.user.id, 'Who am I connected to?'), 'You are connected to bob, alice.')
+        self.assertEqual(route(self.user.id, 'Which platforms are linked?'), 'Your linked platforms are instagram.')
+        self.assertTrue(
+            route(self.user.id, 'When was my instagram data last synced?').startswith('Your instagram data was last synced on')
+        )
+
+    def test_large_periods_and_unusual_usernames(self):
+        self.assertEqual(route(self.user.id, 'How many posts did I make in the last 9999 days?'), 'You made 2 posts in the last 9999 days.')
+        self.assertIsNone(route(self.user.id, 'How many posts did I make in the last 99999999999 days?'))
+        for username in ('j.doe', 'jane@example.com', 'a+b', 'x-y', 'bob.'):
+            other = User.objects.create_user(username=username)
+            Connection.objects.create(user=other, connected_user=User.objects.get(username='alice'))
+            with self.subTest(username=username):
+                self.assertEqual(
+                    route(self.user.id, f"Mutual connections with {username}?"),
+                    f"You have 1 mutual connection with {username}: alice."
+                )
+
+    @patch('profile_management.views.ai_engine')
+    def test_open_questions_fall_back_to_agent(self, mock_engine):
+        mock_engine.run.return_value = 'Agent answer'
+        response = self.client.post(reverse('profile_management:ai'), {'data': 'How many posts did I make?'})
+        self.assertEqual(response.json(), {'message': 'You made 2 posts.'})
+        response = self.client.post(reverse('profile_management:ai'), {'data': 'Write me a bio'})
+        self.assertEqual(response.json(), {'message': 'Agent answer'})
+        mock_engine.run.assert_called_once()
+
+        stats = router_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hits:post_count']), (1, 1, 1))
+
+
+class AISQLSandboxTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other = User.objects.create_user(username='other', password='testpass')
+        Post.objects.create(user=self.user, content_type='text', content='Mine')
+        Post.objects.create(user=self.other, content_type='text', content='Theirs')
+        SocialMediaAccount.objects.create(user=self.user, platform='instagram', token='secret')
+        # Share the test database connection with SQLAlchemy
+        connection.ensure_connection()
+        engine = create_engine('sqlite://', creator=lambda: connection.connection, poolclass=StaticPool)
+        self.db = SandboxedSQLDatabase(engine, include_tables=['userauth_post', 'userauth_socialmediaaccount'])
+
+    def run_query(self, query):
+        with ai_user_scope(self.user.id):
+            return self.db.run(query)
+
+    def test_rows_scoped_to_user(self):
+        self.assertEqual(self.run_query("SELECT content FROM userauth_post"), "[('Mine',)]")
+        self.assertEqual(self.run_query("SELECT COUNT(*) FROM userauth_post p JOIN userauth_post q ON 1 = 1"), "[(1,)]")
+
+    def test_hidden_columns(self):
+        with ai_user_scope(self.user.id):
+            self.assertTrue(self.db.run_no_throw("SELECT token FROM userauth_socialmediaaccount").startswith('Error:'))
+
+    @override_settings(AI_SQL_MAX_ROWS=2)
+    def test_limit_injected(self):
+        Post.objects.bulk_create([Post(user=self.user, content_type='text', content=str(i)) for i in range(5)])
+        with ai_user_scope(self.user.id):
+            self.assertEqual(len(self.db._execute("SELECT * FROM userauth_post")), 2)
+
+    def test_only_single_select(self):
+        for query in ("DELETE FROM userauth_post", "SELECT 1; DROP TABLE userauth_post", "UPDATE userauth_post SET content = ''"):
+            with self.subTest(query=query), self.assertRaises(QueryRejected):
+                self.run_query(query)
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_requires_user(self):
+        with self.assertRaises(QueryRejected):
+            self.db.run("SELECT content FROM userauth_post")
+
+    def test_schema_qualified_tables_rejected(self):
+        for query in (
+            "SELECT content FROM main.userauth_post",
+            'SELECT content FROM "main"."userauth_post"',
+            "SELECT token FROM main.userauth_socialmediaaccount",
+            "SELECT content FROM public.userauth_post",
+            "SELECT p.content FROM userauth_post p JOIN main.userauth_post q ON 1 = 1",
+            "SELECT content FROM userauth_post, main.userauth_post",
+            "SELECT (SELECT content FROM main.userauth_post LIMIT 1) FROM userauth_post",
+        ):
+            with self.subTest(query=query), self.assertRaises(QueryRejected):
+                self.run_query(query)
+
+    def test_unscoped_tables_rejected(self):
+        for query in (
+            "SELECT username, password FROM auth_user",
+            "SELECT * FROM django_session",
+            "SELECT name FROM sqlite_master",
+            "WITH users AS (SELECT password FROM auth_user) SELECT * FROM users",
+            "SELECT * FROM userauth_post WHERE user_id IN (SELECT id FROM auth_user)",
+            "SELECT * FROM (SELECT password FROM auth_user) AS leaked",
+            "SELECT * FROM pragma_table_info('auth_user')",
+            "SELECT query_to_xml('SELECT password FROM auth_user', true, true, '')",
+        ):
+            with self.subTest(query=query), self.assertRaises(QueryRejected):
+                self.run_query(query)
+
+    def test_own_ctes_and_subqueries_allowed(self):
+        self.assertEqual(
+            self.run_query("WITH mine AS (SELECT content FROM userauth_post) SELECT content FROM mine"), "[('Mine',)]"
+        )
+        self.assertEqual(self.run_query("SELECT content FROM (SELECT content FROM userauth_post) AS p"), "[('Mine',)]")
+
+
+class SocialSyncTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncuser', password='testpass')
+        self.account = SocialMediaAccount.objects.create(user=self.user, platform='instagram', token='mock_token')
+
+    def test_unsynced_account_is_stale(self):
+        # Accounts without data are due for a sync until a fetch succeeds
+        self.assertIn(self.account, sync.stale_accounts())
+
+    @patch('profile_management.sync.fetch_accounts')
+    def test_sync_account_stores_data(self, mock_fetch):
+        item = {'id': '1', 'timestamp': '2024-01-01T00:00:00+0000'}
+        mock_fetch.return_value = {self.account.pk: {'data': [item], 'checkpoint': item['timestamp']}}
+
+        self.assertTrue(sync.sync_account(self.account))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.data, {'data': [item]})
+        self.assertEqual(self.account.sync_checkpoint, item['timestamp'])
+        self.assertNotIn(self.account, sync.stale_accounts())
+
+    @patch('profile_management.sync.fetch_accounts')
+    def test_sync_account_upserts_items(self, mock_fetch):
+        item = {'id': '1', 'media_type': 'VIDEO', 'caption': 'First', 'timestamp': '2024-01-01T00:00:00+0000'}
+        mock_fetch.return_value = {self.account.pk: {'data': [item], 'checkpoint': item['timestamp']}}
+        sync.sync_account(self.account)
+
+        item['caption'] = 'Edited'
+        sync.sync_account(self.account)
+
+        stored = SocialMediaItem.objects.get(user=self.user)
+        self.assertEqual(stored.media_type, 'video')
+        self.assertEqual(stored.caption, 'Edited')
+
+    @patch('profile_management.sync.fetch_accounts')
+    def test_sync_account_merges_new_items(self, mock_fetch):
+        self.account.data = {'data': [{'id': '1'}]}
+        self.account.save()
+        mock_fetch.return_value = {self.account.pk: {'data': [{'id': '2'}], 'checkpoint': None}}
+
+        sync.sync_account(self.account)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.data, {'data': [{'id': '2'}, {'id': '1'}]})
+
+    @patch('profile_management.sync.fetch_accounts')
+    def test_sync_account_appends_backfill(self, mock_fetch):
+        self.account.data = {'data': [{'id': '2'}]}
+        self.account.save()
+        resume = {'url': 'https://graph.instagram.com/me/media?after=page3', 'until': None}
+        backfill = [{'id': '1', 'timestamp': '2024-01-01T00:00:00+0000'}]
+        mock_fetch.return_value = {self.account.pk: {'data': [{'id': '3'}], 'backfill': backfill, 'checkpoint': None, 'resume': resume}}
+
+        sync.sync_account(self.account)
+        self.account.refresh_from_db()
+        self.assertEqual([item['id'] for item in self.account.data['data']], ['3', '2', '1'])
+        self.assertEqual(self.account.sync_resume, resume)
+        self.assertTrue(SocialMediaItem.objects.filter(account=self.account, external_id='1').exists())
+
+    @patch('profile_management.sync.fetch_accounts')
+    def test_relinked_account_is_refreshed(self, mock_fetch):
+        self.account.data = {'data': []}
+        self.account.save()
+        self.assertNotIn(self.account, sync.stale_accounts())
+        mock_fetch.return_value = {self.account.pk: {'data': [{'id': '1'}], 'checkpoint': None}}
+
+        # Refreshes asked for by the relink ignore the staleness the save just reset
+        with patch.object(sync.refresh_queue, 'put', side_effect=sync.refresh_account):
+            self.assertEqual(sync.enqueue(self.account), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.data, {'data': [{'id': '1'}]})
+        self.assertEqual(sync.sync_user(self.user.pk), 0)
+
+    @patch('profile_management.sync.fetch_accounts')
+    def test_failed_sync_keeps_cached_data(self, mock_fetch):
+        mock_fetch.return_value = {self.account.pk: None}
+
+        self.assertFalse(sync.sync_account(self.account))
+        self.account.refresh_from_db()
+        self.assertIsNone(self.account.data)
+
+
+class PlatformClientTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='clientuser', password='testpass')
+        self.instagram = SocialMediaAccount.objects.create(user=self.user, platform='instagram', token='ig_token')
+        self.facebook = SocialMediaAccount.objects.create(user=self.user, platform='facebook', token='fb_token')
+
+    def fetch(self, handler, accounts):
+        async def fetch():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+                return await platforms.fetch_accounts_async(http, accounts)
+        return asyncio.run(fetch())
+
+    def test_fetch_accounts_concurrently(self):
+        # Each platform gets its own response, keyed by account
+        def handler(request):
+            item = {'id': request.url.host, 'timestamp': '2024-01-01T00:00:00+0000', 'created_time': '2024-01-01T00:00:00+0000'}
+            return httpx.Response(200, json={'data': [item]})
+
+        results = self.fetch(handler, [self.instagram, self.facebook])
+        self.assertEqual(results[self.instagram.pk]['data'][0]['id'], 'graph.instagram.com')
+        self.assertEqual(results[self.facebook.pk]['data'][0]['id'], 'graph.facebook.com')
+
+    def test_fetch_follows_cursors_until_checkpoint(self):
+        self.instagram.sync_checkpoint = '2024-01-01T00:00:00+0000'
+        pages = {
+            None: {
+                'data': [{'id': '3', 'timestamp': '2024-01-03T00:00:00+0000'}],
+                'paging': {'next': 'https://graph.instagram.com/me/media?after=page2'},
+            },
+            'page2': {
+                # Pages shift when a post is published mid-walk, repeating items
+                'data': [
+                    {'id': '3', 'timestamp': '2024-01-03T00:00:00+0000'},
+                    {'id': '2', 'timestamp': '2024-01-02T00:00:00+0000'},
+                    {'id': '1', 'timestamp': '2024-01-01T00:00:00+0000'},
+                ],
+                'paging': {'next': 'https://graph.instagram.com/me/media?after=page3'},
+            },
+            'page3': {
+                'data': [
+                    {'id': '1b', 'timestamp': '2024-01-01T00:00:00+0000'},
+                    {'id': '0', 'timestamp': '2023-12-31T00:00:00+0000'},
+                ],
+                'paging': {'next': 'https://graph.instagram.com/me/media?after=page4'},
+            },
+        }
+
+        def handler(request):
+            return httpx.Response(200, json=pages[request.url.params.get('after')])
+
+        result = self.fetch(handler, [self.instagram])[self.instagram.pk]
+        # Items at the checkpoint's own timestamp are fetched again, each item once
+        self.assertEqual([item['id'] for item in result['data']], ['3', '2', '1', '1b'])
+        self.assertEqual(result['checkpoint'], '2024-01-03T00:00:00+0000')
+
+    @override_settings(SOCIAL_SYNC_MAX_PAGES=2)
+    def test_first_sync_backfills_across_runs(self):
+        # Five pages of two items, newest first, with a third page budget per walk
+        timestamps = [f'2024-01-{day:02d}T00:00:00+0000' for day in range(10, 0, -1)]
+        pages = {
+            str(page): {
+                'data': [{'id': timestamp[:10], 'timestamp': timestamp} for timestamp in timestamps[page * 2:page * 2 + 2]],
+                'paging': {'next': f'https://graph.instagram.com/me/media?after={page + 1}&access_token=ig_token'} if page < 4 else {},
+            }
+            for page in range(5)
+        }
+        pages[None] = pages['0']
+
+        def handler(request):
+            self.assertEqual(request.url.params['access_token'], 'ig_token')
+            return httpx.Response(200, json=pages[request.url.params.get('after')])
+
+        ids = [timestamp[:10] for timestamp in timestamps]
+        runs = []
+        for _ in range(3):
+            result = self.fetch(handler, [self.instagram])[self.instagram.pk]
+            runs.append(([item['id'] for item in result['data']], [item['id'] for item in result['backfill']]))
+            self.instagram.sync_checkpoint, self.instagram.sync_resume = result['checkpoint'], result['resume']
+            # The high-water mark moves to the newest item on the first run already
+            self.assertEqual(result['checkpoint'], timestamps[0])
+            if result['resume']:
+                self.assertNotIn('access_token', result['resume']['url'])
+
+        # Later runs only re-read the newest item and continue the backfill until it is finished
+        self.assertEqual(runs, [(ids[:4], []), (ids[:1], ids[4:8]), (ids[:1], ids[8:])])
+        self.assertIsNone(self.instagram.sync_resume)
+
+    @override_settings(SOCIAL_PLATFORM_TIMEOUTS={'instagram': 0.01})
+    def test_slow_platform_times_out(self):
+        async def handler(request):
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={})
+
+        results = self.fetch(handler, [self.instagram])
+        self.assertIsNone(results[self.instagram.pk])
+
+
 
 
 
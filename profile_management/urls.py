@@ -5,9 +5,16 @@ app_name = 'profile_management'  # Define a namespace for this app
 
 urlpatterns = [
     path('ai/', views.ai, name='ai'),
+    path('ai/stream/', views.ai_stream, name='ai_stream'),
+    path('ai/chat/', views.ai_chat, name='ai_chat'),
+    path("feed/", views.feed, name="feed"),
+    path("leaderboard/", views.leaderboard, name="leaderboard"),
     path("members/", views.members, name="members"),
+    path("members/search/", views.members_search, name="members_search"),
     path("update_profile/", views.update_profile, name="update_profile"),
+    path("connect/bulk/", views.bulk_connect, name="bulk_connect"),
     path("connect/<str:username>/", views.connect, name="connect"),
     path("disconnect/<str:username>/", views.disconnect, name="disconnect"),
+    path('<str:username>/posts/', views.profile_posts, name='profile_posts'),
     path('<str:username>/', views.profile, name='profile'),
 ]
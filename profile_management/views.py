@@ -1,144 +1,186 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.db.models import Count, Q
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token, constant_time_compare
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.conf import settings
+from django.urls import reverse
 from django.utils import timezone
 
 from userauth.forms import UserForm, MyUserCreationForm, UserProfileForm
 from userauth.models import (
-    User, UserProfile, TermsAndConditions, SocialMediaAccount, Post, Connection
+    User, UserProfile, TermsAndConditions, SocialMediaAccount, SocialMediaItem, Post, Connection
 )
-import requests
+from .ai_cache import CachedQuestion, cached_ai_answer
+from .ai_context import get_ai_context, render_ai_context
+from .ai_engine import ai_engine
+from .ai_router import route
+from . import connections, graph
+from .cache import cached_profile_data, get_profile_cache_timeout, profile_cache_version
+from .feed import read_feed
+from .pagination import paginate_posts
+from .search import search_profiles
 from SLID.secrets import (
     INSTAGRAM_CLIENT_ID, INSTAGRAM_CLIENT_SECRET,
     FACEBOOK_CLIENT_ID, FACEBOOK_CLIENT_SECRET
 )
-from langchain_community.agent_toolkits.sql import create_sql_agent
-from langchain_openai import ChatOpenAI
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 import json
-import os
 
 load_dotenv()
 
-# Social Media API Functions
-def fetch_social_media_data(account):
-    """Generic function to fetch data from social media platforms"""
-    platform_handlers = {
-        'instagram': fetch_instagram_data,
-        'facebook': fetch_facebook_data
-    }
-    
-    handler = platform_handlers.get(account.platform)
-    if handler:
-        return handler(account.token)
-    return None
-
-def fetch_instagram_data(token):
-    """Fetch Instagram data using the platform's API"""
-    api_url = 'https://graph.instagram.com/me/media'
-    params = {
-        'fields': 'id,caption,media_type,media_url,thumbnail_url,username,timestamp',
-        'access_token': token
-    }
-    response = requests.get(api_url, params=params)
-    return response.json() if response.status_code == 200 else None
-
-def fetch_facebook_data(token):
-    """Fetch Facebook data using the platform's API"""
-    api_url = 'https://graph.facebook.com/v12.0/me'
-    params = {
-        'fields': 'name,email,birthday,photos,posts,likes,events,hometown,friends',
-        'access_token': token
-    }
-    response = requests.get(api_url, params=params)
-    return response.json() if response.status_code == 200 else None
+# Number of synced platform items shown on a profile page
+PROFILE_SOCIAL_ITEMS = 12
+PROFILE_FEED_ITEMS = 4
+
+# Members listing, typeahead and leaderboard sizes
+MEMBERS_PAGE_SIZE = 24
+TYPEAHEAD_RESULTS = 10
+LEADERBOARD_SIZE = 10
 
 # Profile Views
+def get_profile_sections(profile):
+    """Cached, per-profile parts of the members page that do not depend on the viewer"""
+    def build_social():
+        return {
+            # Platform data is refreshed in the background by profile_management.sync
+            "social_accounts": list(SocialMediaAccount.objects.filter(
+                user=profile,
+                is_linked=True
+            ).defer('data')),
+            "instagram_items": list(SocialMediaItem.objects.filter(
+                user=profile,
+                platform='instagram'
+            ).order_by('-timestamp')[:PROFILE_SOCIAL_ITEMS]),
+        }
+
+    def build_connections():
+        return {
+            "connected_users": list(Connection.objects.filter(user=profile).select_related('connected_user')),
+        }
+
+    sections = {}
+    sections.update(cached_profile_data(profile.id, 'social', build_social))
+    sections.update(cached_profile_data(profile.id, 'connections', build_connections))
+    # Recent posts from connections come from the materialized feed, kept current on write
+    sections["recent_posts_from_connected_users"], _ = read_feed(profile.id, page_size=PROFILE_FEED_ITEMS)
+    return sections
+
+
+def get_cached_user_profile(user_id):
+    """UserProfile of a user from the profile cache, or None if the user has no profile"""
+    def build_profile():
+        # Cache misses for users without a profile are stored as False
+        return UserProfile.objects.select_related('user__post_stats').filter(user_id=user_id).first() or False
+
+    return cached_profile_data(user_id, 'profile', build_profile) or None
+
+
 @login_required
 def profile(request, username):
     """Display user profile with social media integrations"""
     profile = get_object_or_404(User, username=username)
-    logged_user_profile = UserProfile.objects.get(user=request.user)
+    logged_user_profile = get_cached_user_profile(request.user.id)
     is_own_profile = request.user.is_authenticated and request.user.username == profile.username
 
-    is_connected = Connection.objects.filter(
-        user=request.user,
-        connected_user=profile,
-        is_deleted=False
-    ).exists()
+    is_connected = graph.is_connected(request.user.id, profile.id)
+    mutual_connections = 0 if is_own_profile else len(graph.mutual_connections(request.user.id, profile.id))
+
+    user_profile = get_cached_user_profile(profile.id)
+    if user_profile is not None:
+        sections = get_profile_sections(profile)
+    else:
+        sections = {
+            "social_accounts": [],
+            "instagram_items": [],
+            "connected_users": [],
+            "recent_posts_from_connected_users": [],
+        }
 
-    try:
-        user_profile = UserProfile.objects.get(user=profile)
-        social_accounts = SocialMediaAccount.objects.filter(
-            user=profile,
-            is_linked=True
-        )
-        
-        # Update social media data
-        for account in social_accounts:
-            platform_data = fetch_social_media_data(account)
-            if platform_data:
-                account.data = platform_data
-                account.last_sync = timezone.now()
-                account.save()
-
-    except ObjectDoesNotExist:
-        user_profile = None
-        social_accounts = []
-
-    posts = Post.objects.filter(user=profile).order_by('-created_at')
-    connected_users = Connection.objects.filter(user=profile)
-    recent_posts_from_connected_users = Post.objects.filter(
-        user__in=connected_users.values_list('connected_user', flat=True)
-    ).order_by('-created_at')[:4]
+    # First page of the post feed, further pages are loaded from profile_posts
+    posts, next_cursor = cached_profile_data(
+        profile.id, 'posts', lambda: paginate_posts(Post.objects.filter(user=profile))
+    )
 
     context = {
         "user_profile": user_profile,
         "logged_user_profile": logged_user_profile,
         "is_own_profile": is_own_profile,
         "is_connected": is_connected,
+        "mutual_connections": mutual_connections,
+        "connection_count": user_profile.following_count if user_profile is not None else len(graph.connections(profile.id)),
         "posts": posts,
-        "social_accounts": social_accounts,
-        "recent_posts_from_connected_users": recent_posts_from_connected_users,
-        "connected_users": connected_users,
+        "next_cursor": next_cursor,
+        "profile_cache_version": profile_cache_version(profile.id),
+        "profile_cache_timeout": get_profile_cache_timeout(),
+        "profile_cache_alias": getattr(settings, 'PROFILE_CACHE_ALIAS', 'default'),
+        **sections,
     }
     return render(request, "userauth/members-page.html", context)
 
-# AI Integration Functions
-def get_user_profile(user):
-    """Fetch comprehensive user profile data"""
+@login_required
+def profile_posts(request, username):
+    """Return the next page of a user's posts for infinite scroll, as JSON or an HTML partial"""
+    profile = get_object_or_404(User, username=username)
     try:
-        user_account = User.objects.get(username=user)
-        user_profile = UserProfile.objects.get(user=user)
-        social_accounts = SocialMediaAccount.objects.filter(user=user, is_linked=True)
-        
-        return {
-            'profile': {
-                'username': user_account.username,
-                'email': user_account.email,
-                'date_joined': user_account.date_joined,
-                'last_login': user_account.last_login,
-                'full_name': user_profile.fullName,
-                'bio': user_profile.bio,
-                'profile_picture': user_profile.profilePicture.url if user_profile.profilePicture else None,
-                'qr_code': user_profile.qr_code.url if user_profile.qr_code else None,
-                'user_code': user_profile.user_code,
-                'verified': user_profile.verified,
-                'created_at': user_profile.created_at,
-            },
-            'social_media': {
-                account.platform: account.data
-                for account in social_accounts
+        posts, next_cursor = paginate_posts(
+            Post.objects.filter(user=profile),
+            cursor=request.GET.get('cursor')
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'posts': [
+                {
+                    'id': post.id,
+                    'content_type': post.content_type,
+                    'content': post.content,
+                    'media_url': post.media_file.url if post.media_file else None,
+                    'created_at': post.created_at,
+                }
+                for post in posts
+            ],
+            'next_cursor': next_cursor,
+        })
+
+    context = {
+        "posts": posts,
+        "is_own_profile": request.user == profile,
+    }
+    response = render(request, "userauth/members-page-posts.html", context)
+    response['X-Next-Cursor'] = next_cursor or ''
+    return response
+
+@login_required
+def feed(request):
+    """Posts of the users the logged in user is connected to, newest first, as JSON"""
+    try:
+        posts, next_cursor = read_feed(request.user.id, cursor=request.GET.get('cursor'))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    return JsonResponse({
+        'posts': [
+            {
+                'id': post.id,
+                'username': post.user.username,
+                'content_type': post.content_type,
+                'content': post.content,
+                'media_url': post.media_file.url if post.media_file else None,
+                'created_at': post.created_at,
             }
-        }
-    except (UserProfile.DoesNotExist, User.DoesNotExist):
-        return None
+            for post in posts
+        ],
+        'next_cursor': next_cursor,
+    })
 
 # AI and Database Integration
 def construct_schema_prompt():
@@ -154,6 +196,27 @@ def construct_schema_prompt():
     """
 
 
+def build_ai_query(context, user_query):
+    """Include the user's precomputed context in the query"""
+    return f"""
+        Context:
+        {render_ai_context(context)}
+        Query: {user_query}
+        Schema: {construct_schema_prompt()}
+        """
+
+
+def sse_event(event, data):
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@login_required
+def ai_chat(request):
+    """Render the AI assistant chat page"""
+    return render(request, 'profile_management/ai_chat.html')
+
+
 @login_required
 def ai(request):
     """Handle AI-powered user data analysis and queries"""
@@ -165,99 +228,174 @@ def ai(request):
         return JsonResponse({'error': 'No query provided'}, status=400)
 
     try:
-        # Get user context including social media data
-        user_data = get_user_profile(request.user)
-        if not user_data:
+        # Common questions are answered directly from the database
+        answer = route(request.user.id, user_query)
+        if answer is not None:
+            return JsonResponse({'message': answer})
+
+        # Get the user's cached context including social media data
+        context = get_ai_context(request.user.id)
+        if not context['profile']:
             return JsonResponse({'error': 'User profile not found'}, status=404)
 
-        # Initialize AI components
-        db = SQLDatabase.from_uri(os.getenv('DATABASE_URL'))
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.7,
-            api_key=os.getenv('OPENAI_API_KEY')
-        )
-
-        # Create and execute AI agent
-        agent = create_sql_agent(llm, db=db, verbose=True)
-
-        # Include social media context in the query
-        enhanced_query = f"""
-        Context: User {user_data['profile']['username']} with {len(user_data['social_media'])} connected platforms.
-        Query: {user_query}
-        Schema: {construct_schema_prompt()}
-        """
+        enhanced_query = build_ai_query(context, user_query)
 
-        answer = agent.run(enhanced_query)
+        # Repeated questions are answered from the cache until the user's data changes
+        answer = cached_ai_answer(request.user.id, user_query, lambda: ai_engine.run(enhanced_query, request.user.id))
         return JsonResponse({'message': answer})
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+async def ai_stream(request):
+    """
+    Streaming variant of ai: agent steps and answer tokens are sent as server-sent
+    events while the agent runs, followed by a final answer event. Served through
+    SLID/asgi.py the agent run no longer holds a worker thread.
+    """
+    # login_required does not support async views before Django 5.1
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    user_query = request.POST.get('data')
+    if not user_query:
+        return JsonResponse({'error': 'No query provided'}, status=400)
+
+    answer = await sync_to_async(route)(user.id, user_query)
+    if answer is None:
+        cached = await sync_to_async(CachedQuestion)(user.id, user_query)
+        answer = await sync_to_async(cached.get)()
+
+    context = await sync_to_async(get_ai_context)(user.id)
+    if not context['profile']:
+        return JsonResponse({'error': 'User profile not found'}, status=404)
+
+    async def events():
+        if answer is not None:
+            yield sse_event('answer', {'message': answer})
+            return
+
+        tokens = []
+        try:
+            async for kind, data in ai_engine.astream(build_ai_query(context, user_query), user.id):
+                if kind == 'token':
+                    tokens.append(data)
+                    yield sse_event('token', {'text': data})
+                else:
+                    yield sse_event('step', data)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+
+        message = ''.join(tokens)
+        await sync_to_async(cached.set)(message)
+        yield sse_event('answer', {'message': message})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def members(request):
     """Display and search member profiles"""
-    search_query = request.POST.get('search_query', '')
+    search_query = request.POST.get('search_query') or request.GET.get('q', '')
 
-    # Base queryset excluding the current user
-    users_profile = UserProfile.objects.exclude(user=request.user)
+    # Base queryset excluding the current user, joined with User for the listing
+    users_profile = UserProfile.objects.exclude(user=request.user).select_related('user__post_stats').defer(
+        'search_text', 'search_vector'
+    )
 
     if search_query:
-        users_profile = users_profile.filter(
-            Q(user__username__icontains=search_query) |
-            Q(fullName__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
-            Q(user_code__icontains=search_query)
-        )
+        users_profile = search_profiles(users_profile, search_query)
+    else:
+        users_profile = users_profile.order_by('-created_at', '-id')
+
+    page_obj = Paginator(users_profile, MEMBERS_PAGE_SIZE).get_page(request.GET.get('page'))
 
-    # Get current user's profile and connections
-    logged_user_profile = UserProfile.objects.get(user=request.user)
-    connected_users = Connection.objects.filter(
-        user=request.user,
-        is_deleted=False
-    ).values_list('connected_user', flat=True)
+    # Get current user's profile, and connection state and mutual connections from the graph
+    logged_user_profile = UserProfile.objects.select_related('user').get(user=request.user)
+    listed = [user_profile.user_id for user_profile in page_obj]
+    connected_users = graph.connections(request.user.id) & set(listed)
+    mutual_counts = graph.mutual_counts(request.user.id, listed)
+    for user_profile in page_obj:
+        user_profile.mutual_count = mutual_counts[user_profile.user_id]
 
     context = {
-        "users_profile": users_profile,
+        "users_profile": page_obj,
+        "page_obj": page_obj,
+        "search_query": search_query,
         "logged_user_profile": logged_user_profile,
         "connected_users": connected_users,
     }
     return render(request, "userauth/members2.html", context)
 
+
+@login_required
+def leaderboard(request):
+    """Top profiles by profile score, as JSON"""
+    return JsonResponse({'results': [
+        {
+            'username': user_profile.user.username,
+            'full_name': user_profile.fullName,
+            'profile_score': user_profile.profile_score,
+            'url': reverse('profile_management:profile', args=[user_profile.user.username]),
+        }
+        for user_profile in UserProfile.objects.leaderboard(LEADERBOARD_SIZE)
+    ]})
+
+
+@login_required
+def members_search(request):
+    """Typeahead endpoint returning the best matching members as JSON"""
+    search_query = request.GET.get('q', '').strip()
+    if not search_query:
+        return JsonResponse({'results': []})
+
+    users_profile = search_profiles(
+        UserProfile.objects.exclude(user=request.user).select_related('user'),
+        search_query
+    )[:TYPEAHEAD_RESULTS]
+
+    return JsonResponse({'results': [
+        {
+            'username': user_profile.user.username,
+            'full_name': user_profile.fullName,
+            'profile_picture': user_profile.profilePicture.url if user_profile.profilePicture else None,
+            'url': reverse('profile_management:profile', args=[user_profile.user.username]),
+        }
+        for user_profile in users_profile
+    ]})
+
 @login_required
 def update_profile(request):
     """Handle user profile updates"""
-    user_profile, created = UserProfile.objects.get_or_create(user=request.user)
+    user_profile, created = UserProfile.all_objects.get_or_create(user=request.user)
     
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=user_profile)
         if form.is_valid():
             form.save()
+            # Editing a soft deleted profile brings it back, rather than saving changes nobody sees
+            user_profile.restore()
             return redirect('profile_management:profile', username=request.user.username)
     
     return redirect('profile_management:profile', username=request.user.username)
 
 @login_required
 def connect(request, username):
-    """Create a connection between users"""
+    """Create a connection between users, or revive a removed one"""
     try:
         connected_user = User.objects.get(username=username)
-
-        # Check if connection already exists
-        connection, created = Connection.objects.get_or_create(
-            user=request.user,
-            connected_user=connected_user,
-            defaults={'is_deleted': False}
-        )
-
-        if not created and connection.is_deleted:
-            # Reactivate soft-deleted connection
-            connection.is_deleted = False
-            connection.save()
-        elif not created:
+        if not connections.connect(request.user.id, connected_user.id):
             messages.info(request, "Connection already exists")
-
     except User.DoesNotExist:
         messages.error(request, "User not found")
 
@@ -267,16 +405,33 @@ def connect(request, username):
 @login_required
 def disconnect(request, username):
     """Soft delete a connection between users"""
-    try:
-        connected_user = User.objects.get(username=username)
-        connection = Connection.objects.get(
-            user=request.user,
-            connected_user=connected_user
-        )
-        connection.is_deleted = True
-        connection.save()
+    connected_user = User.objects.filter(username=username).first()
+    if connected_user is not None and connections.disconnect(request.user.id, connected_user.id):
         messages.success(request, "Connection removed")
-    except (User.DoesNotExist, Connection.DoesNotExist):
+    else:
         messages.error(request, "Connection not found")
 
-    return redirect('profile_management:profile', username=username)
\ No newline at end of file
+    return redirect('profile_management:profile', username=username)
+
+
+@login_required
+def bulk_connect(request):
+    """
+    Connect to, or with "action": "disconnect" disconnect from, many users at
+    once, e.g. a platform friend list. Takes a JSON body with a list of usernames.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        data = json.loads(request.body)
+        usernames = data['usernames']
+        action = data.get('action', 'connect')
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'Expected a JSON object with a list of usernames'}, status=400)
+    if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+        return JsonResponse({'error': 'Expected a JSON object with a list of usernames'}, status=400)
+    if action not in ('connect', 'disconnect'):
+        return JsonResponse({'error': 'Unknown action'}, status=400)
+
+    changed, not_found = connections.bulk_connect(request.user, usernames, connected=action == 'connect')
+    return JsonResponse({'changed': changed, 'not_found': not_found})
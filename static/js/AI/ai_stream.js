@@ -0,0 +1,53 @@
+/*
+ * Client for profile_management:ai_stream.
+ * POSTs a question and dispatches the server-sent events of the response
+ * (step, token, answer, error) to the matching handler as they arrive.
+ */
+function streamAI(url, formData, handlers) {
+    function dispatch(block) {
+        var event = 'message';
+        var data = '';
+        block.split('\n').forEach(function(line){
+            if (line.indexOf('event:') === 0) {
+                event = line.slice(6).trim();
+            } else if (line.indexOf('data:') === 0) {
+                data += line.slice(5).trim();
+            }
+        });
+        if (data && handlers[event]) {
+            handlers[event](JSON.parse(data));
+        }
+    }
+
+    return fetch(url, {method: 'POST', body: formData, credentials: 'same-origin'})
+        .then(function(response){
+            if (!response.ok || !response.body) {
+                throw new Error('AI request failed with status ' + response.status);
+            }
+            var reader = response.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = '';
+
+            function read() {
+                return reader.read().then(function(result){
+                    if (result.done) {
+                        if (buffer.trim()) {
+                            dispatch(buffer);
+                        }
+                        return;
+                    }
+                    buffer += decoder.decode(result.value, {stream: true});
+                    var blocks = buffer.split('\n\n');
+                    buffer = blocks.pop();
+                    blocks.forEach(dispatch);
+                    return read();
+                });
+            }
+            return read();
+        })
+        .catch(function(error){
+            if (handlers.error) {
+                handlers.error({error: error.message});
+            }
+        });
+}
@@ -0,0 +1,91 @@
+/*
+ * Resumable chunked uploads for content_management:upload_start.
+ * The upload URL is remembered per file in localStorage, so a failed or
+ * interrupted upload continues from the server's offset instead of restarting,
+ * even after a page reload.
+ */
+function chunkedUpload(startUrl, file, fields, options) {
+    options = options || {};
+    var csrfToken = fields.csrfmiddlewaretoken;
+    var storageKey = 'upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+    var retries = 0;
+    var maxRetries = options.maxRetries || 8;
+
+    function request(method, url, body, headers) {
+        headers = headers || {};
+        headers['X-CSRFToken'] = csrfToken;
+        return fetch(url, {method: method, body: body, headers: headers, credentials: 'same-origin'})
+            .then(function(response){
+                return response.json().catch(function(){ return {}; }).then(function(data){
+                    data.status = response.status;
+                    if (response.headers.get('Location')) {
+                        data.url = response.headers.get('Location');
+                    }
+                    return data;
+                });
+            });
+    }
+
+    function start() {
+        var url = localStorage.getItem(storageKey);
+        if (url) {
+            return request('GET', url).then(function(data){
+                if (data.status === 200) {
+                    data.url = url;
+                    return data;
+                }
+                localStorage.removeItem(storageKey);
+                return start();
+            });
+        }
+        var body = new FormData();
+        Object.keys(fields).forEach(function(name){ body.append(name, fields[name]); });
+        body.append('filename', file.name);
+        body.append('size', file.size);
+        return request('POST', startUrl, body).then(function(data){
+            if (data.status !== 201) {
+                throw new Error(data.error || 'Upload could not be started');
+            }
+            localStorage.setItem(storageKey, data.url);
+            return data;
+        });
+    }
+
+    function send(session, chunkSize) {
+        if (session.complete) {
+            localStorage.removeItem(storageKey);
+            return session;
+        }
+        if (options.progress) {
+            options.progress(session.offset / file.size);
+        }
+        var chunk = file.slice(session.offset, session.offset + chunkSize);
+        return request('PATCH', session.url, chunk, {'Upload-Offset': String(session.offset)})
+            .then(function(data){
+                if (data.status === 200 || data.status === 409) {
+                    // 409 carries the offset the server actually has
+                    retries = 0;
+                    data.url = session.url;
+                    return send(data, chunkSize);
+                }
+                throw new Error(data.error || 'Upload failed with status ' + data.status);
+            }, function(){
+                // Network error: wait, ask the server for its offset and resume
+                if (++retries > maxRetries) {
+                    throw new Error('Upload interrupted, please try again');
+                }
+                return new Promise(function(resolve){ setTimeout(resolve, Math.min(30000, 1000 * Math.pow(2, retries))); })
+                    .then(function(){ return request('GET', session.url); })
+                    .then(function(data){
+                        data.url = session.url;
+                        return send(data, chunkSize);
+                    }, function(){
+                        return send(session, chunkSize);
+                    });
+            });
+    }
+
+    return start().then(function(session){
+        return send(session, Math.min(session.chunk_size || options.chunkSize || 5 * 1024 * 1024, options.chunkSize || Infinity));
+    });
+}
@@ -1,11 +1,16 @@
 from django.contrib import admin
-from .models import UserProfile, TermsAndConditions, SocialMediaAccount, Connection, Post, AuditLog
+from .models import UserProfile, TermsAndConditions, SocialMediaAccount, SocialMediaItem, Connection, Post, PostStats, StoredBlob, AuditLog
 
 
-class UserProfileAdmin(admin.ModelAdmin):
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """Admin listing soft deleted rows too, they can be filtered by is_deleted"""
+    def get_queryset(self, request):
+        return self.model.all_objects.all()
+
+class UserProfileAdmin(SoftDeleteAdmin):
     list_display = ['user', 'fullName', 'bio', 'profilePicture', 'qr_code', "user_code", "verified", "created_at"]
     search_fields = ['user__username', 'fullName', 'bio', 'profilePicture', 'qr_code', "user_code", "verified", "created_at"]
-    list_filter = ["verified", "created_at"]
+    list_filter = ["verified", "created_at", "is_deleted"]
     list_per_page = 25
 
 class TermsAndConditionsAdmin(admin.ModelAdmin):
@@ -21,19 +26,37 @@ class SocialMediaAccountAdmin(admin.ModelAdmin):
     list_per_page = 25
 
 
-class ConnectionAdmin(admin.ModelAdmin):
+class SocialMediaItemAdmin(admin.ModelAdmin):
+    list_display = ['user', 'platform', 'external_id', 'media_type', 'timestamp']
+    search_fields = ['user__username', 'platform', 'external_id', 'caption']
+    list_filter = ['platform', 'media_type', 'timestamp']
+    list_per_page = 25
+
+
+class ConnectionAdmin(SoftDeleteAdmin):
     list_display = ['user', "connected_user", "created_at", "is_deleted"]
     search_fields = ['user__username', "connected_user__username", "created_at"]
     list_filter = ["created_at", "is_deleted"]
     list_per_page = 25
     
     
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(SoftDeleteAdmin):
     list_display = ['user', "content_type", "created_at", "is_deleted"]
     search_fields = ['user__username', "content_type", "created_at"]
     list_filter = ["content_type", "created_at", "is_deleted"]
     list_per_page = 25
 
+class PostStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_posts', 'text_posts', 'image_posts', 'video_posts']
+    search_fields = ['user__username']
+    list_per_page = 25
+
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'ref_count', 'updated_at']
+    search_fields = ['name']
+    list_filter = ['updated_at']
+    list_per_page = 25
+
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['user', 'action', 'timestamp']
     search_fields = ['user__username', 'action', 'timestamp']
@@ -44,6 +67,9 @@ class AuditLogAdmin(admin.ModelAdmin):
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(TermsAndConditions, TermsAndConditionsAdmin)
 admin.site.register(SocialMediaAccount , SocialMediaAccountAdmin)
+admin.site.register(SocialMediaItem, SocialMediaItemAdmin)
 admin.site.register(Connection, ConnectionAdmin)
 admin.site.register(Post, PostAdmin)
+admin.site.register(PostStats, PostStatsAdmin)
+admin.site.register(StoredBlob, StoredBlobAdmin)
 admin.site.register(AuditLog, AuditLogAdmin)
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+Hard-delete soft deleted posts, connections and profiles older than
+SOFT_DELETE_RETENTION, in batches. Run it periodically, e.g. nightly from cron.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from userauth.models import Connection, Post, UserProfile
+
+SOFT_DELETE_MODELS = [Post, Connection, UserProfile]
+
+
+class Command(BaseCommand):
+    help = "Purge soft deleted rows older than SOFT_DELETE_RETENTION"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help="Retention in days, overriding SOFT_DELETE_RETENTION")
+        parser.add_argument('--batch-size', type=int, help="Rows per transaction, defaults to SOFT_DELETE_PURGE_BATCH_SIZE")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            retention = timedelta(days=options['days'])
+        else:
+            retention = timedelta(seconds=getattr(settings, 'SOFT_DELETE_RETENTION', 30 * 24 * 60 * 60))
+        batch_size = options['batch_size'] or getattr(settings, 'SOFT_DELETE_PURGE_BATCH_SIZE', 1000)
+        before = timezone.now() - retention
+
+        for model in SOFT_DELETE_MODELS:
+            purged = model.all_objects.purge(before, batch_size=batch_size)
+            self.stdout.write(f"Purged {purged} deleted {model._meta.verbose_name_plural}.")
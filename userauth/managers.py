@@ -0,0 +1,63 @@
+"""
+Soft deletion.
+Soft-deletable models keep deleted rows as tombstones flagged ``is_deleted``.
+Their default ``objects`` manager only returns live rows, so queries no longer
+need to filter on the flag themselves, and their hot indexes are partial
+indexes over live rows. ``all_objects`` includes the tombstones, which
+``manage.py purge_deleted`` hard-deletes in batches once they are old enough.
+"""
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+# Condition of the partial indexes covering live rows only
+LIVE = Q(is_deleted=False)
+DELETED = Q(is_deleted=True)
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+
+    def live(self):
+        return self.filter(LIVE)
+
+    def deleted(self):
+        return self.filter(DELETED)
+
+    def soft_delete(self):
+        """Flag the rows as deleted with one UPDATE. Like update(), it sends no signals."""
+        return self.filter(LIVE).update(is_deleted=True, deleted_at=timezone.now())
+
+    def purge(self, before, batch_size=1000):
+        """
+        Hard-delete tombstones deleted before the given time, batch_size rows per
+        transaction so the table is never locked for long. Tombstones without a
+        deletion time predate it and are purged too. Returns the number of rows purged.
+        """
+        tombstones = self.model.all_objects.filter(DELETED & (Q(deleted_at__lt=before) | Q(deleted_at__isnull=True)))
+        purged = 0
+        while True:
+            batch = list(tombstones.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return purged
+            with transaction.atomic():
+                # delete() so cascades and post_delete handlers still run
+                self.model.all_objects.filter(pk__in=batch).delete()
+            purged += len(batch)
+
+
+class LiveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Default manager of soft-deletable models, hiding deleted rows"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(LIVE)
+
+
+AllObjectsManager = models.Manager.from_queryset(SoftDeleteQuerySet)
+
+
+class ProfileQuerySet(SoftDeleteQuerySet):
+
+    def leaderboard(self, limit=10):
+        """Top profiles by score, read in the order of the partial profile score index"""
+        return self.filter(LIVE).order_by('-profile_score', 'id').select_related('user')[:limit]
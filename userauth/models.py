@@ -1,35 +1,133 @@
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
+import uuid
+
+from SLID.storage import content_storage
+from .managers import AllObjectsManager, LiveManager, ProfileQuerySet, DELETED, LIVE
+
+
+#Base model of rows kept as tombstones when deleted, objects only returns live rows
+class SoftDeleteModel(models.Model):
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True) #Soft deletion time, tombstones are purged after SOFT_DELETE_RETENTION
+
+    objects = LiveManager()
+    all_objects = AllObjectsManager()
+
+    class Meta:
+        abstract = True
+
+    def soft_delete(self):
+        if not self.is_deleted:
+            self.is_deleted = True
+            self.deleted_at = timezone.now()
+            self.save(update_fields=['is_deleted', 'deleted_at'])
+
+    def restore(self):
+        if self.is_deleted:
+            self.is_deleted = False
+            self.deleted_at = None
+            self.save(update_fields=['is_deleted', 'deleted_at'])
+
     
 #UserProfile model with profile score and deletion fields   
-class UserProfile(models.Model):
+class UserProfile(SoftDeleteModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     fullName = models.CharField(max_length=200, null=True, blank=True)
     bio = models.TextField(null=True, blank=True)
-    profilePicture = models.ImageField(null=True, default="default_pp.png", blank=True)
+    profilePicture = models.ImageField(null=True, default="default_pp.png", blank=True, storage=content_storage)
     qr_code = models.ImageField(null=True, default="qr_code.png", blank=True)
     user_code = models.CharField(max_length=16, null=True, blank=True, unique=True)
     verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    profile_score = models.IntegerField(default=0)
-    is_deleted = models.BooleanField(default=False)
+    profile_score = models.IntegerField(default=0) #Sum of SCORE_COMPONENTS, kept current on save
+    following_count = models.PositiveIntegerField(default=0) #Live connections the user made, see profile_management.counters
+    followers_count = models.PositiveIntegerField(default=0) #Live connections made to the user
+    platform_count = models.PositiveIntegerField(default=0) #Linked social media accounts of the user
+    search_text = models.TextField(blank=True, default='') #Username, name, email and user code for trigram search
+    search_vector = SearchVectorField(null=True, blank=True) #Weighted full-text vector of the same fields
 
     class Meta:
         indexes = [
             models.Index(fields=['user']), #Index for fast profile lookup
-            models.Index(fields=['profile_score']), #Index for quick engagment queries
+            models.Index(fields=['-profile_score', 'id'], condition=LIVE, name='userprofile_live_score'), #Index matching the leaderboard order
+            models.Index(fields=['-created_at', '-id'], condition=LIVE, name='userprofile_live_recent'), #Index matching the members listing
+            models.Index(fields=['deleted_at'], condition=DELETED, name='userprofile_tombstones'), #Index for purging deleted profiles
+            GinIndex(fields=['search_vector'], condition=LIVE, name='userprofile_search_vector'), #Index for full-text member search
+            GinIndex(fields=['search_text'], condition=LIVE, name='userprofile_search_trgm', opclasses=['gin_trgm_ops']), #Index for fuzzy and typeahead member search
         ]
     
-    def update_profile_score(self):
-        score=0
-        if self.fullName: score += 20
-        if self.bio: score += 20
-        if self.profilePicture: score += 20
-        if self.qr_code: score += 20
-        if self.verified: score += 20
+    objects = LiveManager.from_queryset(ProfileQuerySet)()
+    all_objects = AllObjectsManager.from_queryset(ProfileQuerySet)()
+
+    # Only ever moved by UPDATEs, see profile_management.counters
+    COUNTER_FIELDS = ('following_count', 'followers_count', 'platform_count')
+    # Points a filled in field adds to profile_score
+    SCORE_COMPONENTS = {'fullName': 20, 'bio': 20, 'profilePicture': 20, 'qr_code': 20, 'verified': 20}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which components were scored, so a save only rescores the fields that changed
+        instance._scored = {
+            field: bool(value) for field, value in zip(field_names, values) if field in cls.SCORE_COMPONENTS
+        }
+        return instance
+
+    @property
+    def post_count(self):
+        """Live posts of the user, read from their PostStats row (join user__post_stats when listing)"""
+        post_stats = getattr(self.user, 'post_stats', None)
+        return post_stats.total_posts if post_stats is not None else 0
+
+    def compute_profile_score(self):
+        return sum(points for field, points in self.SCORE_COMPONENTS.items() if getattr(self, field))
+
+    def _rescore(self, update_fields):
+        """Apply the score of changed components, returns True if profile_score changed"""
+        scored = getattr(self, '_scored', None)
+        if self._state.adding or scored is None:
+            score = self.compute_profile_score()
+        else:
+            fields = self.SCORE_COMPONENTS.keys() if update_fields is None else set(update_fields) & self.SCORE_COMPONENTS.keys()
+            score = self.profile_score
+            for field in fields:
+                if field not in self.__dict__:
+                    continue  # Deferred and never set, so unchanged
+                if field not in scored:
+                    # Set without its loaded value being known, fall back to a full recompute
+                    score = self.compute_profile_score()
+                    break
+                score += self.SCORE_COMPONENTS[field] * (bool(getattr(self, field)) - scored[field])
+        changed = score != self.profile_score
         self.profile_score = score
-        self.save()
+        return changed
+
+    def save(self, *args, **kwargs):
+        # A full save of a profile loaded earlier must not write back stale counters
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.COUNTER_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped and field.name not in skipped
+            ]
+        update_fields = kwargs.get('update_fields')
+        if self._rescore(update_fields) and update_fields is not None and 'profile_score' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'profile_score']
+        super().save(*args, **kwargs)
+        self._scored = {
+            field: bool(self.__dict__[field]) for field in self.SCORE_COMPONENTS if field in self.__dict__
+        }
+
+    def update_profile_score(self):
+        """Recompute the whole score, writing only profile_score and only when it changed"""
+        score = self.compute_profile_score()
+        if score != self.profile_score:
+            self.profile_score = score
+            self.save(update_fields=['profile_score'])
 
     def __str__(self):
         return self.user.username    
@@ -54,6 +152,8 @@ class SocialMediaAccount(models.Model):
     expires = models.DateTimeField(null=True)
     data = models.JSONField(null=True, blank=True) #Store Json data for each platform
     last_sync = models.DateTimeField(auto_now=True)
+    sync_checkpoint = models.CharField(max_length=40, null=True, blank=True) #Timestamp of the newest item already synced
+    sync_resume = models.JSONField(null=True, blank=True) #Next page URL and floor timestamp of a backfill cut short by SOCIAL_SYNC_MAX_PAGES
     is_linked = models.BooleanField(default=True)
 
     class Meta:
@@ -68,17 +168,48 @@ class SocialMediaAccount(models.Model):
         return f"{self.user.username} - {self.platform}"
 
 
+#Normalized content items fetched from a linked social media account
+class SocialMediaItem(models.Model):
+    MEDIA_TYPES = (
+        ('image', 'Image'),
+        ('video', 'Video'),
+        ('carousel', 'Carousel'),
+        ('text', 'Text'),
+    )
+
+    account = models.ForeignKey(SocialMediaAccount, on_delete=models.CASCADE, related_name='items')
+    user = models.ForeignKey(User, on_delete=models.CASCADE) #Denormalized from account for per-user lookups
+    platform = models.CharField(max_length=20, choices=SocialMediaAccount.PLATFORMS)
+    external_id = models.CharField(max_length=100) #Item id on the platform
+    media_type = models.CharField(max_length=20, choices=MEDIA_TYPES)
+    timestamp = models.DateTimeField()
+    caption = models.TextField(null=True, blank=True)
+    media_url = models.URLField(max_length=1000, null=True, blank=True)
+    thumbnail_url = models.URLField(max_length=1000, null=True, blank=True)
+
+    class Meta:
+        unique_together = ('account', 'external_id')
+        indexes = [
+            models.Index(fields=['user', '-timestamp']), #Index for a user's most recent items
+            models.Index(fields=['user', 'platform', '-timestamp']), #Index for most recent items per platform
+        ]
+
+    def __str__(self):
+        return f"{self.account} - {self.external_id}"
+
+
 #Connection with soft deletion    
-class Connection(models.Model):
+class Connection(SoftDeleteModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='connections')
     connected_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='connected_to')
     created_at = models.DateTimeField(auto_now_add=True)
-    is_deleted = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ('user', 'connected_user')  # Ensure only one connection between two users
         indexes = [
-            models.Index(fields=['user', 'connected_user']),
+            models.Index(fields=['user', '-created_at'], condition=LIVE, name='connection_live_user'), #Index for a user's connection list
+            models.Index(fields=['connected_user'], condition=LIVE, name='connection_live_connected'), #Index for who is connected to a user
+            models.Index(fields=['deleted_at'], condition=DELETED, name='connection_tombstones'), #Index for purging removed connections
         ]
 
     def __str__(self):
@@ -92,7 +223,7 @@ class TermsAndConditions(models.Model):
 
       
 #Post model with added metadata for engagement data soft deletion
-class Post(models.Model):
+class Post(SoftDeleteModel):
     CONTENT_TYPES = (
         ('image', 'Image'),
         ('video', 'Video'),
@@ -102,22 +233,83 @@ class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content_type = models.CharField(max_length=20, choices=CONTENT_TYPES)
     content = models.TextField(null=True)  # Stores text content, descriptions, or HTML for embedded media
-    media_file = models.FileField(upload_to='posts/media/', blank=True, null=True)  # Optional media
+    media_file = models.FileField(upload_to='posts/media/', storage=content_storage, blank=True, null=True)  # Optional media, stored by content digest
     metadata = models.JSONField(null=True, blank=True) #Analytics or engagement data
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    is_deleted = models.BooleanField(default=False)
 
     class Meta:
         indexes = [
-            models.Index(fields=['user', 'content_type']),
-            models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'content_type'], condition=LIVE, name='post_live_user_type'),
+            models.Index(fields=['created_at'], condition=LIVE, name='post_live_created'),
+            models.Index(fields=['user', '-created_at', '-id'], condition=LIVE, name='post_live_feed'), #Index matching the cursor paginated post feed
+            models.Index(fields=['deleted_at'], condition=DELETED, name='post_tombstones'), #Index for purging deleted posts
         ]
 
     def __str__(self):
         return f"Post by {self.user.username} at {self.created_at}"
 
 
+#Per-user post counters maintained on post create and delete
+class PostStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='post_stats')
+    total_posts = models.PositiveIntegerField(default=0)
+    text_posts = models.PositiveIntegerField(default=0)
+    image_posts = models.PositiveIntegerField(default=0)
+    video_posts = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.total_posts} posts"
+
+
+#Resumable chunked upload of a post's media file, the Post is created once every byte has arrived
+class UploadSession(models.Model):
+    CONTENT_TYPES = (
+        ('image', 'Image'),
+        ('video', 'Video'),
+    )
+    STATUSES = (
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    content_type = models.CharField(max_length=20, choices=CONTENT_TYPES)
+    filename = models.CharField(max_length=255)
+    caption = models.TextField(blank=True, default='')
+    size = models.BigIntegerField() #Total bytes announced by the client
+    received = models.BigIntegerField(default=0) #Bytes written so far, the offset the next chunk must start at
+    status = models.CharField(max_length=20, choices=STATUSES, default='uploading')
+    post = models.ForeignKey(Post, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at']), #Index for purging abandoned uploads
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size}) by {self.user.username}"
+
+
+#Reference count of a content-addressed media file shared by posts and profile pictures
+class StoredBlob(models.Model):
+    name = models.CharField(max_length=255, primary_key=True) #Storage name, derived from the content digest
+    size = models.BigIntegerField(null=True, blank=True) #Bytes on disk
+    ref_count = models.PositiveIntegerField(default=0) #Posts and profiles using the file
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at']), #Index for purging unreferenced blobs
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+
 #AuditLog to track user's actions
 class AuditLog(models.Model):
     ACTIONS = [
@@ -18,6 +18,7 @@ from django.middleware.csrf import constant_time_compare
 
 from userauth.forms import MyUserCreationForm, UserForm, UserProfileForm
 from userauth.models import User, UserProfile, TermsAndConditions, SocialMediaAccount, Connection, Post
+from profile_management.cache import bump_profile_version
 
 import os
 import qrcode
@@ -38,7 +39,8 @@ def generate_unique_number():
     """Generate a unique 16-digit code that does not already exist in UserProfile."""
     while True:
         random_number = ''.join([str(random.randint(0, 9)) for _ in range(16)])
-        if not UserProfile.objects.filter(user_code=random_number).exists():
+        # Soft deleted profiles keep their code and may be restored
+        if not UserProfile.all_objects.filter(user_code=random_number).exists():
             return random_number
 
 
@@ -131,6 +133,7 @@ def complete_profile(request):
     """Complete user profile by updating connected accounts and redirecting to profile."""
     if request.method == 'POST':
         SocialMediaAccount.objects.filter(user=request.user).update(is_linked=True)
+        bump_profile_version(request.user.id)  # update() bypasses the cache invalidation signals
         return redirect('profile_management:profile', username=request.user.username)
     
     context = {